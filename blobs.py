@@ -0,0 +1,289 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the BlobSummary class, which describes the blobs of every
+colour in a block.
+
+A summary of a block is made from the summaries of its four children by
+joining the blobs that meet where the children touch, so only the blobs that
+reach the sides of each child have to be looked at. Block and PersistentBoard
+keep a summary for every block in the tree, so after a move only the blocks
+the move changed and their ancestors are summarised again.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+
+
+# The spans of the blobs along one side of a block. Each span is the first unit
+# cell it covers, the unit cell after its last, and the number of its blob in
+# the BlobSummary.
+Side = Tuple[Tuple[int, int, int], ...]
+
+
+class BlobSummary:
+    """The blobs of every colour in a square block.
+
+    A blob that reaches a side of the block is open: it may grow when the block
+    is put next to other blocks. A blob that does not is closed, and only its
+    size is kept.
+
+    === Public Attributes ===
+    side:
+        The height and width of the block, in unit cells.
+    colours:
+        The PALETTE index of the colour of each open blob.
+    sizes:
+        The number of unit cells in each open blob.
+    sides:
+        The spans of the open blobs along the top, right, bottom and left
+        sides of the block. The top and bottom sides run from left to right,
+        and the left and right sides run from top to bottom.
+    closed:
+        The size of the largest closed blob of each colour that has one.
+
+    === Representation Invariants ===
+    - len(colours) == len(sizes)
+    - every open blob has at least one span in <sides>
+    - neighbouring spans on a side belong to different blobs
+    """
+    # === Private Attributes ===
+    # _largest:
+    #   The size of the largest blob of each colour in the block, or None if
+    #   it has not been worked out yet.
+    __slots__ = ('side', 'colours', 'sizes', 'sides', 'closed', '_largest')
+    side: int
+    colours: Tuple[int, ...]
+    sizes: Tuple[int, ...]
+    sides: Tuple[Side, Side, Side, Side]
+    closed: Dict[int, int]
+    _largest: Optional[Dict[int, int]]
+
+    def __init__(self, side: int, colours: Tuple[int, ...],
+                 sizes: Tuple[int, ...], sides: Tuple[Side, Side, Side, Side],
+                 closed: Dict[int, int]) -> None:
+        """Initialize this summary of a block <side> unit cells across.
+        """
+        self.side = side
+        self.colours = colours
+        self.sizes = sizes
+        self.sides = sides
+        self.closed = closed
+        self._largest = None
+
+    def largest(self, colour: int) -> int:
+        """Return the number of unit cells in the largest blob of colour index
+        <colour> in the block, or 0 if it has no unit cells of that colour.
+
+        >>> summary = leaf_summary(4, 2)
+        >>> summary.largest(2)
+        16
+        >>> summary.largest(0)
+        0
+        """
+        if self._largest is None:
+            self._largest = dict(self.closed)
+            for blob, size in enumerate(self.sizes):
+                if size > self._largest.get(self.colours[blob], 0):
+                    self._largest[self.colours[blob]] = size
+        return self._largest.get(colour, 0)
+
+    def turned(self, turns: int) -> BlobSummary:
+        """Return the summary of the block after it is turned clockwise <turns>
+        times.
+        """
+        turns %= 4
+        if turns == 0:
+            return self
+        top, right, bottom, left = self.sides
+        for _ in range(turns):
+            # The left side becomes the top, and the right side becomes the
+            # bottom, both running the other way.
+            top, right, bottom, left = \
+                _reverse(left, self.side), top, _reverse(right, self.side), \
+                bottom
+        return BlobSummary(self.side, self.colours, self.sizes,
+                           (top, right, bottom, left), self.closed)
+
+
+def leaf_summary(side: int, colour: int) -> BlobSummary:
+    """Return the summary of a block <side> unit cells across with no children
+    and the colour index <colour>.
+    """
+    span = ((0, side, 0),)
+    return BlobSummary(side, (colour,), (side * side,),
+                       (span, span, span, span), {})
+
+
+def parent_summary(children: List[BlobSummary]) -> BlobSummary:
+    """Return the summary of a block whose children, in the order of
+    Block.children, have the summaries <children>.
+    """
+    upper_right, upper_left, lower_left, lower_right = children
+    half = upper_right.side
+
+    # Number the open blobs of all four children one after another.
+    colours = []
+    sizes = []
+    firsts = []
+    for child in children:
+        firsts.append(len(colours))
+        colours.extend(child.colours)
+        sizes.extend(child.sizes)
+    blobs = _UnionFind(colours, sizes)
+    ur_top, ur_right, ur_bottom, ur_left = \
+        _renumber(upper_right.sides, firsts[0])
+    ul_top, ul_right, ul_bottom, ul_left = \
+        _renumber(upper_left.sides, firsts[1])
+    ll_top, ll_right, ll_bottom, ll_left = \
+        _renumber(lower_left.sides, firsts[2])
+    lr_top, lr_right, lr_bottom, lr_left = \
+        _renumber(lower_right.sides, firsts[3])
+
+    blobs.join(ul_right, ur_left)
+    blobs.join(ll_right, lr_left)
+    blobs.join(ul_bottom, ll_top)
+    blobs.join(ur_bottom, lr_top)
+
+    # Blobs on the outer sides stay open, and are numbered again from 0.
+    numbers = {}
+    sides = []
+    for first, second in ((ul_top, ur_top), (ur_right, lr_right),
+                          (ll_bottom, lr_bottom), (ul_left, ll_left)):
+        side = []
+        for start, end, blob in first + _shift(second, half):
+            top = blobs.find(blob)
+            if top not in numbers:
+                numbers[top] = len(numbers)
+            if side and side[-1][2] == numbers[top] and side[-1][1] == start:
+                side[-1] = (side[-1][0], end, numbers[top])
+            else:
+                side.append((start, end, numbers[top]))
+        sides.append(tuple(side))
+
+    closed = dict(upper_right.closed)
+    for child in children[1:]:
+        for colour, size in child.closed.items():
+            if size > closed.get(colour, 0):
+                closed[colour] = size
+    for blob in range(len(colours)):
+        if blobs.find(blob) == blob and blob not in numbers and \
+                sizes[blob] > closed.get(colours[blob], 0):
+            closed[colours[blob]] = sizes[blob]
+
+    open_blobs = sorted(numbers, key=numbers.get)
+    return BlobSummary(2 * half, tuple(colours[blob] for blob in open_blobs),
+                       tuple(sizes[blob] for blob in open_blobs),
+                       (sides[0], sides[1], sides[2], sides[3]), closed)
+
+
+def _renumber(sides: Tuple[Side, Side, Side, Side], first: int) \
+        -> List[Side]:
+    """Return <sides> with <first> added to the number of every blob.
+    """
+    return [tuple((start, end, blob + first) for start, end, blob in side)
+            for side in sides]
+
+
+def _shift(side: Side, offset: int) -> Side:
+    """Return <side> with <offset> added to the start and end of every span.
+    """
+    return tuple((start + offset, end + offset, blob)
+                 for start, end, blob in side)
+
+
+def _reverse(side: Side, length: int) -> Side:
+    """Return <side>, which is <length> unit cells long, running the other
+    way.
+    """
+    return tuple((length - end, length - start, blob)
+                 for start, end, blob in reversed(side))
+
+
+class _UnionFind:
+    """Blobs that are being joined together.
+    """
+    # === Private Attributes ===
+    # _colours:
+    #   The colour index of each blob.
+    # _sizes:
+    #   The number of unit cells in each blob, counting the blobs joined to
+    #   it if it is at the top of its tree.
+    # _parents:
+    #   The blob above each blob in its tree. A blob at the top of its tree is
+    #   its own parent.
+    _colours: List[int]
+    _sizes: List[int]
+    _parents: List[int]
+
+    def __init__(self, colours: List[int], sizes: List[int]) -> None:
+        """Initialize blobs with the given <colours> and <sizes>, none of them
+        joined. <sizes> is changed as blobs are joined.
+        """
+        self._colours = colours
+        self._sizes = sizes
+        self._parents = list(range(len(colours)))
+
+    def find(self, blob: int) -> int:
+        """Return the blob at the top of the tree containing <blob>.
+        """
+        parents = self._parents
+        while parents[blob] != blob:
+            parents[blob] = parents[parents[blob]]
+            blob = parents[blob]
+        return blob
+
+    def join(self, first: Side, second: Side) -> None:
+        """Join the blobs of the same colour on opposite sides of a line,
+        where their spans <first> and <second> overlap.
+        """
+        i = j = 0
+        while i < len(first) and j < len(second):
+            start1, end1, blob1 = first[i]
+            start2, end2, blob2 = second[j]
+            if start1 < end2 and start2 < end1 and \
+                    self._colours[blob1] == self._colours[blob2]:
+                self._union(blob1, blob2)
+            if end1 <= end2:
+                i += 1
+            else:
+                j += 1
+
+    def _union(self, blob1: int, blob2: int) -> None:
+        """Join the trees containing <blob1> and <blob2>.
+        """
+        top1, top2 = self.find(blob1), self.find(blob2)
+        if top1 == top2:
+            return
+        if self._sizes[top1] < self._sizes[top2]:
+            top1, top2 = top2, top1
+        self._parents[top2] = top1
+        self._sizes[top1] += self._sizes[top2]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__'
+        ],
+        'max-attributes': 15
+    })
@@ -22,11 +22,13 @@ Misha Schwartz, and Jaisie Sin
 This file contains the Block class, the main data structure used in the game.
 """
 from __future__ import annotations
-from typing import Optional, Tuple, List
+from typing import Any, Dict, Iterator, Optional, Tuple, List, Union
 import random
 import math
+import threading
 
-from settings import colour_name, COLOUR_LIST
+from blobs import BlobSummary, leaf_summary, parent_summary
+from settings import colour_name, colour_index, COLOUR_LIST, PALETTE
 
 
 def generate_board(max_depth: int, size: int) -> Block:
@@ -44,7 +46,74 @@ def generate_board(max_depth: int, size: int) -> Block:
     board = Block((0, 0), size, random.choice(COLOUR_LIST), 0, max_depth)
     board.smash()
 
-    return board
+    cells, levels = board.cell_buffers()
+    return board_from_buffers(max_depth, size, cells, levels)
+
+
+def board_from_buffers(max_depth: int, size: int, cells: bytes,
+                       levels: bytes) -> Block:
+    """Return a new board with a depth of <max_depth> and dimensions of <size>
+    by <size> that is a view of the unit cells <cells> and <levels>.
+
+    <cells> and <levels> are laid out like the cells and levels of a
+    BoardGrid, and must not change while the board is in use.
+    """
+    return _view((cells, levels, 2 ** max_depth, {}), 0, (0, 0), size, 0,
+                 max_depth)
+
+
+def majority_colour_index(colours: List[int]) -> Optional[int]:
+    """Return the majority colour of <colours>, or None if there is no majority
+    colour. Colours are given and returned as indices into PALETTE.
+
+    The majority colour is the colour in COLOUR_LIST that appears more often
+    than any other colour in COLOUR_LIST.
+
+    >>> majority_colour_index([0, 1, 1, 2])
+    1
+    >>> majority_colour_index([0, 0, 1, 1]) is None
+    True
+    """
+    counts = [0] * len(COLOUR_LIST)
+    for colour in colours:
+        if colour < len(counts):
+            counts[colour] += 1
+    majority = max(range(len(counts)), key=lambda c: counts[c])
+    if counts.count(counts[majority]) > 1:
+        return None
+    return majority
+
+
+def zobrist_leaf_hashes(level: int, colour: int) -> Tuple[int, int, int, int]:
+    """Return the Zobrist hashes of a leaf block at <level> whose colour is
+    PALETTE[colour], turned clockwise 0, 1, 2 and 3 times.
+    """
+    leaf = _ZOBRIST_LEAF[level][colour]
+    return leaf, leaf, leaf, leaf
+
+
+def zobrist_parent_hashes(level: int,
+                          child_hashes: List[Tuple[int, int, int, int]],
+                          child_turns: List[int]) \
+        -> Tuple[int, int, int, int]:
+    """Return the Zobrist hashes of a block at <level>, turned clockwise 0, 1,
+    2 and 3 times, from the hashes of its children.
+
+    child_hashes[i] are the hashes of the child at index i before
+    child_turns[i] clockwise turns are applied to it.
+    """
+    keys = _ZOBRIST_CHILD[level]
+    hashes = []
+    for turns in range(4):
+        # Turning a block moves each child to the previous index and turns
+        # the child too.
+        value = _ZOBRIST_PARENT[level]
+        for i in range(4):
+            k = (i + turns) % 4
+            value ^= (keys[i] * child_hashes[k][(turns + child_turns[k]) % 4]) \
+                & _MASK_64
+        hashes.append(value)
+    return hashes[0], hashes[1], hashes[2], hashes[3]
 
 
 class Block:
@@ -59,6 +128,21 @@ class Block:
     child's position. Indices 0, 1, 2, and 3 are the upper-right child,
     upper-left child, lower-left child, and lower-right child, respectively.
 
+    A Block can be a view of the buffers of a BoardGrid, which hold the
+    colour of every unit cell and the level of the leaf that covers it. Its
+    colour and children are then read from the buffers, its children only
+    when they are first needed, and a copy of it shares the buffers rather
+    than copying its descendants. A Block stops being a view when it or one
+    of its descendants changes, and from then on keeps its own colour and
+    children.
+
+    Only the outermost Block of a tree is sure of its position. Every other
+    Block works it out again, from the position of its parent and its index
+    among its parent's children, when it is read after a Block was moved.
+    This is why swapping or rotating a Block never has to visit its
+    descendants. A Block's size cannot change while it is in a tree, so every
+    Block stores its own.
+
     === Public Attributes ===
     position:
         The (x, y) coordinates of the upper left corner of this Block.
@@ -66,7 +150,10 @@ class Block:
         The height and width of this square Block.
     colour:
         If this block is not subdivided, <colour> stores its colour. Otherwise,
-        <colour> is None.
+        <colour> is None. The colour is stored as <colour_index> and only
+        turned into a colour value when it is read.
+    colour_index:
+        The index of <colour> in PALETTE, or None if <colour> is None.
     level:
         The level of this block within the overall block structure.
         The outermost block, corresponding to the root of the tree,
@@ -92,12 +179,115 @@ class Block:
         - its colour is not None.
     - level <= max_depth
     """
-    position: Tuple[int, int]
-    size: int
-    colour: Optional[Tuple[int, int, int]]
+    # === Private Attributes ===
+    # _position:
+    #   The position of this Block. It is only sure to be current if this
+    #   Block has no parent or <_placed> is still Block._epoch.
+    # _size:
+    #   The value of <size>.
+    # _parent:
+    #   The Block whose children include this Block, or None.
+    # _child_list:
+    #   The children of this Block, before <_turns> is applied, or None if
+    #   they are still to be read from <_grid>. <_children> reads them.
+    # _grid:
+    #   The buffers this Block is a view of, or None: the PALETTE index of
+    #   the colour of every unit cell and the level of the leaf that covers
+    #   it, column by column, and the number of unit cells in a column. Then
+    #   the <_hashes>, <_cells>, <_blobs> and <_moves> worked out by views of
+    #   the buffers, keyed by the <_cell> and level of each view, so that
+    #   another view of the same block, such as in a copy, starts out with
+    #   them.
+    # _cell:
+    #   The index in <_grid> of the upper left unit cell of this Block, with
+    #   <_turns> not applied.
+    # _turns:
+    #   The number of clockwise quarter turns that have been made to this
+    #   Block but not yet to its children. Turning a Block turns its children
+    #   list and every one of its descendants, so this is done only when the
+    #   children are next read.
+    # _checked:
+    #   The value of Block._epoch when the turns waiting in this Block's
+    #   ancestors were last passed down to it, or -1. While it is still the
+    #   value of Block._epoch, this need not be done again.
+    # _placed:
+    #   The value of Block._epoch when <_position> was last worked out, or -1.
+    # _colour_index:
+    #   The value of <colour_index>.
+    # _hashes:
+    #   The Zobrist hash of this Block with <_turns> not applied, and then
+    #   turned clockwise 0, 1, 2 and 3 times, or None if it is not known.
+    #   It is worked out when it is needed, and forgotten whenever this Block
+    #   or one of its descendants changes.
+    # _cells:
+    #   The colour indices of the unit cells of this Block, column by column,
+    #   or None if they are not known. Like <_hashes>, they are kept until
+    #   this Block or one of its descendants changes.
+    # _cells_turns:
+    #   The number of clockwise turns to make to <_cells> to get this Block
+    #   with <_turns> not applied. This lets turns pass down the tree without
+    #   rebuilding <_cells>.
+    # _blobs:
+    #   The BlobSummary of this Block with <_turns> not applied, or None if it
+    #   is not known. Like <_hashes>, it is kept until this Block or one of
+    #   its descendants changes.
+    # _changes:
+    #   The value of <changes>.
+    # _moves:
+    #   The legal moves in this Block and its descendants, or None if they
+    #   are not known: the number of Blocks with children, the number that
+    #   can be smashed, the number that can be combined, and the number of
+    #   leaves at max_depth of each PALETTE colour. Like <_hashes>, they are
+    #   kept until this Block or one of its descendants changes, but turns do
+    #   not change them.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #     0 <= _turns < 4
+    #     _turns == 0 if len(_children) == 0
+    #     _child_list is None only if _grid is not None
+    #     if _grid is not None, then this Block with <_turns> not applied is
+    #     the block at <_cell> in <_grid>
+    #     every child in _children has this Block as its _parent
+    #     every child in _children has round(_size / 2.0) as its _size
+    #     if _checked == Block._epoch, then no ancestor of this Block has
+    #     _turns other than 0
+    #     if _placed == Block._epoch, then _position is this Block's position
+    #     if _hashes is not None, then no child in _children has None for
+    #     its _hashes
+    #     if _cells is not None and _grid is None, then no child in _children
+    #     has None for its _cells
+    #     if _blobs is not None, then no child in _children has None for its
+    #     _blobs
+    #     if _moves is not None, then no child in _children has None for its
+    #     _moves
+    __slots__ = ('_position', '_size', '_colour_index', 'level', 'max_depth',
+                 '_parent', '_child_list', '_grid', '_cell', '_turns',
+                 '_checked', '_placed', '_hashes', '_cells', '_cells_turns',
+                 '_blobs', '_changes', '_moves')
     level: int
     max_depth: int
-    children: List[Block]
+    _position: Tuple[int, int]
+    _size: int
+    _colour_index: Optional[int]
+    _parent: Optional[Block]
+    _child_list: Optional[_ChildList]
+    _grid: Optional[Tuple[bytes, bytes, int,
+                          Dict[Tuple[int, int], Tuple[Any, ...]]]]
+    _cell: int
+    _turns: int
+    _checked: int
+    _placed: int
+    _hashes: Optional[Tuple[int, int, int, int]]
+    _cells: Optional[Tuple[Tuple[int, ...], ...]]
+    _cells_turns: int
+    _blobs: Optional[BlobSummary]
+    _changes: int
+    _moves: Optional[Tuple[int, int, int, Tuple[int, ...]]]
+
+    # Counts the turns made to Blocks, the swaps, and the times Blocks were
+    # given a parent, since each can move Blocks or leave turns waiting in
+    # their ancestors. It only grows, and is only changed by _advance_epoch.
+    _epoch: int = 0
 
     def __init__(self, position: Tuple[int, int], size: int,
                  colour: Optional[Tuple[int, int, int]], level: int,
@@ -111,12 +301,389 @@ class Block:
             - level >= 0
             - max_depth >= level
         """
-        self.position = position
-        self.size = size
+        self._position = position
+        self._size = size
+        self._parent = None
+        self._hashes = None
+        self._cells = None
+        self._cells_turns = 0
+        self._blobs = None
+        self._changes = 0
+        self._moves = None
+        self._grid = None
+        self._cell = 0
         self.colour = colour
         self.level = level
         self.max_depth = max_depth
-        self.children = []
+        self._child_list = _ChildList(self)
+        self._turns = 0
+        self._checked = -1
+        self._placed = -1
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """The (x, y) coordinates of the upper left corner of this Block.
+        """
+        parent = self._parent
+        if parent is None:
+            return self._position
+        epoch = Block._epoch
+        if self._placed == epoch:
+            return self._position
+
+        # Work out the parent's position first, so that any turns made to an
+        # ancestor have reached the parent before its children are read.
+        x, y = parent.position
+        siblings = parent.children
+        half = parent._child_size()
+        if self is siblings[0]:
+            x += half
+        elif self is siblings[2]:
+            y += half
+        elif self is siblings[3]:
+            x += half
+            y += half
+        self._position = (x, y)
+        self._placed = epoch
+        return self._position
+
+    @property
+    def size(self) -> int:
+        """The height and width of this square Block.
+        """
+        return self._size
+
+    @property
+    def children(self) -> List[Block]:
+        """The blocks into which this block is subdivided.
+        """
+        if self._checked != Block._epoch:
+            self._apply_ancestor_turns()
+        if self._turns:
+            self._apply_turns()
+        children = self._child_list
+        if children is None:
+            children = self._read_children()
+        return children
+
+    @children.setter
+    def children(self, children: List[Block]) -> None:
+        """Make <children> the children of this Block.
+        """
+        self._apply_ancestor_turns()
+        if self._child_list is not None:
+            for child in self._child_list:
+                child._detach()
+        self._turns = 0
+        self._child_list = _ChildList(self, children)
+        self._invalidate()
+
+    @property
+    def _children(self) -> _ChildList:
+        """The children of this Block, before <_turns> is applied, read from
+        <_grid> if they have not been read yet.
+        """
+        children = self._child_list
+        if children is None:
+            children = self._read_children()
+        return children
+
+    def _read_children(self) -> _ChildList:
+        """Make the children of this Block, as views of the blocks in <_grid>
+        that it is divided into, and return them.
+        """
+        half = 2 ** (self.max_depth - self.level - 1)
+        column = self._grid[2]
+        size = self._child_size()
+        children = _ChildList(self)
+        for dx, dy in _CHILD_OFFSETS:
+            # The position is worked out from this Block's when it is read.
+            child = _view(self._grid, self._cell + (dx * column + dy) * half,
+                          self._position, size, self.level + 1,
+                          self.max_depth)
+            child._parent = self
+            list.append(children, child)
+        self._child_list = children
+        return children
+
+    def _apply_turns(self) -> None:
+        """Reorder this Block's children to account for the turns made to this
+        Block, and pass those turns on to each child that has children.
+        """
+        turns = self._turns
+        children = self._children
+        list.__setitem__(children, slice(None),
+                         children[turns:] + children[:turns])
+        for child in children:
+            if child._child_list is None or child._child_list:
+                child._turns = (child._turns + turns) % 4
+        self._turns = 0
+        # This Block no longer matches <_grid> with no turns made.
+        self._grid = None
+        # This Block looks the same as before, so its hashes just move round,
+        # its unit cells are turned the next time they are read, and the sides
+        # of its blobs are turned.
+        if self._hashes is not None:
+            self._hashes = self._hashes[turns:] + self._hashes[:turns]
+        self._cells_turns = (self._cells_turns + turns) % 4
+        if self._blobs is not None:
+            self._blobs = self._blobs.turned(turns)
+
+    def _apply_ancestor_turns(self) -> None:
+        """Pass the turns made to this Block's ancestors down to this Block.
+
+        A Block can be read or changed through a reference kept from before an
+        ancestor was turned. What is read from it, and the children it is
+        given, must match the board as it is now seen, so turns still waiting
+        in an ancestor must reach this Block first.
+        """
+        epoch = Block._epoch
+        if self._checked == epoch:
+            return
+
+        # Only the ancestors up to the nearest one already checked can have
+        # turns waiting, and that is usually just the parent when a tree is
+        # walked from its root. Turns are rarely waiting, so look for one
+        # before doing any more.
+        block = self._parent
+        while block is not None and not block._turns and \
+                block._checked != epoch:
+            block = block._parent
+        if block is not None and block._turns:
+            ancestors = []
+            block = self._parent
+            while block is not None:
+                ancestors.append(block)
+                block = block._parent
+            for block in reversed(ancestors):
+                if block._turns:
+                    block._apply_turns()
+        self._checked = epoch
+
+    def _resize(self, size: int) -> None:
+        """Make <size> the size of this Block, and the size of its descendants
+        half that of their parent.
+        """
+        if self._size != size:
+            self._size = size
+            if self._child_list is not None:
+                half = self._child_size()
+                for child in self._child_list:
+                    child._resize(half)
+
+    def _detach(self) -> None:
+        """Remove this Block from its parent, keeping its current position and
+        size.
+        """
+        self._position = self.position
+        self._parent = None
+
+    @property
+    def changes(self) -> int:
+        """The number of times this Block or one of its descendants has changed
+        while this Block was the outermost Block of its tree.
+
+        Anything worked out from a whole board can be kept for as long as the
+        board's <changes> stays the same.
+        """
+        return self._changes
+
+    def _invalidate(self) -> None:
+        """Forget the hashes, unit cells, blobs and legal moves of this Block
+        and its ancestors, and stop them being views, and count a change of
+        the outermost Block, because this Block has changed.
+        """
+        block = self
+        while True:
+            if block._grid is not None:
+                if block._child_list is None:
+                    block._read_children()
+                block._grid = None
+            block._hashes = None
+            block._cells = None
+            block._blobs = None
+            block._moves = None
+            if block._parent is None:
+                block._changes += 1
+                return
+            block = block._parent
+
+    def unit_cells(self) -> Tuple[Tuple[int, ...], ...]:
+        """Return the unit cells of this Block as columns of PALETTE indices,
+        in the same layout as goal._flatten.
+
+        The unit cells of every Block in the tree are kept, so after a move
+        only the Blocks the move changed and their ancestors are flattened
+        again.
+        """
+        self._apply_ancestor_turns()
+        return turn_cells(self._raw_cells(), self._turns)
+
+    def _raw_cells(self) -> Tuple[Tuple[int, ...], ...]:
+        """Return the unit cells of this Block with <_turns> not applied.
+        """
+        if self._cells is None:
+            side = 2 ** (self.max_depth - self.level)
+            children = self._child_list
+            if children is not None and len(children) == 0:
+                self._cells = ((self._colour_index,) * side,) * side
+            elif self._grid is not None:
+                cells, _, column, _ = self._grid
+                starts = range(self._cell, self._cell + side * column, column)
+                self._cells = tuple(tuple(cells[start:start + side])
+                                    for start in starts)
+            else:
+                upper_right, upper_left, lower_left, lower_right = \
+                    [turn_cells(child._raw_cells(), child._turns)
+                     for child in self._children]
+                half = side // 2
+                self._cells = \
+                    tuple(upper_left[i] + lower_left[i] for i in range(half)) \
+                    + tuple(upper_right[i] + lower_right[i]
+                            for i in range(half))
+            self._cells_turns = 0
+            if self._grid is not None:
+                self._keep()
+        elif self._cells_turns:
+            self._cells = turn_cells(self._cells, self._cells_turns)
+            self._cells_turns = 0
+        return self._cells
+
+    def cell_buffers(self) -> Tuple[bytes, bytes]:
+        """Return the PALETTE index of the colour of every unit cell of this
+        Block, and the level of the leaf block that covers it, laid out like
+        the cells and levels of a BoardGrid.
+
+        If this Block is a view of buffers that hold just this Block, those
+        buffers are returned, and nothing is copied.
+        """
+        self._apply_ancestor_turns()
+        side = 2 ** (self.max_depth - self.level)
+        if self._grid is not None and self._turns == 0 and \
+                self._cell == 0 and self._grid[2] == side:
+            return self._grid[0], self._grid[1]
+        cells = bytearray(side * side)
+        levels = bytearray(side * side)
+        self._fill_buffers(cells, levels, side, 0)
+        return bytes(cells), bytes(levels)
+
+    def _fill_buffers(self, cells: bytearray, levels: bytearray, column: int,
+                      cell: int) -> None:
+        """Write the unit cells of this Block into <cells> and <levels>, which
+        have <column> unit cells in a column, with its upper left unit cell at
+        index <cell>.
+
+        The turns waiting in this Block's ancestors must have been passed
+        down to it.
+        """
+        side = 2 ** (self.max_depth - self.level)
+        if self._grid is not None and self._turns == 0:
+            # Copy the columns of the block this Block is a view of.
+            grid_cells, grid_levels, grid_column, _ = self._grid
+            for i in range(side):
+                start = self._cell + i * grid_column
+                target = cell + i * column
+                cells[target:target + side] = grid_cells[start:start + side]
+                levels[target:target + side] = \
+                    grid_levels[start:start + side]
+            return
+
+        children = self.children
+        if len(children) == 0:
+            colour = bytes((self._colour_index,)) * side
+            level = bytes((self.level,)) * side
+            for target in range(cell, cell + side * column, column):
+                cells[target:target + side] = colour
+                levels[target:target + side] = level
+        else:
+            half = side // 2
+            for child, (dx, dy) in zip(children, _CHILD_OFFSETS):
+                child._fill_buffers(cells, levels, column,
+                                    cell + (dx * column + dy) * half)
+
+    def blob_summary(self) -> BlobSummary:
+        """Return a summary of the blobs of every colour in this Block.
+
+        Like the unit cells, the summary of every Block in the tree is kept,
+        so after a move only the Blocks the move changed and their ancestors
+        are summarised again, each from the summaries of its children.
+        """
+        self._apply_ancestor_turns()
+        return self._turned_blobs()
+
+    def _turned_blobs(self) -> BlobSummary:
+        """Return the summary of the blobs in this Block, working out any
+        summaries that are not known, without passing down turns waiting in
+        an ancestor.
+        """
+        if self._blobs is None:
+            children = self._children
+            if len(children) == 0:
+                self._blobs = leaf_summary(2 ** (self.max_depth - self.level),
+                                           self._colour_index)
+            else:
+                self._blobs = parent_summary(
+                    [child._turned_blobs() for child in children])
+            if self._grid is not None:
+                self._keep()
+        return self._blobs.turned(self._turns)
+
+    def zobrist_hash(self) -> int:
+        """Return a 64-bit hash of this Block and its descendants.
+
+        Blocks that are equal have the same hash. The hash is kept for every
+        Block in the tree, and a move only makes the hashes of the Blocks it
+        changed and their ancestors be worked out again.
+        """
+        self._apply_ancestor_turns()
+        return self._compute_hashes()[self._turns]
+
+    def _compute_hashes(self) -> Tuple[int, int, int, int]:
+        """Return <_hashes>, working out any hashes that are not known.
+        """
+        if self._hashes is None:
+            children = self._children
+            if len(children) == 0:
+                self._hashes = zobrist_leaf_hashes(self.level,
+                                                   self._colour_index)
+            else:
+                self._hashes = zobrist_parent_hashes(
+                    self.level, [child._compute_hashes() for child in children],
+                    [child._turns for child in children])
+            if self._grid is not None:
+                self._keep()
+        return self._hashes
+
+    @property
+    def colour_index(self) -> Optional[int]:
+        """The index of this Block's colour in PALETTE, or None if it is
+        subdivided.
+        """
+        return self._colour_index
+
+    @colour_index.setter
+    def colour_index(self, index: Optional[int]) -> None:
+        """Set the colour of this Block to PALETTE[index], or to None if
+        <index> is None.
+        """
+        self._colour_index = index
+        self._invalidate()
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this Block, or None if it is subdivided.
+        """
+        if self._colour_index is None:
+            return None
+        return PALETTE[self._colour_index]
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        """Set the colour of this Block to <colour>.
+
+        Precondition: colour is None or colour in PALETTE
+        """
+        self.colour_index = None if colour is None else colour_index(colour)
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -125,18 +692,29 @@ class Block:
         >>> str(block)
         'Leaf: colour=Black, pos=(0, 0), size=750, level=0\\n'
         """
-        if len(self.children) == 0:
+        return self._describe(self.position)
+
+    def _describe(self, position: Tuple[int, int]) -> str:
+        """Return this Block in a string format, given that it is at
+        <position>.
+
+        The position of each child is worked out from <position>, rather than
+        read from each Block.
+        """
+        children = self.children
+        if len(children) == 0:
             indents = '\t' * self.level
-            colour = colour_name(self.colour)
-            return f'{indents}Leaf: colour={colour}, pos={self.position}, ' \
+            colour = colour_name(self.colour_index)
+            return f'{indents}Leaf: colour={colour}, pos={position}, ' \
                    f'size={self.size}, level={self.level}\n'
         else:
             indents = '\t' * self.level
-            result = f'{indents}Parent: pos={self.position},' \
+            result = f'{indents}Parent: pos={position},' \
                      f'size={self.size}, level={self.level}\n'
 
-            for child in self.children:
-                result += str(child)
+            positions = self._children_positions(position)
+            for i, child in enumerate(children):
+                result += child._describe(positions[i])
 
             return result
 
@@ -148,7 +726,7 @@ class Block:
             # Both self and other are leaves.
             return self.position == other.position and \
                    self.size == other.size and \
-                   self.colour == other.colour and \
+                   self.colour_index == other.colour_index and \
                    self.level == other.level and \
                    self.max_depth == other.max_depth
         elif len(self.children) != len(other.children):
@@ -163,39 +741,43 @@ class Block:
 
             return True
 
+    def path(self) -> Tuple[int, ...]:
+        """Return the indices of the children to follow from the outermost
+        Block of this Block's tree to reach this Block.
+
+        >>> board = Block((0, 0), 750, None, 0, 1)
+        >>> board.path()
+        ()
+        """
+        if self._parent is None:
+            return ()
+        siblings = self._parent.children
+        for i in range(4):
+            if siblings[i] is self:
+                return self._parent.path() + (i,)
+        return ()
+
     def _child_size(self) -> int:
         """Return the size of this Block's children.
         """
-        return round(self.size / 2.0)
+        return round(self._size / 2.0)
 
-    def _children_positions(self) -> List[Tuple[int, int]]:
-        """Return the positions of this Block's four children.
+    def _children_positions(self, position: Optional[Tuple[int, int]] = None) \
+            -> List[Tuple[int, int]]:
+        """Return the positions of this Block's four children, given that this
+        Block is at <position>, or where it is now if <position> is None.
 
         The positions are returned in this order: upper-right child, upper-left
         child, lower-left child, lower-right child.
         """
-        x = self.position[0]
-        y = self.position[1]
+        if position is None:
+            position = self.position
+        x = position[0]
+        y = position[1]
         size = self._child_size()
 
         return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
 
-    def _update_children_positions(self, position: Tuple[int, int]) -> None:
-        """Set the position of this Block to <position> and update all its
-        descendants to have positions consistent with this Block's.
-
-        <position> is the (x, y) coordinates of the upper-left corner of this
-        Block.
-        """
-        x_movement = position[0] - self.position[0]
-        y_movement = position[1] - self.position[1]
-        self.position = position
-        if self.children != []:
-            for child in self.children:
-                child._update_children_positions((child.position[0] +
-                                                  x_movement, child.position[1]
-                                                  + y_movement))
-
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
 
@@ -217,30 +799,38 @@ class Block:
         if not self.smashable():
             return False
         else:
-            self.colour = None
-            rand_colour = random.choice(COLOUR_LIST)
-            rand_colour2 = random.choice(COLOUR_LIST)
-            rand_colour3 = random.choice(COLOUR_LIST)
-            rand_colour4 = random.choice(COLOUR_LIST)
-            child1 = Block(self._children_positions()[0], self._child_size(),
-                           rand_colour, self.level + 1,
-                           self.max_depth)
-            child2 = Block(self._children_positions()[1], self._child_size(),
-                           rand_colour2, self.level + 1,
-                           self.max_depth)
-            child3 = Block(self._children_positions()[2], self._child_size(),
-                           rand_colour3, self.level + 1,
-                           self.max_depth)
-            child4 = Block(self._children_positions()[3], self._child_size(),
-                           rand_colour4, self.level + 1,
-                           self.max_depth)
-            self.children.extend([child1, child2, child3, child4])
-            for child in self.children:
-                rando = random.random()
-                if rando < math.exp(-0.25 * self.level):
-                    child.smash()
+            self._apply_ancestor_turns()
+            self._smash_at(self.position)
             return True
 
+    def _smash_at(self, position: Tuple[int, int]) -> None:
+        """Sub-divide this smashable Block, which is at <position>, as smash
+        does.
+
+        The position of each child is worked out from <position>, so smashing
+        the children does not work out their positions again.
+        """
+        self.colour = None
+        rand_colour = random.choice(COLOUR_LIST)
+        rand_colour2 = random.choice(COLOUR_LIST)
+        rand_colour3 = random.choice(COLOUR_LIST)
+        rand_colour4 = random.choice(COLOUR_LIST)
+        positions = self._children_positions(position)
+        size = self._child_size()
+        child1 = Block(positions[0], size, rand_colour, self.level + 1,
+                       self.max_depth)
+        child2 = Block(positions[1], size, rand_colour2, self.level + 1,
+                       self.max_depth)
+        child3 = Block(positions[2], size, rand_colour3, self.level + 1,
+                       self.max_depth)
+        child4 = Block(positions[3], size, rand_colour4, self.level + 1,
+                       self.max_depth)
+        self.children.extend([child1, child2, child3, child4])
+        for i, child in enumerate(self.children):
+            rando = random.random()
+            if rando < math.exp(-0.25 * self.level) and child.smashable():
+                child._smash_at(positions[i])
+
     def swap(self, direction: int) -> bool:
         """Swap the child Blocks of this Block.
 
@@ -251,38 +841,19 @@ class Block:
 
         Precondition: <direction> is either 0 or 1
         """
-        if self.children == []:
+        self._apply_ancestor_turns()
+        children = self.children
+        if children == []:
             return False
         if direction == 0:
-            children_positions = self._children_positions()
-            temp0, temp1, temp2, temp3 = children_positions[0], \
-                                         children_positions[1], \
-                                         children_positions[2], \
-                                         children_positions[3]
-            self.children[0]._update_children_positions(temp1)
-            self.children[1]._update_children_positions(temp0)
-            self.children[2]._update_children_positions(temp3)
-            self.children[3]._update_children_positions(temp2)
-            self.children[0], self.children[1] = self.children[1], \
-                                                 self.children[0]
-            self.children[2], self.children[3] = self.children[3], \
-                                                 self.children[2]
-            return True
+            list.__setitem__(children, slice(None), [children[1], children[0],
+                                                     children[3], children[2]])
         else:  # direction == 1
-            children_positions = self._children_positions()
-            temp0, temp1, temp2, temp3 = children_positions[0], \
-                                         children_positions[1], \
-                                         children_positions[2], \
-                                         children_positions[3]
-            self.children[0]._update_children_positions(temp3)
-            self.children[1]._update_children_positions(temp2)
-            self.children[2]._update_children_positions(temp1)
-            self.children[3]._update_children_positions(temp0)
-            self.children[0], self.children[3] = self.children[3], \
-                                                 self.children[0]
-            self.children[1], self.children[2] = self.children[2], \
-                                                 self.children[1]
-            return True
+            list.__setitem__(children, slice(None), [children[3], children[2],
+                                                     children[1], children[0]])
+        _advance_epoch()
+        self._invalidate()
+        return True
 
     def rotate(self, direction: int) -> bool:
         """Rotate this Block and all its descendants.
@@ -294,42 +865,18 @@ class Block:
 
         Precondition: <direction> is either 1 or 3.
         """
-        if self.children == []:
+        if self._children == []:
             return False
-        if direction == 1:
-            children_positions = self._children_positions()
-            temp0, temp1, temp2, temp3 = children_positions[0], \
-                                         children_positions[1], \
-                                         children_positions[2], \
-                                         children_positions[3]
-            self.children[0]._update_children_positions(temp3)
-            self.children[1]._update_children_positions(temp0)
-            self.children[2]._update_children_positions(temp1)
-            self.children[3]._update_children_positions(temp2)
-            self.children[0], self.children[1], self.children[2], \
-            self.children[3] = self.children[1], self.children[2], \
-                               self.children[3], self.children[0]
-            for child in self.children:
-                if child.children != []:
-                    child.rotate(1)
-            return True
-        else:  # direction == 3
-            children_positions = self._children_positions()
-            temp0, temp1, temp2, temp3 = children_positions[0], \
-                                         children_positions[1], \
-                                         children_positions[2], \
-                                         children_positions[3]
-            self.children[0]._update_children_positions(temp1)
-            self.children[1]._update_children_positions(temp2)
-            self.children[2]._update_children_positions(temp3)
-            self.children[3]._update_children_positions(temp0)
-            self.children[0], self.children[1], self.children[2], \
-            self.children[3] = self.children[3], self.children[0], \
-                               self.children[1], self.children[2]
-            for child in self.children:
-                if child.children != []:
-                    child.rotate(3)
-            return True
+        # A clockwise turn moves each child to the previous index, and turns
+        # every descendant too. Record the turn and let the children property
+        # apply it when the children are next needed.
+        self._turns = (self._turns + direction) % 4
+        _advance_epoch()
+        if self._parent is not None:
+            self._parent._invalidate()
+        else:
+            self._changes += 1
+        return True
 
     def paint(self, colour: Tuple[int, int, int]) -> bool:
         """Change this Block's colour iff it is a leaf at a level of max_depth
@@ -359,36 +906,429 @@ class Block:
         if self.level != self.max_depth - 1 or self.children == []:
             return False
 
-        colour_appearance_list = []
-        for child in self.children:
-            colour_appearance_list.append(child.colour)
-        for colour in COLOUR_LIST:
-            flag = True
-            for colour2 in COLOUR_LIST:
-                if colour_appearance_list.count(colour) <= \
-                        colour_appearance_list.count(colour2) and \
-                        colour != colour2:
-                    flag = False
-            if flag:
-                self.children = []
-                self.colour = colour
-                return True
+        majority = majority_colour_index([child.colour_index
+                                          for child in self.children])
+        if majority is None:
+            return False
+
+        self.children = []
+        self.colour_index = majority
+        return True
 
-        return False
+    def can_apply(self, action: Tuple[str, Optional[int]],
+                  colour: Optional[Tuple[int, int, int]] = None) -> bool:
+        """Return True iff apply(<action>, <colour>) would perform a move,
+        without changing this Block.
+        """
+        name = action[0]
+        if name in ('rotate', 'swap'):
+            return len(self._children) != 0
+        elif name == 'smash':
+            return self.smashable()
+        elif name == 'paint':
+            return self.level == self.max_depth and \
+                self._colour_index != colour_index(colour)
+        elif name == 'combine':
+            return self._combinable()
+        return True  # name == 'pass'
+
+    def legal_moves(self, colour: Optional[Tuple[int, int, int]] = None) \
+            -> Iterator[Tuple[str, Optional[int], Block]]:
+        """Yield every move that can be performed on this Block or one of its
+        descendants, as (action name, direction, block) triples, like the moves
+        made by players.
+
+        Paints are made with <colour>, and there are none if <colour> is None.
+        PASS is not included. The moves are yielded block by block, from this
+        Block down, in the order used by legal_move.
+
+        This Block must not change while the moves are being yielded.
+        """
+        stack = [self]
+        while stack:
+            block = stack.pop()
+            for name, direction in block._own_moves(colour):
+                yield name, direction, block
+            stack.extend(reversed(block.children))
+
+    def num_legal_moves(self,
+                        colour: Optional[Tuple[int, int, int]] = None) -> int:
+        """Return the number of moves yielded by legal_moves(<colour>).
+
+        >>> board = Block((0, 0), 750, (0, 0, 0), 0, 1)
+        >>> board.num_legal_moves()
+        1
+        >>> board.smash()
+        True
+        >>> board.num_legal_moves((0, 0, 0)) in range(4, 10)
+        True
+        """
+        parents, smashable, combinable, leaves = self._move_counts()
+        count = 4 * parents + smashable + combinable
+        if colour is not None:
+            count += sum(leaves) - leaves[colour_index(colour)]
+        return count
+
+    def legal_move(self, index: int,
+                   colour: Optional[Tuple[int, int, int]] = None) \
+            -> Tuple[str, Optional[int], Block]:
+        """Return the move at <index> in the moves yielded by
+        legal_moves(<colour>), without going through the moves before it.
+
+        Precondition: 0 <= index < self.num_legal_moves(colour)
+        """
+        block = self
+        while True:
+            own = block._own_moves(colour)
+            if index < len(own):
+                return own[index][0], own[index][1], block
+            index -= len(own)
+            for child in block.children:
+                count = child.num_legal_moves(colour)
+                if index < count:
+                    block = child
+                    break
+                index -= count
+
+    def random_legal_move(self,
+                          colour: Optional[Tuple[int, int, int]] = None) \
+            -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return one of the moves yielded by legal_moves(<colour>), each as
+        likely as any other, or None if there are none.
+        """
+        count = self.num_legal_moves(colour)
+        if count == 0:
+            return None
+        return self.legal_move(random.randrange(count), colour)
+
+    def _own_moves(self, colour: Optional[Tuple[int, int, int]]) \
+            -> List[Tuple[str, Optional[int]]]:
+        """Return the actions that can be performed on this Block itself, with
+        paints made with <colour>.
+        """
+        if self._children:
+            moves = [('rotate', 1), ('rotate', 3), ('swap', 0), ('swap', 1)]
+            if self._combinable():
+                moves.append(('combine', None))
+            return moves
+        if self.level != self.max_depth:
+            return [('smash', None)]
+        if colour is not None and \
+                self._colour_index != colour_index(colour):
+            return [('paint', None)]
+        return []
+
+    def _combinable(self) -> bool:
+        """Return True iff this Block can be combined.
+        """
+        return self.level == self.max_depth - 1 and \
+            len(self._children) != 0 and majority_colour_index(
+                [child.colour_index for child in self._children]) is not None
+
+    def _move_counts(self) -> Tuple[int, int, int, Tuple[int, ...]]:
+        """Return the counts of legal moves described by <_moves>, working
+        them out if they are not known.
+        """
+        if self._moves is None:
+            if not self._children:
+                leaves = [0] * len(PALETTE)
+                if self.level == self.max_depth:
+                    leaves[self._colour_index] = 1
+                self._moves = (0, int(self.level != self.max_depth), 0,
+                               tuple(leaves))
+            else:
+                parents, smashable = 1, 0
+                combinable = int(self._combinable())
+                leaves = [0] * len(PALETTE)
+                for child in self._children:
+                    counts = child._move_counts()
+                    parents += counts[0]
+                    smashable += counts[1]
+                    combinable += counts[2]
+                    for i, count in enumerate(counts[3]):
+                        leaves[i] += count
+                self._moves = (parents, smashable, combinable, tuple(leaves))
+            if self._grid is not None:
+                self._keep()
+        return self._moves
+
+    def _keep(self) -> None:
+        """Keep the hashes, unit cells, blobs and legal moves known for this
+        view in <_grid>, with those known for other views of the same block.
+        """
+        key = (self._cell, self.level)
+        known = self._grid[3].get(key, (None, None, None, None))
+        mine = (self._hashes, self._cells, self._blobs, self._moves)
+        self._grid[3][key] = tuple(known[i] if mine[i] is None else mine[i]
+                                   for i in range(4))
+
+    def apply(self, action: Tuple[str, Optional[int]],
+              colour: Optional[Tuple[int, int, int]] = None) \
+            -> Optional[MoveRecord]:
+        """Do <action> to this Block and return a record of the move that can
+        be used to undo it, or return None if the move was not performed.
+
+        <action> is one of the actions in actions.py, such as ('rotate', 1).
+        <colour> is the colour to paint with, and is only used by a paint.
+        """
+        name, direction = action
+        # The children of a combined Block are kept in the order they are seen
+        # in the board, so turns waiting in an ancestor are passed down first.
+        self._apply_ancestor_turns()
+        old_colour = self.colour_index
+        old_children = None
+        if name == 'rotate':
+            performed = self.rotate(direction)
+        elif name == 'swap':
+            performed = self.swap(direction)
+        elif name == 'smash':
+            performed = self.smash()
+        elif name == 'paint':
+            performed = self.paint(colour)
+        elif name == 'combine':
+            old_children = list(self.children)
+            performed = self.combine()
+        else:  # name == 'pass'
+            performed = True
+
+        if not performed:
+            return None
+        return MoveRecord(self, action, old_colour, old_children)
 
     def create_copy(self) -> Block:
         """Return a new Block that is a deep copy of this Block.
 
         Remember that a deep copy has new blocks (not aliases) at every level.
+        The new blocks below a view are made as they are read, as views of
+        the same buffers.
         """
-        deep_copy_block = Block(self.position, self.size, self.colour,
-                                self.level, self.max_depth)
-        if self.children != []:
-            for child in self.children:
-                deep_copy_child = child.create_copy()
-                deep_copy_block.children.append(deep_copy_child)
+        deep_copy_block = Block(self.position, self.size, None, self.level,
+                                self.max_depth)
+        self._copy_into(deep_copy_block)
         return deep_copy_block
 
+    def _copy_into(self, block: Block) -> None:
+        """Copy the colour, pending turns and descendants of this Block into
+        <block>, which has no children.
+
+        A copy of a view is a view of the same buffers, so its descendants are
+        only made when they are read.
+        """
+        block._colour_index = self._colour_index
+        block._turns = self._turns
+        if self._grid is not None:
+            # The buffers never change, so the copy can be a view of them too.
+            block._grid = self._grid
+            block._cell = self._cell
+            if self._child_list is None or len(self._child_list) != 0:
+                block._child_list = None
+        else:
+            for child in self._children:
+                deep_copy_child = Block(child._position, child._size, None,
+                                        child.level, child.max_depth)
+                child._copy_into(deep_copy_child)
+                list.append(block._child_list, deep_copy_child)
+                deep_copy_child._parent = block
+        block._hashes = self._hashes
+        block._cells = self._cells
+        block._cells_turns = self._cells_turns
+        block._blobs = self._blobs
+        block._moves = self._moves
+
+
+class MoveRecord:
+    """A record of a move made by Block.apply, with just enough information to
+    undo the move.
+
+    === Public Attributes ===
+    block:
+        The Block the move was made to.
+    action:
+        The action that was done to <block>.
+    """
+    # === Private Attributes ===
+    # _colour_index:
+    #   The colour index of <block> before the move.
+    # _children:
+    #   The children of <block> before a combine, or None for other moves.
+    __slots__ = ('block', 'action', '_colour_index', '_children')
+    block: Block
+    action: Tuple[str, Optional[int]]
+    _colour_index: Optional[int]
+    _children: Optional[List[Block]]
+
+    def __init__(self, block: Block, action: Tuple[str, Optional[int]],
+                 colour: Optional[int],
+                 children: Optional[List[Block]]) -> None:
+        """Initialize this record of doing <action> to <block>, which had the
+        colour index <colour> and, if the action is a combine, <children>.
+        """
+        self.block = block
+        self.action = action
+        self._colour_index = colour
+        self._children = children
+
+    def undo(self) -> None:
+        """Undo the recorded move.
+
+        Precondition: every move made to the same tree since this move has
+        already been undone.
+        """
+        name, direction = self.action
+        block = self.block
+        if name == 'rotate':
+            block.rotate(4 - direction)
+        elif name == 'swap':
+            block.swap(direction)
+        elif name == 'smash':
+            block.children = []
+            block.colour_index = self._colour_index
+        elif name == 'paint':
+            block.colour_index = self._colour_index
+        elif name == 'combine':
+            block.children = self._children
+            block.colour_index = None
+
+
+class _ChildList(list):
+    """The list of children of a Block.
+
+    Adding a Block to this list makes the owner of the list its parent, so
+    that the Block's position can be worked out from its parent's, and gives
+    it the size of the owner's children.
+    """
+    # === Private Attributes ===
+    # _owner:
+    #   The Block whose children are in this list.
+    __slots__ = ('_owner',)
+    _owner: Block
+
+    def __init__(self, owner: Block, children: List[Block] = ()) -> None:
+        """Initialize this list of the children of <owner>.
+        """
+        list.__init__(self, children)
+        self._owner = owner
+        for child in self:
+            self._adopt(child)
+        if len(self) > 0:
+            _advance_epoch()
+
+    def _adopt(self, child: Block) -> None:
+        """Make the owner of this list the parent of <child>.
+        """
+        child._parent = self._owner
+        child._resize(self._owner._child_size())
+
+    def append(self, child: Block) -> None:
+        """Add <child> to the end of this list.
+        """
+        self._adopt(child)
+        list.append(self, child)
+        _advance_epoch()
+        self._owner._invalidate()
+
+    def extend(self, children: List[Block]) -> None:
+        """Add every Block in <children> to the end of this list.
+        """
+        children = list(children)
+        for child in children:
+            self._adopt(child)
+        list.extend(self, children)
+        _advance_epoch()
+        self._owner._invalidate()
+
+    def insert(self, index: int, child: Block) -> None:
+        """Insert <child> before <index>.
+        """
+        self._adopt(child)
+        list.insert(self, index, child)
+        _advance_epoch()
+        self._owner._invalidate()
+
+    def __setitem__(self, index: Union[int, slice],
+                    value: Union[Block, List[Block]]) -> None:
+        """Replace the child or children at <index> with <value>.
+        """
+        if isinstance(index, slice):
+            value = list(value)
+            for child in value:
+                self._adopt(child)
+        else:
+            self._adopt(value)
+        list.__setitem__(self, index, value)
+        _advance_epoch()
+        self._owner._invalidate()
+
+
+def _view(grid: Tuple[bytes, bytes, int,
+                      Dict[Tuple[int, int], Tuple[Any, ...]]], cell: int,
+          position: Tuple[int, int], size: int, level: int,
+          max_depth: int) -> Block:
+    """Return a new Block at <position>, of <size>, <level> and <max_depth>,
+    that is a view of the block in <grid> whose upper left unit cell is at
+    index <cell>, starting out with what other views of it have worked out.
+    """
+    block = Block(position, size, None, level, max_depth)
+    block._grid = grid
+    block._cell = cell
+    if grid[1][cell] == level:
+        block._colour_index = grid[0][cell]
+    else:
+        block._child_list = None
+    known = grid[3].get((cell, level))
+    if known is not None:
+        block._hashes, block._cells, block._blobs, block._moves = known
+    return block
+
+
+def _advance_epoch() -> None:
+    """Record that Blocks may have moved, or have turns waiting in their
+    ancestors, so that no Block trusts its <_checked> or <_placed> any more.
+
+    Boards can be changed in more than one thread, such as by players
+    pondering, so Block._epoch is only changed while holding _EPOCH_LOCK, and
+    no change to it is lost.
+    """
+    with _EPOCH_LOCK:
+        Block._epoch += 1
+
+
+def turn_cells(cells: Tuple[Tuple[int, ...], ...], turns: int) \
+        -> Tuple[Tuple[int, ...], ...]:
+    """Return the columns of unit cells <cells> turned clockwise <turns>
+    times.
+    """
+    if turns == 1:
+        return tuple(zip(*cells))[::-1]
+    elif turns == 2:
+        return tuple(column[::-1] for column in cells[::-1])
+    elif turns == 3:
+        return tuple(zip(*cells[::-1]))
+    return cells
+
+
+# The column and row, in units of half a block, of the upper left unit cell of
+# each child of a block, in the order of Block.children.
+_CHILD_OFFSETS = ((1, 0), (0, 0), (0, 1), (1, 1))
+
+# The lock held while changing Block._epoch.
+_EPOCH_LOCK = threading.Lock()
+
+# The random numbers used by Block.zobrist_hash. They come from their own
+# random number generator so that making them does not change the boards
+# generated by the game. Each table has a row for every level a block can be
+# at: leaf keys for every PALETTE colour, a key for a parent block, and an odd
+# multiplier for each child position.
+_MASK_64 = (1 << 64) - 1
+_MAX_LEVELS = 16
+_zobrist_random = random.Random(148)
+_ZOBRIST_LEAF = [[_zobrist_random.getrandbits(64) for _ in PALETTE]
+                 for _ in range(_MAX_LEVELS)]
+_ZOBRIST_PARENT = [_zobrist_random.getrandbits(64)
+                   for _ in range(_MAX_LEVELS)]
+_ZOBRIST_CHILD = [[_zobrist_random.getrandbits(64) | 1 for _ in range(4)]
+                  for _ in range(_MAX_LEVELS)]
+
 
 if __name__ == '__main__':
     import python_ta
@@ -396,9 +1336,9 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
-            'settings'
+            'threading', 'blobs', 'settings'
         ],
-        'max-attributes': 15,
+        'max-attributes': 18,
         'max-args': 6
     })
 
@@ -26,9 +26,9 @@ from __future__ import annotations
 from typing import Dict, List, Optional, Tuple
 import pygame
 
-from actions import ACTION_MESSAGE, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,\
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
-from block import Block
+from actions import ACTION_MESSAGE, SMASH, PAINT, COMBINE, ACTION_PENALTY
+from block import Block, MoveRecord
+from goal import score_goals
 from player import Player
 from renderer import Renderer
 from settings import ANIMATION_DURATION
@@ -49,15 +49,32 @@ def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
     The order of the squares does not matter.
     """
     final_list = []
-    if board.children == []:
-        return [(board.colour, board.position, board.size)]
-    else:
-        for childblock in board.children:
-            final_list.extend(_block_to_squares(childblock))
-
+    _add_squares(board, board.position, board.size, final_list)
     return final_list
 
 
+def _add_squares(board: Block, position: Tuple[int, int], size: int,
+                 squares: List[Tuple[Tuple[int, int, int], Tuple[int, int],
+                                     int]]) -> None:
+    """Append the squares to be drawn for <board> to <squares>, given that
+    <board> is at <position> and has dimensions <size> by <size>.
+
+    The position and size of each child are worked out here, in the same way
+    as Block._children_positions does, rather than read from each Block.
+    """
+    children = board.children
+    if len(children) == 0:
+        squares.append((board.colour, position, size))
+    else:
+        x, y = position
+        half = round(size / 2.0)
+        upper_right, upper_left, lower_left, lower_right = children
+        _add_squares(upper_right, (x + half, y), half, squares)
+        _add_squares(upper_left, position, half, squares)
+        _add_squares(lower_left, (x, y + half), half, squares)
+        _add_squares(lower_right, (x + half, y + half), half, squares)
+
+
 class GameData:
     """
     A bundle of the data needed for a Blocky game.
@@ -112,13 +129,25 @@ class GameData:
         their goal in the game and second the deductions from their score based
         on the actions they've taken.
         """
-        goal_score = self.players[player_id].goal.score(self.board)
+        return self.calculate_scores()[player_id]
 
-        penalty = self.smashes[player_id] * ACTION_PENALTY[SMASH] + \
-                  self.combines[player_id] * ACTION_PENALTY[COMBINE] + \
-                  self.paints[player_id] * ACTION_PENALTY[PAINT]
+    def calculate_scores(self) -> List[Tuple[int, int]]:
+        """Return the result of calculate_score for every player, in order of
+        player ID.
 
-        return goal_score, penalty
+        Every player's goal is scored together, so the board is only looked at
+        once, and the scores are kept in goal.score_cache for the turns of the
+        other players.
+        """
+        goal_scores = score_goals([player.goal for player in self.players],
+                                  self.board)
+        scores = []
+        for player, goal_score in zip(self.players, goal_scores):
+            penalty = self.smashes[player.id] * ACTION_PENALTY[SMASH] + \
+                      self.combines[player.id] * ACTION_PENALTY[COMBINE] + \
+                      self.paints[player.id] * ACTION_PENALTY[PAINT]
+            scores.append((goal_score, penalty))
+        return scores
 
 
 class GameState:
@@ -155,10 +184,13 @@ class MainState(GameState):
     #   The index of the current player in GameData.players.
     # _current_score:
     #   The score of the current player, including penalties.
+    # _history:
+    #   A record of every move made so far, oldest first, used to undo them.
     _turn: int
     _data: GameData
     _current_player_index: int
     _current_score: int
+    _history: List[MoveRecord]
 
     def __init__(self, data: GameData) -> None:
         """Initialize this GameState.
@@ -166,9 +198,11 @@ class MainState(GameState):
         self._turn = 0
         self._data = data
         self._current_player_index = 0
+        self._history = []
 
         score, penalty = self._data.calculate_score(self._current_player().id)
         self._current_score = score - penalty
+        self._ponder()
 
     def _current_player(self) -> Player:
         """Return the player whose turn it is.
@@ -187,36 +221,67 @@ class MainState(GameState):
         if self._current_player_index == 0:
             self._turn += 1
 
+    def _ponder(self) -> None:
+        """Let every player think about the board in the background until it
+        is asked for a move, such as while a move is animated or a human
+        player decides.
+        """
+        for player in self._data.players:
+            player.ponder(self._data.board, self._current_player_index)
+
     def _do_move(self, move: Tuple[str, Optional[int], Block]) -> bool:
         """Attempt to do the player's requested move.
         """
         action = (move[0], move[1])
-        direction = move[1]
         block = move[2]
         player = self._current_player()
-        move_successful = False
-
-        if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
-            move_successful = block.rotate(direction)
-        elif action in [SWAP_HORIZONTAL, SWAP_VERTICAL]:
-            move_successful = block.swap(direction)
-        elif action == SMASH:
-            move_successful = block.smash()
-            self._data.smashes[player.id] += int(move_successful)
+
+        if action not in ACTION_PENALTY:
+            return False
+        record = block.apply(action, player.goal.colour)
+        if record is None:
+            return False
+
+        if action == SMASH:
+            self._data.smashes[player.id] += 1
         elif action == PAINT:
-            move_successful = block.paint(self._current_player().goal.colour)
-            self._data.paints[player.id] += int(move_successful)
+            self._data.paints[player.id] += 1
         elif action == COMBINE:
-            move_successful = block.combine()
-            self._data.combines[player.id] += int(move_successful)
-        elif action == PASS:
-            # Do nothing
-            move_successful = True
+            self._data.combines[player.id] += 1
+
+        self._history.append(record)
+        self._update_player()
+        return True
+
+    def undo(self) -> bool:
+        """Undo the most recent move and give the turn back to the player who
+        made it.
+
+        Return True iff there was a move to undo.
+        """
+        if self._history == []:
+            return False
 
-        if move_successful:
-            self._update_player()
+        record = self._history.pop()
+        record.undo()
 
-        return move_successful
+        if self._current_player_index == 0:
+            self._turn -= 1
+        self._current_player_index = (self._current_player_index - 1) % len(
+            self._data.players)
+
+        player = self._current_player()
+        if record.action == SMASH:
+            self._data.smashes[player.id] -= 1
+        elif record.action == PAINT:
+            self._data.paints[player.id] -= 1
+        elif record.action == COMBINE:
+            self._data.combines[player.id] -= 1
+
+        score, penalty = self._data.calculate_score(player.id)
+        self._current_score = score - penalty
+        self._ponder()
+        return True
 
     def process_event(self, event: pygame.event.Event) -> None:
         """Process the event from the operating system, if possible.
@@ -229,6 +294,8 @@ class MainState(GameState):
         Return the next GameState that should be updated. This can be self.
         """
         if self._turn >= self._data.max_turns:
+            for player in self._data.players:
+                player.close()
             return GameOverState(self._data)
 
         # Ask the player to make a move
@@ -245,6 +312,8 @@ class MainState(GameState):
 
             # Do the move
             if self._do_move(move):
+                # Think about the next turn while the move is animated
+                self._ponder()
                 # Animate the move that was just done
                 return AnimateMoveState(self, player_id, move, background)
             else:
@@ -352,8 +421,8 @@ class GameOverState(GameState):
         """Initialize this GameState.
         """
         self._scores = []
-        for p in data.players:
-            goal_score, penalty = data.calculate_score(p.id)
+        for p, (goal_score, penalty) in zip(data.players,
+                                            data.calculate_scores()):
             self._scores.append((p.id, goal_score, penalty))
 
         self._winner = max(self._scores, key=lambda item: item[1] - item[2])[0]
@@ -396,7 +465,7 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'block', 'goal', 'player', 'renderer', 'settings', 'actions'
         ],
         'generated-members': 'pygame.*'
     })
@@ -25,13 +25,23 @@ tests!
 """
 from typing import List, Optional, Tuple
 import os
+import sys
+import time
 import pygame
 import pytest
 
+from actions import ACTION_PENALTY, COMBINE, PAINT, ROTATE_CLOCKWISE, SMASH, \
+    SWAP_HORIZONTAL
 from block import Block
-from blocky import _block_to_squares
-from goal import BlobGoal, PerimeterGoal, _flatten
-from player import _get_block
+from blocky import _block_to_squares, GameData, MainState
+import goal as goal_module
+from goal import BlobGoal, PerimeterGoal, ScoreCache, _flatten, \
+    score_cache, score_goals
+from grid import BoardGrid
+from persistent import PersistentBoard
+import player as player_module
+from player import _get_block, create_players, get_blocks, AlphaBetaPlayer, \
+    EXHAUSTIVE, MCTSPlayer, PickingIndex, RandomPlayer, SmartPlayer
 from renderer import Renderer
 from settings import COLOUR_LIST
 
@@ -243,6 +253,20 @@ class TestBlock:
                 # There should only be either 0 or 4 children (RI)
                 assert False
 
+    def test_colour_index(self, board_16x16) -> None:
+        """Test that a block stores its colour as an index into the palette
+        and still reports the colour value.
+        """
+        block = board_16x16.children[1]
+
+        assert block.colour_index == 2
+        assert block.colour == COLOUR_LIST[2]
+        assert board_16x16.colour_index is None
+        assert not hasattr(block, '__dict__')
+
+        block.colour = COLOUR_LIST[3]
+        assert block.colour_index == 3
+
     def test_swap0(self, board_16x16, board_16x16_swap0) -> None:
         """Test that the reference board can be correctly swapped along the
         horizontal plane.
@@ -257,6 +281,146 @@ class TestBlock:
         board_16x16.children[0].rotate(1)
         assert board_16x16 == board_16x16_rotate1
 
+    def test_rotate_moves_descendants(self, board_16x16) -> None:
+        """Test that rotating the whole board moves a block that was looked up
+        before the rotation.
+        """
+        block = board_16x16.children[0].children[0]
+        assert block.position == (563, 0)
+
+        board_16x16.rotate(1)
+        assert block.position == (563, 563)
+        assert board_16x16.children[3].children[3] is block
+
+        board_16x16.rotate(3)
+        board_16x16.swap(0)
+        assert block.position == (188, 0)
+        assert block.size == 188
+
+    def test_size_follows_parent(self) -> None:
+        """Test that a block given to a parent, with its descendants, takes the
+        sizes of the parent's descendants, and that its position follows
+        later moves.
+        """
+        board = Block((0, 0), 750, None, 0, 2)
+        child = Block((0, 0), 100, None, 1, 2)
+        child.children.extend([Block((0, 0), 50, COLOUR_LIST[i], 2, 2)
+                               for i in range(4)])
+        board.children.extend([child] + [Block((0, 0), 375, COLOUR_LIST[i], 1,
+                                               2) for i in range(3)])
+        assert child.size == 375
+        assert [grandchild.size for grandchild in child.children] == \
+            [188, 188, 188, 188]
+        assert child.position == (375, 0)
+
+        board.swap(0)
+        assert child.position == (0, 0)
+        assert child.children[0].position == (188, 0)
+
+    def test_stale_child_after_rotation(self, board_16x16) -> None:
+        """Test that a block looked up before the whole board was rotated sees
+        the rotation, whatever is read from it or done to it first.
+        """
+        block = board_16x16.children[0]
+        expected = board_16x16.create_copy()
+        board_16x16.rotate(1)
+        expected.rotate(1)
+        expected = expected.children[3]
+
+        assert [child.position for child in block.children] == \
+            [child.position for child in expected.children]
+        assert block.zobrist_hash() == expected.zobrist_hash()
+        assert block.unit_cells() == expected.unit_cells()
+        assert block.blob_summary().sides == expected.blob_summary().sides
+
+        block.swap(0)
+        expected.swap(0)
+        assert block == expected
+
+    def test_zobrist_hash(self, board_16x16, board_16x16_swap0,
+                          board_16x16_rotate1) -> None:
+        """Test that a board's hash follows its moves, and matches the hash of
+        an equal board that was built directly.
+        """
+        start = board_16x16.zobrist_hash()
+        assert start != board_16x16_swap0.zobrist_hash()
+
+        board_16x16.swap(0)
+        assert board_16x16.zobrist_hash() == board_16x16_swap0.zobrist_hash()
+
+        board_16x16.swap(0)
+        board_16x16.children[0].rotate(1)
+        assert board_16x16.zobrist_hash() == \
+            board_16x16_rotate1.zobrist_hash()
+
+        board_16x16.children[0].rotate(3)
+        assert board_16x16.zobrist_hash() == start
+
+    def test_apply_and_undo(self, board_16x16) -> None:
+        """Test that moves made with apply can be undone in reverse order.
+        """
+        copy = board_16x16.create_copy()
+        records = [board_16x16.children[0].apply(COMBINE),
+                   board_16x16.children[1].apply(SMASH),
+                   board_16x16.apply(ROTATE_CLOCKWISE),
+                   board_16x16.children[3].apply(PAINT, COLOUR_LIST[0])]
+
+        assert records[3] is None
+        for record in reversed(records[:3]):
+            record.undo()
+        assert board_16x16 == copy
+
+    def test_legal_moves(self, board_16x16) -> None:
+        """Test that the legal moves are the moves that can be applied, and
+        that they are kept up to date as the board changes.
+        """
+        moves = list(board_16x16.legal_moves(COLOUR_LIST[1]))
+        assert len(moves) == board_16x16.num_legal_moves(COLOUR_LIST[1]) == 14
+        assert board_16x16.num_legal_moves() == 12
+        for i, move in enumerate(moves):
+            assert board_16x16.legal_move(i, COLOUR_LIST[1]) == move
+            assert move[2].can_apply(move[:2], COLOUR_LIST[1])
+
+        board_16x16.children[0].apply(COMBINE)
+        assert board_16x16.num_legal_moves(COLOUR_LIST[1]) == 8
+        assert board_16x16.children[0].num_legal_moves() == 1
+
+    def test_undo_after_turning_board(self, board_16x16) -> None:
+        """Test that a move is undone correctly after the whole board has been
+        turned and turned back.
+        """
+        copy = board_16x16.create_copy()
+        records = [board_16x16.children[0].apply(SWAP_HORIZONTAL),
+                   board_16x16.apply(ROTATE_CLOCKWISE)]
+        records.append(board_16x16.children[3].children[0].apply(
+            PAINT, COLOUR_LIST[2]))
+        for record in reversed(records):
+            record.undo()
+        assert board_16x16 == copy
+
+        upper_right = board_16x16.children[0]
+        records = [board_16x16.apply(ROTATE_CLOCKWISE),
+                   upper_right.apply(COMBINE)]
+        for record in reversed(records):
+            record.undo()
+        assert board_16x16 == copy
+
+    def test_main_state_undo(self, board_16x16) -> None:
+        """Test that the game can undo a move and its penalty.
+        """
+        copy = board_16x16.create_copy()
+        players = [RandomPlayer(0, PerimeterGoal(COLOUR_LIST[0])),
+                   RandomPlayer(1, PerimeterGoal(COLOUR_LIST[1]))]
+        data = GameData(board_16x16, players)
+        state = MainState(data)
+
+        assert state._do_move(('smash', None, board_16x16.children[1]))
+        assert data.smashes[0] == 1
+        assert state.undo()
+        assert data.smashes[0] == 0
+        assert board_16x16 == copy
+        assert not state.undo()
+
 
 class TestPlayer:
     """A collection of methods for testing the methods and functions in the
@@ -283,6 +447,253 @@ class TestPlayer:
         assert _get_block(board_16x16, top_right, 2) == \
             board_16x16.children[0].children[0]
 
+    def test_get_blocks(self, board_16x16) -> None:
+        """Test that looking up many locations together finds the same blocks
+        as looking them up one at a time.
+        """
+        locations = [(0, 0), (749, 0), (600, 100), (400, 400), (750, 10),
+                     (-1, 0), (374, 375)]
+        for level in range(3):
+            levels = [level] * len(locations)
+            expected = [_get_block(board_16x16, location, level)
+                        for location in locations]
+            assert get_blocks(board_16x16, locations, levels) == expected
+        assert _get_block(board_16x16, (600, 100), 2) is \
+            board_16x16.children[0].children[0]
+
+    def test_picking_index(self, board_16x16) -> None:
+        """Test that the picking index finds the same blocks as _get_block,
+        and is out of date once the board changes.
+        """
+        locations = [(0, 0), (749, 0), (600, 100), (400, 400), (750, 10),
+                     (-1, 0), (374, 375), (187, 562)]
+        index = PickingIndex(board_16x16)
+        for level in range(3):
+            for location in locations:
+                assert index.get_block(location, level) is \
+                    _get_block(board_16x16, location, level)
+
+        board_16x16.children[0].rotate(1)
+        assert index.changes != board_16x16.changes
+        index = PickingIndex(board_16x16)
+        assert index.get_block((600, 100), 2) is \
+            _get_block(board_16x16, (600, 100), 2)
+
+    def test_ai_players_do_not_mutate(self, board_16x16) -> None:
+        """Test that the computer players find a valid move without changing
+        the board.
+        """
+        copy = board_16x16.create_copy()
+        players = [RandomPlayer(0, PerimeterGoal(COLOUR_LIST[0])),
+                   SmartPlayer(1, BlobGoal(COLOUR_LIST[1]), 10),
+                   MCTSPlayer(2, BlobGoal(COLOUR_LIST[2]), None, 50)]
+        for player in players:
+            player._proceed = True
+            move = player.generate_move(board_16x16)
+
+            assert move is not None
+            assert board_16x16 == copy
+
+    def test_smart_player_few_moves(self, board_16x16) -> None:
+        """Test that a smart player whose difficulty is more than the number of
+        legal moves assesses every move once and stops.
+        """
+        goal = PerimeterGoal(COLOUR_LIST[1])
+        player = SmartPlayer(0, goal, 1000)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+
+        scores = [goal.score(board_16x16) + goal.score_delta(board_16x16, other)
+                  for other in board_16x16.legal_moves(goal.colour)
+                  if other[0] != 'smash']
+        assert move[0] != 'pass'
+        if move[0] != 'smash':
+            assert goal.score(board_16x16) + \
+                goal.score_delta(board_16x16, move) == max(scores)
+
+    def test_exhaustive_smart_player(self, board_16x16) -> None:
+        """Test that the smart player created for the EXHAUSTIVE difficulty
+        makes the first of the best moves other than a smash, and shuts down
+        its processes when closed.
+        """
+        player = create_players(0, 0, [EXHAUSTIVE])[0]
+        goal = player.goal
+        assert isinstance(player, SmartPlayer)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+
+        best = ('pass', None, board_16x16)
+        best_delta = 0
+        for other in board_16x16.legal_moves(goal.colour):
+            if other[0] != 'smash':
+                delta = goal.score_delta(board_16x16, other)
+                if delta > best_delta:
+                    best, best_delta = other, delta
+        assert move == best
+
+        player.close()
+        assert player._pool is None
+
+    def test_mcts_player_budget(self, board_16x16) -> None:
+        """Test that an MCTS player stops at its time limit and makes a move
+        that can be made.
+        """
+        player = MCTSPlayer(0, PerimeterGoal(COLOUR_LIST[1]), 0.2)
+        player._proceed = True
+        start = time.perf_counter()
+        move = player.generate_move(board_16x16)
+
+        assert time.perf_counter() - start < 1
+        assert move[0] == 'pass' or \
+            move[2].can_apply(move[:2], COLOUR_LIST[1])
+
+    def test_mcts_kept_tree(self, board_16x16) -> None:
+        """Test that the values kept in the tree below an MCTS player's move
+        are those found from the board after the move, which do not count
+        the move's penalty.
+        """
+        # The best move for this goal is a combine, which has a penalty.
+        goal = PerimeterGoal(COLOUR_LIST[1])
+        player = MCTSPlayer(0, goal, None, 300, 0)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+        move[2].apply(move[:2], goal.colour)
+
+        # A move searched once, with no moves after it, has the value of the
+        # one sequence that ends with it.
+        stack = [(player._trees[board_16x16.zobrist_hash()], [])]
+        while stack:
+            node, sequence = stack.pop()
+            if node.visits == 1 and not node.children and sequence:
+                records = [player_module._make_move(board_16x16, other,
+                                                    goal.colour)
+                           for other in sequence]
+                assert node.total == goal.score(board_16x16) - sum(
+                    ACTION_PENALTY[other[:2]] for other in sequence)
+                for record in reversed(records):
+                    record.undo()
+            for child in node.children:
+                stack.append((child, sequence + [child.move]))
+
+    def test_alpha_beta_player(self, board_16x16) -> None:
+        """Test that an alpha-beta player looking one turn ahead makes the
+        best move less its penalty, and does not change the board when it
+        looks further ahead.
+        """
+        goals = [BlobGoal(COLOUR_LIST[0]), PerimeterGoal(COLOUR_LIST[1])]
+        player = AlphaBetaPlayer(1, goals, None, 1)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+        best = max([0] + [goals[1].score_delta(board_16x16, other) -
+                          ACTION_PENALTY[other[:2]]
+                          for other in board_16x16.legal_moves(COLOUR_LIST[1])
+                          if other[0] != 'smash'])
+        assert goals[1].score_delta(board_16x16, move) - \
+            ACTION_PENALTY[move[:2]] == best
+
+        copy = board_16x16.create_copy()
+        player = AlphaBetaPlayer(0, goals, None, 3)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+        assert board_16x16 == copy
+        assert move[2].can_apply(move[:2], COLOUR_LIST[0])
+
+    def test_alpha_beta_table_budget(self, board_16x16, monkeypatch) -> None:
+        """Test that an alpha-beta player keeps no more boards in its table
+        than its memory budget allows, and still makes a move.
+        """
+        monkeypatch.setattr(player_module, 'SEARCH_TABLE_BYTES',
+                            10 * player_module._TABLE_ENTRY_BYTES)
+        goals = [BlobGoal(COLOUR_LIST[0]), PerimeterGoal(COLOUR_LIST[1])]
+        player = AlphaBetaPlayer(0, goals, None, 3)
+        player._proceed = True
+        move = player.generate_move(board_16x16)
+        assert len(player._state.table) <= 10
+        assert move[0] == 'pass' or \
+            move[2].can_apply(move[:2], COLOUR_LIST[0])
+
+    def test_pondering(self, board_16x16) -> None:
+        """Test that players pondering in the background do not change the
+        board, and make moves that can be made once asked.
+        """
+        copy = board_16x16.create_copy()
+        goals = [BlobGoal(COLOUR_LIST[0]), PerimeterGoal(COLOUR_LIST[1])]
+        players = [AlphaBetaPlayer(0, goals, None, 2),
+                   MCTSPlayer(1, goals[1], None, 50),
+                   SmartPlayer(1, goals[1], 10),
+                   SmartPlayer(0, goals[0], 1, exhaustive=True)]
+        for player in players:
+            player.ponder(board_16x16, player.id)
+        for player in players:
+            player._proceed = True
+            move = player.generate_move(board_16x16)
+            assert move[0] == 'pass' or \
+                move[2].can_apply(move[:2], player.goal.colour)
+        assert board_16x16 == copy
+
+    def test_pondering_replies(self, board_16x16) -> None:
+        """Test that players pondering on another player's turn keep what they
+        found for the board after that player's move, by the board's hash.
+        """
+        goal = PerimeterGoal(COLOUR_LIST[1])
+        players = [MCTSPlayer(1, goal, None, 20), SmartPlayer(1, goal, 3)]
+        for player in players:
+            player.ponder(board_16x16, 0)
+        for player in players:
+            player._pondering._thread.join()
+
+        board_16x16.children[0].apply(ROTATE_CLOCKWISE, COLOUR_LIST[0])
+        key = board_16x16.zobrist_hash()
+        assert players[0]._trees[key].visits >= 20
+        assert key in players[1]._assessed
+        for player in players:
+            player._proceed = True
+            move = player.generate_move(board_16x16)
+            assert move[0] == 'pass' or \
+                move[2].can_apply(move[:2], goal.colour)
+
+    def test_random_player_moves(self, board_16x16) -> None:
+        """Test that the random player makes a legal move, and passes when it
+        cannot make one.
+        """
+        player = RandomPlayer(0, PerimeterGoal(COLOUR_LIST[0]))
+        for _ in range(20):
+            player._proceed = True
+            move = player.generate_move(board_16x16)
+            assert move[2].can_apply(move[:2], COLOUR_LIST[0])
+
+        player._proceed = True
+        board = Block((0, 0), 750, COLOUR_LIST[0], 0, 0)
+        assert player.generate_move(board) == ('pass', None, board)
+
+
+class TestPersistentBoard:
+    """A collection of methods for testing the PersistentBoard class.
+    """
+    def test_apply_shares_board(self, board_16x16, board_16x16_swap0,
+                                board_16x16_rotate1) -> None:
+        """Test that moves on a persistent board give the same boards as moves
+        on a Block, and leave the original board unchanged.
+        """
+        board = PersistentBoard.from_block(board_16x16)
+        swapped = board.apply(SWAP_HORIZONTAL, ())
+        rotated = board.apply(ROTATE_CLOCKWISE, (0,))
+
+        assert swapped.to_block() == board_16x16_swap0
+        assert rotated.to_block() == board_16x16_rotate1
+        assert board.to_block() == board_16x16
+
+    def test_invalid_moves(self, board_16x16) -> None:
+        """Test that moves that cannot be done give None.
+        """
+        board = PersistentBoard.from_block(board_16x16)
+
+        assert board.apply(ROTATE_CLOCKWISE, (1,)) is None
+        assert board.apply(PAINT, (0, 1), COLOUR_LIST[1]) is None
+        assert board.apply(COMBINE, ()) is None
+        assert board.apply(COMBINE, (0,)).to_block().children[0].colour == \
+            COLOUR_LIST[1]
+
 
 class TestGoal:
     """A collection of methods for testing the sub-classes of Goal.
@@ -302,6 +713,21 @@ class TestGoal:
 
         assert result == flattened_board_16x16
 
+    def test_flatten_after_moves(self, board_16x16) -> None:
+        """Test that the cached unit cells of a board are brought up to date
+        by moves, and are reused when nothing has changed.
+        """
+        cells = board_16x16.unit_cells()
+        assert board_16x16.unit_cells() is cells
+
+        board_16x16.children[0].rotate(1)
+        board_16x16.swap(0)
+        board_16x16.children[1].children[0].paint(COLOUR_LIST[2])
+        board_16x16.children[3].smash()
+        assert board_16x16.unit_cells() is not cells
+        assert _flatten(board_16x16) == \
+            _flatten(PersistentBoard.from_block(board_16x16).to_block())
+
     def test_blob_goal(self, board_16x16) -> None:
         correct_scores = [
             (COLOUR_LIST[0], 1),
@@ -328,6 +754,242 @@ class TestGoal:
             goal = PerimeterGoal(colour)
             assert goal.score(board_16x16) == expected
 
+    def test_blob_summary_after_moves(self, board_16x16) -> None:
+        """Test that the blob summary of a board is brought up to date by
+        moves, and that the summaries of unchanged blocks are reused.
+        """
+        goals = [BlobGoal(colour) for colour in COLOUR_LIST]
+        board_16x16.blob_summary()
+        unchanged = board_16x16.children[2].blob_summary()
+
+        board_16x16.children[0].rotate(1)
+        board_16x16.children[0].children[1].paint(COLOUR_LIST[3])
+        board_16x16.children[3].smash()
+        assert board_16x16.children[2].blob_summary() is unchanged
+        grid = BoardGrid.from_block(board_16x16)
+        assert [goal.score(board_16x16) for goal in goals] == \
+            [goal.score(grid) for goal in goals]
+
+    def test_score_goals(self, board_16x16) -> None:
+        """Test that scoring several goals together gives the same scores as
+        scoring them one at a time.
+        """
+        goals = [goal_class(colour) for goal_class in (BlobGoal, PerimeterGoal)
+                 for colour in COLOUR_LIST]
+        expected = [goal.score(BoardGrid.from_block(board_16x16))
+                    for goal in goals]
+
+        score_cache.clear()
+        assert score_goals(goals, board_16x16) == expected
+        assert score_goals(goals, board_16x16) == expected
+        assert score_cache.hits == len(goals)
+
+    def test_score_many(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that scoring many boards together gives the same scores as
+        scoring them one at a time.
+        """
+        boards = [board_16x16, BoardGrid.from_block(board_16x16),
+                  BoardGrid.from_block(board_16x16_swap0),
+                  BoardGrid.from_block(board_16x16_swap0).to_block(),
+                  board_16x16.children[0],
+                  PersistentBoard.from_block(board_16x16_swap0),
+                  BoardGrid.from_block(Block((0, 0), 750, COLOUR_LIST[2], 0,
+                                             2))]
+        for goal_class in (BlobGoal, PerimeterGoal):
+            for colour in COLOUR_LIST:
+                goal = goal_class(colour)
+                goal_module.score_cache.clear()
+                expected = [goal.score(board) for board in boards]
+                goal_module.score_cache.clear()
+                assert goal.score_many(boards) == expected
+
+    def test_score_delta(self, board_16x16) -> None:
+        """Test that the predicted change in score of each move matches the
+        change when the move is made, and that the board is not changed.
+        """
+        moves = [(ROTATE_CLOCKWISE, board_16x16),
+                 (SWAP_HORIZONTAL, board_16x16.children[0]),
+                 (PAINT, board_16x16.children[0].children[2]),
+                 (COMBINE, board_16x16.children[0]),
+                 (COMBINE, board_16x16)]
+        for goal_class in (BlobGoal, PerimeterGoal):
+            for colour in COLOUR_LIST:
+                goal = goal_class(colour)
+                for action, block in moves:
+                    before = goal.score(board_16x16)
+                    delta = goal.score_delta(board_16x16,
+                                             (action[0], action[1], block))
+                    assert goal.score(board_16x16) == before
+
+                    record = block.apply(action, colour)
+                    if record is None:
+                        assert delta is None
+                    else:
+                        assert goal.score(board_16x16) - before == delta
+                        record.undo()
+
+    def test_move_scorer(self, board_16x16) -> None:
+        """Test that a MoveScorer gives the score after each move as it is
+        when the move is made, within the bounds it gives.
+        """
+        board_16x16.rotate(1)
+        for goal_class in (BlobGoal, PerimeterGoal):
+            for colour in COLOUR_LIST:
+                goal = goal_class(colour)
+                scorer = goal.move_scorer(board_16x16)
+                assert scorer.score == goal.score(board_16x16)
+                for paint_colour in COLOUR_LIST:
+                    for move in board_16x16.legal_moves(paint_colour):
+                        if move[0] == SMASH[0]:
+                            continue
+                        record = move[2].apply(move[:2], paint_colour)
+                        expected = goal.score(board_16x16)
+                        record.undo()
+                        low, high = scorer.bounds(move, paint_colour)
+                        assert low <= expected <= high
+                        assert scorer.score_after(move, paint_colour) == \
+                            expected
+
+    def test_scores_on_board_types(self, board_16x16) -> None:
+        """Test that the goals give the same score on every kind of board,
+        including a deep board with a single block.
+        """
+        for goal_class in (BlobGoal, PerimeterGoal):
+            for colour in COLOUR_LIST:
+                goal = goal_class(colour)
+                expected = goal.score(board_16x16)
+                assert goal.score(BoardGrid.from_block(board_16x16)) == expected
+                assert goal.score(PersistentBoard.from_block(board_16x16)) == \
+                    expected
+
+        deep_board = Block((0, 0), 750, COLOUR_LIST[0], 0, 10)
+        assert PerimeterGoal(COLOUR_LIST[0]).score(deep_board) == 4 * 2 ** 10
+        assert BlobGoal(COLOUR_LIST[0]).score(deep_board) == 4 ** 10
+
+    def test_scores_without_numpy(self, board_16x16, monkeypatch) -> None:
+        """Test that goals give the same scores with and without NumPy.
+        """
+        goals = [goal_class(colour) for goal_class in (BlobGoal, PerimeterGoal)
+                 for colour in COLOUR_LIST]
+        grid = BoardGrid.from_block(board_16x16)
+        scores = [goal.score(grid) for goal in goals]
+
+        monkeypatch.setattr(goal_module, 'np', None)
+        assert [goal.score(grid) for goal in goals] == scores
+
+        # A blob this big would need one stack frame per unit cell if it were
+        # searched recursively.
+        deep_grid = BoardGrid.from_block(
+            Block((0, 0), 750, COLOUR_LIST[0], 0, 8))
+        assert BlobGoal(COLOUR_LIST[0]).score(deep_grid) == 4 ** 8
+
+    def test_score_cache(self, board_16x16) -> None:
+        """Test that scoring a board again uses the cached score, and that a
+        move changes which score is used.
+        """
+        score_cache.clear()
+        goal = BlobGoal(COLOUR_LIST[1])
+
+        assert goal.score(board_16x16) == 4
+        assert goal.score(board_16x16) == 4
+        assert (score_cache.hits, score_cache.misses) == (1, 1)
+
+        # Only what the entry is made of is counted, not the class of goal
+        # in its key, which every entry shares.
+        assert score_cache.nbytes() < sys.getsizeof(BlobGoal)
+
+        board_16x16.children[1].smash()
+        assert goal.score(board_16x16) == goal.score(
+            BoardGrid.from_block(board_16x16))
+        assert score_cache.misses == 2
+
+    def test_score_cache_eviction(self) -> None:
+        """Test that a full cache removes the least recently used score.
+        """
+        cache = ScoreCache(0)
+        cache.put('a', 1)
+        assert len(cache) == 0
+
+        cache.resize(10000)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.resize(cache.nbytes() - 1)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+
+
+class TestGrid:
+    """A collection of methods for testing the BoardGrid class against the
+    Block class.
+    """
+    def test_round_trip(self, board_16x16, flattened_board_16x16) -> None:
+        """Test that converting the reference board to a grid and back gives
+        the same board.
+        """
+        grid = BoardGrid.from_block(board_16x16)
+
+        assert grid.to_block() == board_16x16
+        assert grid.root() == board_16x16
+        assert _flatten(grid) == flattened_board_16x16
+
+    def test_block_views(self, board_16x16, board_16x16_rotate1) -> None:
+        """Test that Blocks made from a grid are views of its buffers, which
+        their copies share, and that changing one leaves the others alone.
+        """
+        board = BoardGrid.from_block(board_16x16).to_block()
+        copy = board.create_copy()
+        assert copy.cell_buffers()[0] is board.cell_buffers()[0]
+        assert copy.unit_cells() == board_16x16.unit_cells()
+
+        copy.children[0].rotate(1)
+        assert copy == board_16x16_rotate1
+        assert board == board_16x16
+        assert BoardGrid.from_block(copy).to_block() == board_16x16_rotate1
+
+    def test_swap0(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that swapping the whole grid matches swapping the reference
+        board.
+        """
+        grid = BoardGrid.from_block(board_16x16)
+
+        assert grid.root().swap(0)
+        assert grid.to_block() == board_16x16_swap0
+
+    def test_rotate1(self, board_16x16, board_16x16_rotate1) -> None:
+        """Test that rotating the top-right block of the grid matches the
+        reference rotation.
+        """
+        grid = BoardGrid.from_block(board_16x16)
+        copy = grid.create_copy()
+
+        assert grid.root().children[0].rotate(1)
+        assert grid.to_block() == board_16x16_rotate1
+        assert copy.to_block() == board_16x16
+
+    def test_combine_and_paint(self, board_16x16) -> None:
+        """Test that combining and painting a grid matches doing so to the
+        reference board.
+        """
+        grid = BoardGrid.from_block(board_16x16)
+
+        assert grid.block(1, 1, 0).combine()
+        assert board_16x16.children[0].combine()
+        assert grid.to_block() == board_16x16
+
+        assert not grid.block(1, 0, 0).paint(COLOUR_LIST[0])
+        assert not grid.block(0, 0, 0).combine()
+
+    def test_goals(self, board_16x16) -> None:
+        """Test that goals score a grid the same way as the reference board.
+        """
+        grid = BoardGrid.from_block(board_16x16)
+        for colour in COLOUR_LIST:
+            assert BlobGoal(colour).score(grid) == \
+                BlobGoal(colour).score(board_16x16)
+            assert PerimeterGoal(colour).score(grid) == \
+                PerimeterGoal(colour).score(board_16x16)
+
 
 if __name__ == '__main__':
     pytest.main(['example_tests.py'])
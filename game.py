@@ -30,7 +30,7 @@ import pygame
 
 from block import generate_board
 from blocky import GameData, GameState, MainState
-from player import create_players
+from player import create_players, EXHAUSTIVE
 from renderer import Renderer
 from settings import BOARD_SIZE
 
@@ -117,6 +117,13 @@ def create_sample_game() -> Game:
     return Game(3, 1, 1, [6])
 
 
+def create_exhaustive_game() -> Game:
+    """Run a game with one human player against the strongest smart player,
+    which assesses every move it can make.
+    """
+    return Game(3, 1, 0, [EXHAUSTIVE])
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
@@ -137,6 +144,7 @@ if __name__ == '__main__':
 
     # game = create_sample_game()
     # game = create_auto_game()
+    # game = create_exhaustive_game()
     game = create_two_player_game()
     # game = create_solitaire_game()
 
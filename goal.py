@@ -22,10 +22,24 @@ Misha Schwartz, and Jaisie Sin
 This file contains the hierarchy of Goal classes.
 """
 from __future__ import annotations
+from collections import Counter, OrderedDict
 import random
-from typing import List, Tuple
-from block import Block
-from settings import colour_name, COLOUR_LIST
+import sys
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, \
+    Tuple, Union
+from blobs import BlobSummary, leaf_summary, parent_summary
+from block import Block, majority_colour_index, turn_cells
+from grid import BoardGrid
+from persistent import PersistentBoard
+from settings import colour_name, colour_index, COLOUR_LIST, PALETTE, \
+    SCORE_CACHE_BYTES
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional. Without it, goals are scored in pure Python.
+    np = None
 
 
 def generate_goals(num_goals: int) -> List[Goal]:
@@ -60,7 +74,8 @@ def generate_goals(num_goals: int) -> List[Goal]:
     return goal_list
 
 
-def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
+def _flatten(block: Union[Block, BoardGrid]) \
+        -> List[List[Tuple[int, int, int]]]:
     """Return a two-dimensional list representing <block> as rows and columns of
     unit cells.
 
@@ -73,27 +88,431 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
     of the block at the cell location[i][j]
 
     L[0][0] represents the unit cell in the upper left corner of the Block.
+
+    <block> may also be a BoardGrid, whose unit cells are read directly.
+    """
+    if isinstance(block, BoardGrid):
+        return block.flatten()
+
+    return [[PALETTE[cell] for cell in column]
+            for column in block.unit_cells()]
+
+
+def _flatten_indices(grid: BoardGrid) -> Sequence[Sequence[int]]:
+    """Return <grid> as rows and columns of unit cells in the same layout as
+    _flatten, but with each unit cell represented by the index of its colour
+    in PALETTE.
     """
-    flattened_board = []
-    num_col_row = 2 ** (block.max_depth - block.level)
-    for i in range(num_col_row):
-        flattened_board.append([])
-    if block.children == []:
-        for i in range(num_col_row):
-            j = 0
-            while j < num_col_row:
-                flattened_board[i].append(block.colour)
-                j += 1
+    n = 2 ** grid.max_depth
+    return [list(grid.cells[x * n:(x + 1) * n]) for x in range(n)]
+
+
+def _flatten_array(board: Union[Block, BoardGrid]) -> Any:
+    """Return <board> as a NumPy array of unit cells in the same layout as
+    _flatten_indices, where array[i, j] is the PALETTE index of the colour of
+    the unit cell at column i and row j.
+
+    The array has dtype uint8. A Block is read from its cell buffers, so a
+    Block that is a view of a BoardGrid's buffers is not flattened at all.
+
+    Precondition: NumPy is installed.
+    """
+    return _stack_boards([board])[0]
+
+
+# The column and row, in units of half a block, of the upper left unit cell of
+# each child of a block, in the order of Block.children. A MoveScorer finds
+# where a block is from these.
+_QUADRANTS = ((1, 0), (0, 0), (0, 1), (1, 1))
+
+
+def _perimeter_scores_tree(board: Union[Block, PersistentBoard]) \
+        -> Dict[int, int]:
+    """Return the PerimeterGoal score on <board> of every colour index that
+    has one.
+
+    Only the blocks that touch an edge of <board> are visited. A leaf block
+    that is k unit cells across adds k for every edge it touches, so a corner
+    cell, which lies on two edges, is counted twice.
+    """
+    if isinstance(board, Block):
+        side = 2 ** (board.max_depth - board.level)
+        stack = [(board, side, _ALL_EDGES)]
     else:
-        for i in range(num_col_row // 2):
-            flattened_board[i].extend(_flatten(block.children[1])[i])
-            flattened_board[num_col_row // 2 + i] \
-                .extend(_flatten(block.children[0])[i])
-            flattened_board[i].extend(_flatten(block.children[2])[i])
-            flattened_board[num_col_row // 2 + i] \
-                .extend(_flatten(block.children[3])[i])
+        stack = [(board.root(), 2 ** board.max_depth, _ALL_EDGES)]
+
+    scores = {}
+    while stack:
+        block, side, edges = stack.pop()
+        children = _tree_children(block)
+        if len(children) == 0:
+            scores[block.colour_index] = scores.get(block.colour_index, 0) \
+                + side * _EDGE_COUNTS[edges]
+            continue
+
+        for child, child_edges in zip(children, _CHILD_EDGES):
+            if edges & child_edges:
+                stack.append((child, side // 2, edges & child_edges))
+    return scores
+
+
+def _perimeter_scores_grid(grid: BoardGrid) -> Dict[int, int]:
+    """Return the PerimeterGoal score on <grid> of every colour index that has
+    one, reading only the unit cells on its edges.
+    """
+    n = 2 ** grid.max_depth
+    cells = grid.cells
+    scores = Counter(cells[:n])
+    for edge in (cells[-n:], cells[::n], cells[n - 1::n]):
+        scores.update(edge)
+    return scores
+
+
+# The edges of the board that a block may touch, as bits of an int.
+_TOP, _BOTTOM, _LEFT, _RIGHT = 1, 2, 4, 8
+_ALL_EDGES = _TOP | _BOTTOM | _LEFT | _RIGHT
+
+# The edges of its parent that each child of a block touches, in the order of
+# Block.children.
+_CHILD_EDGES = (_TOP | _RIGHT, _TOP | _LEFT, _BOTTOM | _LEFT, _BOTTOM | _RIGHT)
+
+# The number of edges in each combination of edges.
+_EDGE_COUNTS = [bin(edges).count('1') for edges in range(_ALL_EDGES + 1)]
+
+
+def _board_edges(board: Block, block: Block) -> int:
+    """Return the edges of <board> that <block>, which is in <board>,
+    touches.
+    """
+    edges = _ALL_EDGES
+    for i in block.path()[board.level:]:
+        edges &= _CHILD_EDGES[i]
+    return edges
 
-    return flattened_board
+
+def _side_counts(block: Block, target: int) -> List[int]:
+    """Return the number of unit cells of colour index <target> along the top,
+    bottom, left and right sides of <block>, in that order.
+    """
+    counts = [0, 0, 0, 0]
+    stack = [(block, 2 ** (block.max_depth - block.level), _ALL_EDGES)]
+    while stack:
+        block, side, edges = stack.pop()
+        children = block.children
+        if len(children) == 0:
+            if block.colour_index == target:
+                for k, edge in enumerate(_EDGES):
+                    if edges & edge:
+                        counts[k] += side
+            continue
+
+        for child, child_edges in zip(children, _CHILD_EDGES):
+            if edges & child_edges:
+                stack.append((child, side // 2, edges & child_edges))
+    return counts
+
+
+def _arranged_counts(child_counts: List[List[int]],
+                     order: Tuple[int, int, int, int]) -> List[int]:
+    """Return the result of _side_counts for a block whose children are the
+    children with the side counts <child_counts> in the order <order>.
+    """
+    upper_right, upper_left, lower_left, lower_right = \
+        [child_counts[i] for i in order]
+    return [upper_right[0] + upper_left[0], lower_left[1] + lower_right[1],
+            upper_left[2] + lower_left[2], upper_right[3] + lower_right[3]]
+
+
+# The edges in the order of the result of _side_counts.
+_EDGES = (_TOP, _BOTTOM, _LEFT, _RIGHT)
+
+# For each rotation, the side of a block, as an index into the result of
+# _side_counts, that each side of the block comes from.
+_ROTATED_SIDES = {1: (2, 3, 1, 0), 3: (3, 2, 0, 1)}
+
+# For each swap, the children of a block, in the order of Block.children,
+# that end up at each index.
+_SWAPPED_CHILDREN = {0: (1, 0, 3, 2), 1: (3, 2, 1, 0)}
+
+
+def _largest_blobs_array(cells: Any, target: int) -> Any:
+    """Return the size of the largest blob of colour index <target> on each
+    board in <cells>, a NumPy array of the unit cells of one or more boards
+    of the same size, each as returned by _flatten_array.
+
+    Every unit cell of the target colour is numbered, and starts labelled with
+    its own number. Each round, the label of every pair of neighbouring cells
+    of the target colour is pointed at the smaller of their labels, and then
+    every label is replaced by the label it points at until none changes.
+    When every pair of neighbours has the same label, the cells of each blob
+    share a label.
+    """
+    boards, n = cells.shape[0], cells.shape[1]
+    matches = cells == target
+    if not matches.any():
+        return np.zeros(boards, dtype=np.int64)
+
+    # Number only the cells of the target colour, so that the rounds below
+    # only look at them.
+    flat_matches = matches.ravel()
+    indices = (np.cumsum(flat_matches, dtype=np.int32) - 1).reshape(
+        cells.shape)
+    across = matches[:, :-1, :] & matches[:, 1:, :]
+    down = matches[:, :, :-1] & matches[:, :, 1:]
+    firsts = np.concatenate((indices[:, :-1, :][across],
+                             indices[:, :, :-1][down]))
+    seconds = np.concatenate((indices[:, 1:, :][across],
+                              indices[:, :, 1:][down]))
+
+    labels = np.arange(int(flat_matches.sum()), dtype=np.int32)
+    while True:
+        first_labels, second_labels = labels[firsts], labels[seconds]
+        if np.array_equal(first_labels, second_labels):
+            break
+        smaller = np.minimum(first_labels, second_labels)
+        np.minimum.at(labels, first_labels, smaller)
+        np.minimum.at(labels, second_labels, smaller)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+    # Count the cells of each blob, and give each board its largest count.
+    counts = np.bincount(labels, minlength=len(labels))
+    board_of = np.nonzero(flat_matches)[0] // (n * n)
+    largest = np.zeros(boards, dtype=np.int64)
+    np.maximum.at(largest, board_of, counts)
+    return largest
+
+
+def _perimeter_scores_array(cells: Any, target: int) -> Any:
+    """Return the PerimeterGoal score for colour index <target> on each board
+    in <cells>, a NumPy array of the unit cells of one or more boards of the
+    same size, each as returned by _flatten_array.
+
+    A corner cell lies on two edges, so adding up the four edges counts it
+    twice.
+    """
+    matches = cells == target
+    return matches[:, 0, :].sum(axis=1) + matches[:, -1, :].sum(axis=1) \
+        + matches[:, :, 0].sum(axis=1) + matches[:, :, -1].sum(axis=1)
+
+
+def _stack_boards(boards: List[Union[Block, BoardGrid]]) -> Any:
+    """Return the unit cells of <boards>, which all have the same number of
+    unit cells, as one NumPy array, where array[k] is the result of
+    _flatten_array for boards[k].
+
+    Precondition: NumPy is installed.
+    """
+    n = _cells_across(boards[0])
+    cells = b''.join(board.cell_buffers()[0] if isinstance(board, Block)
+                     else bytes(board.cells) for board in boards)
+    return np.frombuffer(cells, dtype=np.uint8).reshape(len(boards), n, n)
+
+
+def _cells_across(board: Union[Block, BoardGrid]) -> int:
+    """Return the number of unit cells across <board>.
+    """
+    level = board.level if isinstance(board, Block) else 0
+    return 2 ** (board.max_depth - level)
+
+
+def _tree_children(block: Any) -> Sequence[Any]:
+    """Return the children of <block>, which is a Block or a block of a
+    PersistentBoard, in the order of Block.children.
+    """
+    if isinstance(block, Block):
+        return block.children
+    return block.true_children()
+
+
+def _summary_with(board: Block, block: Block,
+                  summary: BlobSummary) -> BlobSummary:
+    """Return the blob summary <board> would have if <block>, which is in
+    <board>, had the blob summary <summary>.
+    """
+    path = block.path()[board.level:]
+    ancestors = [board]
+    for i in path[:-1]:
+        ancestors.append(ancestors[-1].children[i])
+
+    for ancestor, i in zip(reversed(ancestors), reversed(path)):
+        summaries = [child.blob_summary() for child in ancestor.children]
+        summaries[i] = summary
+        summary = parent_summary(summaries)
+    return summary
+
+
+class ScoreCache:
+    """A cache of goal scores that uses at most a given amount of memory.
+
+    When the cache is full, the score that was used least recently is removed
+    to make room for a new one.
+
+    === Public Attributes ===
+    max_bytes:
+        The most memory, in bytes, that the cached scores may use.
+    hits:
+        The number of times a score was found in the cache.
+    misses:
+        The number of times a score was not found in the cache.
+    """
+    # === Private Attributes ===
+    # _scores:
+    #   The cached scores, with the most recently used score last.
+    # _bytes:
+    #   The memory used by the cached scores, in bytes.
+    # _lock:
+    #   Held while the cache is used, so that players searching in the
+    #   background can share it.
+    max_bytes: int
+    hits: int
+    misses: int
+    _scores: OrderedDict[Hashable, int]
+    _bytes: int
+    _lock: threading.Lock
+
+    def __init__(self, max_bytes: int) -> None:
+        """Initialize this empty cache, which may use up to <max_bytes> bytes.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of scores in this cache.
+        """
+        return len(self._scores)
+
+    def nbytes(self) -> int:
+        """Return the memory used by the scores in this cache, in bytes.
+        """
+        return self._bytes
+
+    def get(self, key: Hashable) -> Optional[int]:
+        """Return the score cached for <key>, or None if there is none.
+        """
+        with self._lock:
+            score = self._scores.get(key)
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._scores.move_to_end(key)
+        return score
+
+    def put(self, key: Hashable, score: int) -> None:
+        """Cache <score> for <key>, removing the least recently used scores if
+        the cache would use more than <max_bytes> bytes.
+        """
+        with self._lock:
+            if key in self._scores:
+                self._scores.move_to_end(key)
+                return
+            self._scores[key] = score
+            self._bytes += _entry_size(key, score)
+            self._shrink()
+
+    def resize(self, max_bytes: int) -> None:
+        """Let this cache use up to <max_bytes> bytes, removing the least
+        recently used scores until it does.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._shrink()
+
+    def _shrink(self) -> None:
+        """Remove the least recently used scores until this cache uses at most
+        <max_bytes> bytes.
+        """
+        while self._bytes > self.max_bytes and self._scores:
+            key, score = self._scores.popitem(last=False)
+            self._bytes -= _entry_size(key, score)
+
+    def clear(self) -> None:
+        """Remove every score from this cache and reset its counters.
+        """
+        with self._lock:
+            self._scores.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+def _entry_size(key: Hashable, score: int) -> int:
+    """Return an estimate of the memory, in bytes, used by caching <score> for
+    <key> in a ScoreCache.
+    """
+    return _owned_size(key) + _owned_size(score) + _ENTRY_OVERHEAD
+
+
+def _owned_size(value: object) -> int:
+    """Return the memory, in bytes, used by <value> and, if it is a tuple, by
+    the values in it.
+
+    Classes, such as the kind of goal in a key, and the small integers that
+    Python keeps one copy of are shared by every entry, so they are not
+    counted.
+    """
+    if isinstance(value, type) or \
+            (type(value) is int and -5 <= value <= 256):
+        return 0
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(_owned_size(item) for item in value)
+    return size
+
+
+# An estimate of the memory used by the OrderedDict for each cached score.
+_ENTRY_OVERHEAD = 100
+
+# The cache shared by every Goal. Change its size with score_cache.resize.
+score_cache = ScoreCache(SCORE_CACHE_BYTES)
+
+
+def _fingerprint(board: Union[Block, BoardGrid, PersistentBoard]) \
+        -> Optional[Tuple[int, int, int]]:
+    """Return a value that identifies the layout of <board>, or None if
+    <board> cannot be identified cheaply.
+    """
+    if isinstance(board, (Block, PersistentBoard)):
+        level = board.level if isinstance(board, Block) else 0
+        return board.max_depth, level, board.zobrist_hash()
+    return None
+
+
+def score_goals(goals: List[Goal],
+                board: Union[Block, BoardGrid, PersistentBoard]) -> List[int]:
+    """Return the score of each goal in <goals> on <board>, in order.
+
+    Goals of the same kind are scored together, so one walk round the
+    perimeter or one blob summary of <board> gives the scores of all of their
+    colours. Like Goal.score, scores are kept in score_cache.
+    """
+    fingerprint = _fingerprint(board)
+    scores = [None] * len(goals)
+    unscored = {}
+    for i, goal in enumerate(goals):
+        if fingerprint is not None:
+            scores[i] = score_cache.get(
+                (type(goal), goal.colour_index, fingerprint))
+        if scores[i] is None:
+            unscored.setdefault(type(goal), []).append(i)
+
+    for kind, indices in unscored.items():
+        colours = [goals[i].colour_index for i in indices]
+        for i, score in zip(indices, goals[indices[0]].score_colours(board,
+                                                                     colours)):
+            scores[i] = score
+            if fingerprint is not None:
+                score_cache.put((kind, goals[i].colour_index, fingerprint),
+                                score)
+    return scores
 
 
 class Goal:
@@ -105,18 +524,110 @@ class Goal:
     colour:
         The target colour for this goal, that is the colour to which
         this goal applies.
+    colour_index:
+        The index of <colour> in PALETTE.
     """
-    colour: Tuple[int, int, int]
+    colour_index: int
 
     def __init__(self, target_colour: Tuple[int, int, int]) -> None:
         """Initialize this goal to have the given target colour.
         """
         self.colour = target_colour
 
+    @property
+    def colour(self) -> Tuple[int, int, int]:
+        """The target colour for this goal.
+        """
+        return PALETTE[self.colour_index]
+
+    @colour.setter
+    def colour(self, colour: Tuple[int, int, int]) -> None:
+        """Set the target colour for this goal to <colour>.
+        """
+        self.colour_index = colour_index(colour)
+
     def score(self, board: Block) -> int:
         """Return the current score for this goal on the given board.
 
         The score is always greater than or equal to 0.
+
+        Scores are kept in score_cache, so scoring a board that has been
+        scored before by the same kind of goal with the same colour does not
+        score it again.
+        """
+        return score_goals([self], board)[0]
+
+    def score_many(self, boards: List[Union[Block, BoardGrid,
+                                            PersistentBoard]]) -> List[int]:
+        """Return the score for this goal on each board in <boards>, in order.
+
+        When NumPy is installed, the Blocks and BoardGrids in <boards> with
+        the same number of unit cells are stacked into one array and scored
+        together, so the cost of going through Python is paid once for all of
+        them. A Block is read from its cell buffers, which a Block that is a
+        view of a BoardGrid's buffers already has, and is not hashed to look
+        for its score in score_cache, since that means reading every block of
+        it. PersistentBoards are scored with score.
+        """
+        scores = [0] * len(boards)
+        batches = {}
+        for i, board in enumerate(boards):
+            if np is not None and isinstance(board, (Block, BoardGrid)):
+                batches.setdefault(_cells_across(board), []).append(i)
+            else:
+                scores[i] = self.score(board)
+
+        for indices in batches.values():
+            cells = _stack_boards([boards[i] for i in indices])
+            for i, score in zip(indices, self._score_arrays(cells)):
+                scores[i] = int(score)
+        return scores
+
+    def score_colours(self, board: Block, colours: List[int]) -> List[int]:
+        """Return the score on the given board of a goal of the same kind as
+        this goal for each colour index in <colours>, without using
+        score_cache.
+        """
+        raise NotImplementedError
+
+    def _score_arrays(self, cells: Any) -> Any:
+        """Return the score for this goal on each board in <cells>, a NumPy
+        array of the unit cells of boards of the same size, each as returned
+        by _flatten_array.
+        """
+        raise NotImplementedError
+
+    def score_delta(self, board: Block,
+                    move: Tuple[str, Optional[int], Block]) -> Optional[int]:
+        """Return how much making <move> on <board> would change the score for
+        this goal, without making the move, or None if the move cannot be
+        made. A paint is made with this goal's colour, as players do.
+
+        Only the block the move is made to, and for a BlobGoal its ancestors,
+        are looked at.
+
+        Preconditions:
+            - the block in <move> is <board> or one of its descendants
+            - <move> is not a smash, which is random
+        """
+        name, direction, block = move
+        if not block.can_apply((name, direction), self.colour):
+            return None
+        if name == 'pass':
+            return 0
+        return self._score_delta(board, name, direction, block)
+
+    def _score_delta(self, board: Block, name: str, direction: Optional[int],
+                     block: Block) -> int:
+        """Return how much making the move <name> with <direction> to <block>
+        would change the score for this goal on <board>.
+
+        Precondition: the move can be made, and is not a pass or a smash.
+        """
+        raise NotImplementedError
+
+    def move_scorer(self, board: Block) -> MoveScorer:
+        """Return a MoveScorer for the moves on <board>, for this goal.
         """
         raise NotImplementedError
 
@@ -137,45 +648,76 @@ class PerimeterGoal(Goal):
     """
     colour: Tuple[int, int, int]
 
-    def score(self, board: Block) -> int:
-        """Return the current score for this goal on the given board.
+    def score_colours(self, board: Block, colours: List[int]) -> List[int]:
+        """Return the score on the given board for each colour in <colours>.
            The score for perimeter goal is calculated by counting the
            total number of blocks located on the perimeter of board
            that are of the target colour of this goal. Blocks on the corner of
            board count twice towards the score.
            The score is always greater than or equal to 0.
+
+           Only the blocks on the perimeter of board are looked at, once for
+           all of the colours, so the board is not flattened.
+        """
+        if isinstance(board, BoardGrid):
+            scores = _perimeter_scores_grid(board)
+        else:
+            scores = _perimeter_scores_tree(board)
+        return [scores.get(colour, 0) for colour in colours]
+
+    def _score_arrays(self, cells: Any) -> Any:
+        """Return the score for this goal on each board in <cells>, a NumPy
+        array of the unit cells of boards of the same size, each as returned
+        by _flatten_array.
         """
-        flattened_board = _flatten(board)
-        points = 0
-        if len(flattened_board) == 1:
-            if flattened_board[0][0] == self.colour:
-                points += 4
-                return points
-
-        for i in range(len(flattened_board) - 2):
-            if flattened_board[i + 1][0] == self.colour:
-                points += 1
-            if flattened_board[i + 1][-1] == self.colour:
-                points += 1
-
-        for i in range(len(flattened_board[0])):
-            if flattened_board[0][i] == self.colour:
-                if i in (0, len(flattened_board[0]) - 1):
-                    points += 2
-                else:
-                    points += 1
-
-        for i in range(len(flattened_board[-1])):
-            if flattened_board[-1][i] == self.colour:
-                if i in (0, len(flattened_board[-1]) - 1):
-                    points += 2
-                else:
-                    points += 1
-
-        if points < 0:
-            points = 0
-
-        return points
+        return _perimeter_scores_array(cells, self.colour_index)
+
+    def _score_delta(self, board: Block, name: str, direction: Optional[int],
+                     block: Block) -> int:
+        """Return how much making the move <name> with <direction> to <block>
+        would change the score for this goal on <board>.
+
+        Only the unit cells along the sides of <block> that are on the
+        perimeter of <board> count. A rotate or swap only moves those sides
+        around, and a paint or combine only recolours <block>.
+
+        Precondition: the move can be made, and is not a pass or a smash.
+        """
+        edges = _board_edges(board, block)
+        if edges == 0:
+            return 0
+
+        if name == 'paint':
+            # The unit cell is painted this goal's colour, which it was not.
+            return _EDGE_COUNTS[edges]
+
+        target = self.colour_index
+
+        if name == 'rotate':
+            before = _side_counts(block, target)
+            after = [before[k] for k in _ROTATED_SIDES[direction]]
+        elif name == 'swap':
+            child_counts = [_side_counts(child, target)
+                            for child in block.children]
+            before = _arranged_counts(child_counts, (0, 1, 2, 3))
+            after = _arranged_counts(child_counts,
+                                     _SWAPPED_CHILDREN[direction])
+        else:  # name == 'combine'
+            before = _side_counts(block, target)
+            side = 2 ** (block.max_depth - block.level)
+            majority = majority_colour_index(
+                [child.colour_index for child in block.children])
+            after = [side if majority == target else 0] * 4
+
+        return sum(after[k] - before[k] for k, edge in enumerate(_EDGES)
+                   if edges & edge)
+
+    def move_scorer(self, board: Block) -> MoveScorer:
+        """Return a MoveScorer for the moves on <board>, for this goal.
+
+        Only the unit cells on the edges of <board> are read for each move.
+        """
+        return _PerimeterScorer(self, board)
 
     def description(self) -> str:
         """Return a description of this goal.
@@ -196,14 +738,76 @@ class BlobGoal(Goal):
     """
     colour: Tuple[int, int, int]
 
-    def score(self, board: Block) -> int:
-        """Return the current score for this goal on the given board.
+    def score_colours(self, board: Block, colours: List[int]) -> List[int]:
+        """Return the score on the given board for each colour in <colours>.
            The score for blob goal is calculated by counting the
            total number of blocks in the biggest blob of blocks of the target
            colour. Only blocks that share a side are considered to be part of
            the same blob. The score is always greater than or equal to 0.
+
+           A Block or PersistentBoard keeps a summary of its blobs that is
+           brought up to date after each move, so it is not flattened.
+        """
+        if not isinstance(board, BoardGrid):
+            summary = board.blob_summary()
+            return [summary.largest(colour) for colour in colours]
+        if np is not None:
+            cells = _flatten_array(board)[np.newaxis]
+            return [int(_largest_blobs_array(cells, colour)[0])
+                    for colour in colours]
+
+        flattened_board = _flatten_indices(board)
+        return [BlobGoal(PALETTE[colour])._largest_blob(flattened_board)
+                for colour in colours]
+
+    def _score_arrays(self, cells: Any) -> Any:
+        """Return the score for this goal on each board in <cells>, a NumPy
+        array of the unit cells of boards of the same size, each as returned
+        by _flatten_array.
+        """
+        return _largest_blobs_array(cells, self.colour_index)
+
+    def _score_delta(self, board: Block, name: str, direction: Optional[int],
+                     block: Block) -> int:
+        """Return how much making the move <name> with <direction> to <block>
+        would change the score for this goal on <board>.
+
+        The blob summary <block> would have after the move is made from the
+        summaries it and its children already have, and then the summaries of
+        its ancestors are made again from it, without changing <board>.
+
+        Precondition: the move can be made, and is not a pass or a smash.
+        """
+        side = 2 ** (block.max_depth - block.level)
+        if name == 'rotate':
+            summary = block.blob_summary().turned(direction)
+        elif name == 'swap':
+            children = block.children
+            summary = parent_summary(
+                [children[i].blob_summary()
+                 for i in _SWAPPED_CHILDREN[direction]])
+        elif name == 'paint':
+            summary = leaf_summary(side, self.colour_index)
+        else:  # name == 'combine'
+            summary = leaf_summary(side, majority_colour_index(
+                [child.colour_index for child in block.children]))
+
+        return _summary_with(board, block, summary).largest(
+            self.colour_index) - board.blob_summary().largest(self.colour_index)
+
+    def move_scorer(self, board: Block) -> MoveScorer:
+        """Return a MoveScorer for the moves on <board>, for this goal.
+
+        The unit cells of <board> are labelled with their blobs once, so each
+        move is then scored from the unit cells it changes and the blobs
+        around them.
+        """
+        return _BlobScorer(self, board)
+
+    def _largest_blob(self, flattened_board: Sequence[Sequence[int]]) -> int:
+        """Return the size of the largest blob of this goal's target colour in
+        <flattened_board>, as returned by _flatten_indices.
         """
-        flattened_board = _flatten(board)
         visited_board = []
         for i in range(len(flattened_board)):
             visited_board.append([])
@@ -225,7 +829,7 @@ class BlobGoal(Goal):
         return max(all_blob_scores)
 
     def _undiscovered_blob_size(self, pos: Tuple[int, int],
-                                board: List[List[Tuple[int, int, int]]],
+                                board: Sequence[Sequence[int]],
                                 visited: List[List[int]]) -> int:
         """Return the size of the largest connected blob that (a) is of this
         Goal's target colour, (b) includes the cell at <pos>, and (c) involves
@@ -233,7 +837,8 @@ class BlobGoal(Goal):
 
         If <pos> is out of bounds for <board>, return 0.
 
-        <board> is the flattened board on which to search for the blob.
+        <board> is the flattened board on which to search for the blob, as
+        returned by _flatten_indices.
         <visited> is a parallel structure that, in each cell, contains:
             -1 if this cell has never been visited
             0  if this cell has been visited and discovered
@@ -244,30 +849,33 @@ class BlobGoal(Goal):
         Update <visited> so that all cells that are visited are marked with
         either 0 or 1.
         """
-        blob_size = 1
-
-        if pos[0] >= len(board) or pos[1] >= len(board) or pos[0] < 0 \
-                or pos[1] < 0:
+        x, y = pos
+        if x >= len(board) or y >= len(board) or x < 0 or y < 0:
             return 0
 
-        if visited[pos[0]][pos[1]] != -1:
+        if visited[x][y] != -1:
             return 0
 
-        if board[pos[0]][pos[1]] != self.colour:
-            visited[pos[0]][pos[1]] = 0
+        if board[x][y] != self.colour_index:
+            visited[x][y] = 0
             return 0
 
-        else:
-            visited[pos[0]][pos[1]] = 1
-
-            blob_size += self._undiscovered_blob_size((pos[0], pos[1] + 1),
-                                                      board, visited)
-            blob_size += self._undiscovered_blob_size((pos[0], pos[1] - 1),
-                                                      board, visited)
-            blob_size += self._undiscovered_blob_size((pos[0] + 1, pos[1]),
-                                                      board, visited)
-            blob_size += self._undiscovered_blob_size((pos[0] - 1, pos[1]),
-                                                      board, visited)
+        # The cells of the blob are searched with an explicit stack, so a
+        # blob of any size uses no more Python stack than a single cell.
+        visited[x][y] = 1
+        blob_size = 0
+        stack = [pos]
+        while stack:
+            x, y = stack.pop()
+            blob_size += 1
+            for i, j in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+                if 0 <= i < len(board) and 0 <= j < len(board) \
+                        and visited[i][j] == -1:
+                    if board[i][j] == self.colour_index:
+                        visited[i][j] = 1
+                        stack.append((i, j))
+                    else:
+                        visited[i][j] = 0
 
         return blob_size
 
@@ -278,13 +886,373 @@ class BlobGoal(Goal):
                colour_name(self.colour) + ' blocks.'
 
 
+class MoveScorer:
+    """Works out the score for a goal on a board after each of many moves,
+    without making the moves.
+
+    The unit cells of the board are read once, so that each move is scored
+    from the unit cells of the one block it changes. A paint may be made with
+    any colour, as the other players paint with theirs. The board must not
+    change while this scorer is used.
+
+    This is an abstract class. Only child classes should be instantiated.
+
+    === Public Attributes ===
+    goal:
+        The goal whose score is worked out.
+    board:
+        The board the moves are made on.
+    score:
+        The score for <goal> on <board>.
+    """
+    # === Private Attributes ===
+    # _side:
+    #   The number of unit cells across <board>.
+    # _cells:
+    #   The PALETTE index of the colour of each unit cell of <board>, column
+    #   by column.
+    # _origins:
+    #   For each block in <board> whose moves have been scored, keyed by its
+    #   id, the column and row of its upper left unit cell.
+    goal: Goal
+    board: Block
+    score: int
+    _side: int
+    _cells: List[int]
+    _origins: Dict[int, Tuple[int, int]]
+
+    def __init__(self, goal: Goal, board: Block) -> None:
+        """Initialize this scorer of the moves on <board> for <goal>.
+        """
+        self.goal = goal
+        self.board = board
+        self.score = 0
+        self._side = 2 ** (board.max_depth - board.level)
+        self._cells = [cell for column in board.unit_cells()
+                       for cell in column]
+        self._origins = {}
+
+    def score_after(self, move: Tuple[str, Optional[int], Block],
+                    colour: Tuple[int, int, int]) -> int:
+        """Return the score after <move> is made, painting with <colour>.
+
+        Preconditions:
+            - <move> can be made with <colour>
+            - <move> is not a smash, which is random
+        """
+        raise NotImplementedError
+
+    def bounds(self, move: Tuple[str, Optional[int], Block],
+               colour: Tuple[int, int, int]) -> Tuple[int, int]:
+        """Return the lowest and the highest that the score after <move> can
+        be, painting with <colour>. They may be found more cheaply than the
+        score itself, and are often far enough from the best score found so
+        far that <move> does not need to be scored.
+
+        By default, both are the score after <move>.
+
+        Preconditions:
+            - <move> can be made with <colour>
+            - <move> is not a smash, which is random
+        """
+        score = self.score_after(move, colour)
+        return score, score
+
+    def _origin(self, block: Block) -> Tuple[int, int]:
+        """Return the column and row of the upper left unit cell of <block>,
+        which is in <board>.
+        """
+        if id(block) not in self._origins:
+            x = y = 0
+            half = self._side
+            for i in block.path()[self.board.level:]:
+                half //= 2
+                x += _QUADRANTS[i][0] * half
+                y += _QUADRANTS[i][1] * half
+            self._origins[id(block)] = (x, y)
+        return self._origins[id(block)]
+
+    @staticmethod
+    def _new_cells(move: Tuple[str, Optional[int], Block],
+                   colour: Tuple[int, int, int]) -> Sequence[Sequence[int]]:
+        """Return the unit cells of the block <move> is made to, column by
+        column, after the move is made, painting with <colour>.
+        """
+        name, direction, block = move
+        if name == 'rotate':
+            return turn_cells(block.unit_cells(), direction)
+        elif name == 'swap':
+            upper_right, upper_left, lower_left, lower_right = \
+                [block.children[i].unit_cells()
+                 for i in _SWAPPED_CHILDREN[direction]]
+            return [upper_left[i] + lower_left[i]
+                    for i in range(len(upper_left))] + \
+                [upper_right[i] + lower_right[i]
+                 for i in range(len(upper_right))]
+        elif name == 'paint':
+            return ((colour_index(colour),),)
+        else:  # name == 'combine'
+            side = 2 ** (block.max_depth - block.level)
+            return ((majority_colour_index(
+                [child.colour_index for child in block.children]),) * side,) \
+                * side
+
+
+class _PerimeterScorer(MoveScorer):
+    """A MoveScorer for a PerimeterGoal.
+
+    Only the unit cells of the block that lie on the board's edges count, so
+    a block away from the edges is not looked at.
+    """
+
+    def __init__(self, goal: Goal, board: Block) -> None:
+        """Initialize this scorer of the moves on <board> for <goal>.
+        """
+        MoveScorer.__init__(self, goal, board)
+        n = self._side
+        cells = self._cells
+        target = goal.colour_index
+        self.score = cells[:n].count(target) + \
+            cells[(n - 1) * n:].count(target) + \
+            cells[::n].count(target) + cells[n - 1::n].count(target)
+
+    def score_after(self, move: Tuple[str, Optional[int], Block],
+                    colour: Tuple[int, int, int]) -> int:
+        """Return the score after <move> is made, painting with <colour>.
+
+        Preconditions:
+            - <move> can be made with <colour>
+            - <move> is not a smash, which is random
+        """
+        block = move[2]
+        if move[0] == 'pass':
+            return self.score
+        x0, y0 = self._origin(block)
+        side = 2 ** (block.max_depth - block.level)
+        n = self._side
+        if x0 != 0 and y0 != 0 and x0 + side != n and y0 + side != n:
+            return self.score
+
+        new_cells = self._new_cells(move, colour)
+        cells = self._cells
+        target = self.goal.colour_index
+        delta = 0
+        if y0 == 0:
+            delta += [column[0] for column in new_cells].count(target) - \
+                cells[x0 * n:(x0 + side) * n:n].count(target)
+        if y0 + side == n:
+            delta += [column[-1] for column in new_cells].count(target) - \
+                cells[x0 * n + n - 1:(x0 + side) * n:n].count(target)
+        if x0 == 0:
+            delta += new_cells[0].count(target) - \
+                cells[y0:y0 + side].count(target)
+        if x0 + side == n:
+            delta += new_cells[-1].count(target) - \
+                cells[(n - 1) * n + y0:(n - 1) * n + y0 + side].count(target)
+        return self.score + delta
+
+
+class _BlobScorer(MoveScorer):
+    """A MoveScorer for a BlobGoal.
+
+    The unit cells of the board are labelled with their blobs once. A move
+    only changes the unit cells of one block, so blobs that do not reach the
+    block or the unit cells beside it keep their sizes, and only the unit
+    cells of the blobs that do are searched again.
+    """
+    # === Private Attributes ===
+    # _labels:
+    #   The number of the blob each unit cell is in, or -1 if the unit cell
+    #   is not the goal's colour.
+    # _blobs:
+    #   The unit cells of each blob, as indices into <_cells>.
+    # _by_size:
+    #   The numbers of the blobs, largest first.
+    # _touching:
+    #   For each block whose moves have been scored, keyed by its id, the
+    #   result of _block_touching.
+    _labels: List[int]
+    _blobs: List[List[int]]
+    _by_size: List[int]
+    _touching: Dict[int, Tuple[int, Set[int], int, int, int]]
+
+    def __init__(self, goal: Goal, board: Block) -> None:
+        """Initialize this scorer of the moves on <board> for <goal>, and
+        label the unit cells of <board> with their blobs.
+        """
+        MoveScorer.__init__(self, goal, board)
+        self._labels = [-1] * len(self._cells)
+        self._blobs = []
+        self._touching = {}
+        cells, labels, target = self._cells, self._labels, goal.colour_index
+
+        def visit(k: int) -> bool:
+            if cells[k] == target and labels[k] == -1:
+                labels[k] = len(self._blobs)
+                return True
+            return False
+
+        for start in range(len(cells)):
+            if cells[start] == target and labels[start] == -1:
+                labels[start] = len(self._blobs)
+                self._blobs.append(self._search([start], visit))
+        self._by_size = sorted(range(len(self._blobs)),
+                               key=lambda b: -len(self._blobs[b]))
+        if self._blobs:
+            self.score = len(self._blobs[self._by_size[0]])
+
+    def _search(self, members: List[int], visit: Any) -> List[int]:
+        """Add to <members> every unit cell joined to one of them through
+        unit cells that <visit> returns True for, and return <members>.
+
+        <visit> is called once for each unit cell it returns True for, so it
+        must mark the unit cells it has seen.
+        """
+        n = self._side
+        for k in members:
+            x, y = divmod(k, n)
+            if y > 0 and visit(k - 1):
+                members.append(k - 1)
+            if y < n - 1 and visit(k + 1):
+                members.append(k + 1)
+            if x > 0 and visit(k - n):
+                members.append(k - n)
+            if x < n - 1 and visit(k + n):
+                members.append(k + n)
+        return members
+
+    def score_after(self, move: Tuple[str, Optional[int], Block],
+                    colour: Tuple[int, int, int]) -> int:
+        """Return the score after <move> is made, painting with <colour>.
+
+        Preconditions:
+            - <move> can be made with <colour>
+            - <move> is not a smash, which is random
+        """
+        if move[0] == 'pass':
+            return self.score
+        touching, low, high = self._change(move, colour)
+        if low == high:
+            return low
+
+        # Search the unit cells that may now be joined: those of the blobs
+        # that reach the block, outside it, and the block's new unit cells of
+        # the goal's colour.
+        new_cells = self._new_cells(move, colour)
+        x0, y0 = self._origin(move[2])
+        side = len(new_cells)
+        n = self._side
+        region = set()
+        for blob in touching:
+            region.update(k for k in self._blobs[blob]
+                          if not (x0 <= k // n < x0 + side and
+                                  y0 <= k % n < y0 + side))
+        target = self.goal.colour_index
+        for i, column in enumerate(new_cells):
+            for j, cell in enumerate(column):
+                if cell == target:
+                    region.add((x0 + i) * n + y0 + j)
+
+        def visit(k: int) -> bool:
+            if k in region:
+                region.remove(k)
+                return True
+            return False
+
+        largest = low
+        while region:
+            largest = max(largest, len(self._search([region.pop()], visit)))
+        return largest
+
+    def bounds(self, move: Tuple[str, Optional[int], Block],
+               colour: Tuple[int, int, int]) -> Tuple[int, int]:
+        """Return the lowest and the highest that the score after <move> can
+        be, painting with <colour>.
+
+        The lowest is the size of the largest blob that does not reach the
+        block the move is made to. The highest adds up the sizes of all the
+        blobs that do, as if the move joined them all.
+
+        Preconditions:
+            - <move> can be made with <colour>
+            - <move> is not a smash, which is random
+        """
+        if move[0] == 'pass':
+            return self.score, self.score
+        return self._change(move, colour)[1:]
+
+    def _change(self, move: Tuple[str, Optional[int], Block],
+                colour: Tuple[int, int, int]) -> Tuple[Set[int], int, int]:
+        """Return the blobs that reach the block <move> is made to or the unit
+        cells beside it, and the lowest and the highest the score after the
+        move can be.
+        """
+        name, _, block = move
+        old_count, touching, total, low, high = self._block_touching(block)
+        if name in ('rotate', 'swap'):
+            if high == -1:
+                # The block is all or none of the goal's colour, so moving its
+                # unit cells around changes nothing.
+                return touching, self.score, self.score
+            return touching, low, high
+        new_count = sum(column.count(self.goal.colour_index)
+                        for column in self._new_cells(move, colour))
+        return touching, low, max(low, total - old_count + new_count)
+
+    def _block_touching(self, block: Block) \
+            -> Tuple[int, Set[int], int, int, int]:
+        """Return the number of unit cells of <block> of the goal's colour, the
+        blobs that reach <block> or the unit cells beside it, the number of
+        unit cells in those blobs, the size of the largest blob that does not,
+        and the highest the score can be after a rotate or swap of <block>.
+
+        That highest score is -1 if a rotate or swap cannot change the score.
+        """
+        if id(block) in self._touching:
+            return self._touching[id(block)]
+
+        n = self._side
+        x0, y0 = self._origin(block)
+        side = 2 ** (block.max_depth - block.level)
+        labels = self._labels
+        touching = set()
+        count = 0
+        for x in range(x0, x0 + side):
+            for label in labels[x * n + y0:x * n + y0 + side]:
+                if label != -1:
+                    touching.add(label)
+                    count += 1
+        beside = []
+        for i in range(side):
+            if x0 > 0:
+                beside.append((x0 - 1) * n + y0 + i)
+            if x0 + side < n:
+                beside.append((x0 + side) * n + y0 + i)
+            if y0 > 0:
+                beside.append((x0 + i) * n + y0 - 1)
+            if y0 + side < n:
+                beside.append((x0 + i) * n + y0 + side)
+        touching.update(labels[k] for k in beside if labels[k] != -1)
+
+        total = sum(len(self._blobs[blob]) for blob in touching)
+        low = 0
+        for blob in self._by_size:
+            if blob not in touching:
+                low = len(self._blobs[blob])
+                break
+        high = -1 if count in (0, side * side) else max(low, total)
+        self._touching[id(block)] = (count, touching, total, low, high)
+        return self._touching[id(block)]
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'doctest', 'python_ta', 'random', 'typing', 'blobs', 'block',
+            'settings', 'math', '__future__', 'grid', 'persistent',
+            'collections', 'sys', 'numpy', 'threading'
         ],
         'max-attributes': 15
     })
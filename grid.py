@@ -0,0 +1,452 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the BoardGrid class, a copy of a Blocky board stored as
+flat buffers, and the GridBlock class, which names one block of a BoardGrid
+so that moves can be made to it.
+
+A BoardGrid stores the board at the resolution of its unit cells. Every unit
+cell holds the PALETTE index of its colour and the level of the leaf block
+that covers it. Together these describe the same board as a tree of Blocks.
+
+The game itself is played on Blocks, which can be views of a copy of a
+BoardGrid's buffers: a Block reads its colour and children from the buffers
+until it or one of its descendants changes. A change to a BoardGrid is not
+seen by the Blocks made from it, nor a change to a Block by its grid.
+BoardGrids are used where flat buffers are cheaper than a tree: to send a
+board to other processes, and to score many boards at once with
+Goal.score_many.
+"""
+from __future__ import annotations
+from typing import List, Optional, Tuple
+import math
+import random
+
+from block import Block, board_from_buffers, majority_colour_index
+from settings import COLOUR_LIST, PALETTE, colour_index
+
+
+class BoardGrid:
+    """A Blocky board stored as a grid of unit cells.
+
+    Cells are stored column by column: the cell in column x and row y is at
+    index x * 2^max_depth + y of <cells> and <levels>, which matches the
+    order of goal._flatten.
+
+    A block of the board is named by its level and by its column and row at
+    that level. For example, the block at level 1, column 1, row 0 is the
+    upper-right child of the whole board.
+
+    === Public Attributes ===
+    max_depth:
+        The deepest level allowed in the board.
+    size:
+        The height and width of the board, in pixels.
+    cells:
+        The PALETTE index of the colour of every unit cell.
+    levels:
+        The level of the leaf block that covers every unit cell.
+
+    === Representation Invariants ===
+    - len(cells) == len(levels) == 4 ** max_depth
+    - every cell covered by the same leaf block has the same colour and level
+    - every leaf block covers exactly the cells of a block at its level
+    """
+    max_depth: int
+    size: int
+    cells: bytearray
+    levels: bytearray
+
+    def __init__(self, max_depth: int, size: int,
+                 cells: Optional[bytearray] = None,
+                 levels: Optional[bytearray] = None) -> None:
+        """Initialize this grid with the given <max_depth> and <size>.
+
+        If <cells> and <levels> are not given, the board is a single leaf
+        whose colour is COLOUR_LIST[0].
+        """
+        self.max_depth = max_depth
+        self.size = size
+        num_cells = 4 ** max_depth
+        self.cells = bytearray(num_cells) if cells is None else cells
+        self.levels = bytearray(num_cells) if levels is None else levels
+
+    @staticmethod
+    def from_block(block: Block) -> BoardGrid:
+        """Return a new BoardGrid that describes the same board as <block>.
+
+        Precondition: block.level == 0
+        """
+        cells, levels = block.cell_buffers()
+        return BoardGrid(block.max_depth, block.size, bytearray(cells),
+                         bytearray(levels))
+
+    def to_block(self) -> Block:
+        """Return a new tree of Blocks that describes the same board as this
+        grid.
+
+        The Blocks are views of a copy of this grid's buffers, so they are
+        only made as they are read.
+        """
+        return board_from_buffers(self.max_depth, self.size,
+                                  bytes(self.cells), bytes(self.levels))
+
+    def __eq__(self, other: BoardGrid) -> bool:
+        """Return True iff this grid and <other> describe the same board.
+        """
+        return self.max_depth == other.max_depth and \
+            self.size == other.size and \
+            self.cells == other.cells and \
+            self.levels == other.levels
+
+    def create_copy(self) -> BoardGrid:
+        """Return a new BoardGrid that is a copy of this grid.
+        """
+        return BoardGrid(self.max_depth, self.size, self.cells[:],
+                         self.levels[:])
+
+    def flatten(self) -> List[List[Tuple[int, int, int]]]:
+        """Return this board as rows and columns of unit cell colours, in the
+        same format as goal._flatten.
+        """
+        n = 2 ** self.max_depth
+        return [[PALETTE[c] for c in self.cells[x * n:(x + 1) * n]]
+                for x in range(n)]
+
+    def block(self, level: int, i: int, j: int) -> GridBlock:
+        """Return a view of the block at <level>, column <i> and row <j>.
+
+        Preconditions:
+            - 0 <= level <= max_depth
+            - 0 <= i, j < 2 ** level
+            - the block at <level>, <i> and <j> exists in this board
+        """
+        return GridBlock(self, level, i, j)
+
+    def root(self) -> GridBlock:
+        """Return a view of the whole board.
+        """
+        return GridBlock(self, 0, 0, 0)
+
+    # === Cell helpers ===
+
+    def _origin(self, level: int, i: int, j: int) -> int:
+        """Return the index of the upper-left unit cell of the block at
+        <level>, column <i> and row <j>.
+        """
+        side = 2 ** (self.max_depth - level)
+        return i * side * 2 ** self.max_depth + j * side
+
+    def _fill(self, level: int, i: int, j: int, colour: int,
+              leaf_level: int) -> None:
+        """Set every unit cell of the block at <level>, column <i> and row <j>
+        to PALETTE index <colour> and leaf level <leaf_level>.
+        """
+        n = 2 ** self.max_depth
+        side = 2 ** (self.max_depth - level)
+        colours = bytes((colour,)) * side
+        leaf_levels = bytes((leaf_level,)) * side
+        start = self._origin(level, i, j)
+        for x in range(side):
+            k = start + x * n
+            self.cells[k:k + side] = colours
+            self.levels[k:k + side] = leaf_levels
+
+    def is_leaf(self, level: int, i: int, j: int) -> bool:
+        """Return True iff the block at <level>, column <i> and row <j> is not
+        subdivided.
+        """
+        return self.levels[self._origin(level, i, j)] == level
+
+    def colour(self, level: int, i: int, j: int) \
+            -> Optional[Tuple[int, int, int]]:
+        """Return the colour of the block at <level>, column <i> and row <j>,
+        or None if it is subdivided.
+        """
+        origin = self._origin(level, i, j)
+        if self.levels[origin] != level:
+            return None
+        return PALETTE[self.cells[origin]]
+
+    # === Moves ===
+    # Each move takes the same arguments as the Block method of the same name,
+    # after the level, column and row of the block to act on, and returns True
+    # iff the move was performed.
+
+    def smashable(self, level: int, i: int, j: int) -> bool:
+        """Return True iff the block at <level>, column <i> and row <j> can be
+        smashed.
+        """
+        return level != self.max_depth and self.is_leaf(level, i, j)
+
+    def smash(self, level: int, i: int, j: int) -> bool:
+        """Sub-divide the block at <level>, column <i> and row <j> into four
+        randomly generated children, as Block.smash does.
+        """
+        if not self.smashable(level, i, j):
+            return False
+
+        colours = [colour_index(random.choice(COLOUR_LIST)) for _ in range(4)]
+        for k in range(4):
+            di, dj = _CHILD_OFFSETS[k]
+            self._fill(level + 1, 2 * i + di, 2 * j + dj, colours[k],
+                       level + 1)
+        for k in range(4):
+            if random.random() < math.exp(-0.25 * level):
+                di, dj = _CHILD_OFFSETS[k]
+                self.smash(level + 1, 2 * i + di, 2 * j + dj)
+        return True
+
+    def swap(self, level: int, i: int, j: int, direction: int) -> bool:
+        """Swap the children of the block at <level>, column <i> and row <j>.
+        If <direction> is 1, swap vertically. If <direction> is 0, swap
+        horizontally.
+        """
+        if self.is_leaf(level, i, j):
+            return False
+
+        n = 2 ** self.max_depth
+        side = 2 ** (self.max_depth - level)
+        half = side // 2
+        start = self._origin(level, i, j)
+        for buffer in (self.cells, self.levels):
+            if direction == 0:
+                # Exchange the left and right halves, one column at a time.
+                for x in range(half):
+                    left = start + x * n
+                    right = left + half * n
+                    buffer[left:left + side], buffer[right:right + side] = \
+                        buffer[right:right + side], buffer[left:left + side]
+            else:
+                # Exchange the top and bottom halves of every column.
+                for x in range(side):
+                    top = start + x * n
+                    bottom = top + half
+                    buffer[top:top + half], buffer[bottom:bottom + half] = \
+                        buffer[bottom:bottom + half], buffer[top:top + half]
+        return True
+
+    def rotate(self, level: int, i: int, j: int, direction: int) -> bool:
+        """Rotate the block at <level>, column <i> and row <j>. If <direction>
+        is 1, rotate clockwise. If <direction> is 3, rotate counter-clockwise.
+        """
+        if self.is_leaf(level, i, j):
+            return False
+
+        n = 2 ** self.max_depth
+        side = 2 ** (self.max_depth - level)
+        start = self._origin(level, i, j)
+        for buffer in (self.cells, self.levels):
+            old = [buffer[start + x * n:start + x * n + side]
+                   for x in range(side)]
+            for x in range(side):
+                if direction == 1:
+                    # The cell at (y, side - 1 - x) moves to (x, y).
+                    column = bytes(old[y][side - 1 - x] for y in range(side))
+                else:
+                    # The cell at (side - 1 - y, x) moves to (x, y).
+                    column = bytes(old[side - 1 - y][x] for y in range(side))
+                buffer[start + x * n:start + x * n + side] = column
+        return True
+
+    def paint(self, level: int, i: int, j: int,
+              colour: Tuple[int, int, int]) -> bool:
+        """Change the colour of the block at <level>, column <i> and row <j>
+        iff it is at max_depth and its colour is different from <colour>.
+        """
+        if level != self.max_depth:
+            return False
+        origin = self._origin(level, i, j)
+        new_colour = colour_index(colour)
+        if self.cells[origin] == new_colour:
+            return False
+        self.cells[origin] = new_colour
+        return True
+
+    def combine(self, level: int, i: int, j: int) -> bool:
+        """Turn the block at <level>, column <i> and row <j> into a leaf of
+        the majority colour of its children, as Block.combine does.
+        """
+        if level != self.max_depth - 1 or self.is_leaf(level, i, j):
+            return False
+
+        majority = majority_colour_index(
+            [self.cells[self._origin(level + 1, 2 * i + di, 2 * j + dj)]
+             for di, dj in _CHILD_OFFSETS])
+        if majority is None:
+            return False
+
+        self._fill(level, i, j, majority, level)
+        return True
+
+
+class GridBlock:
+    """A view of one block of a BoardGrid, with the attributes and moves of a
+    Block.
+
+    A GridBlock stores nothing about the board itself. Its attributes are
+    read from the grid, and its moves change the grid, so every view of the
+    same grid sees the change. It is not a Block, and cannot be used where
+    the game expects one.
+
+    === Public Attributes ===
+    grid:
+        The board this block is part of.
+    level:
+        The level of this block within the board.
+    """
+    # === Private Attributes ===
+    # _i:
+    #   The column of this block among the blocks at its level.
+    # _j:
+    #   The row of this block among the blocks at its level.
+    __slots__ = ('grid', 'level', '_i', '_j')
+    grid: BoardGrid
+    level: int
+    _i: int
+    _j: int
+
+    def __init__(self, grid: BoardGrid, level: int, i: int, j: int) -> None:
+        """Initialize this view of the block at <level>, column <i> and row
+        <j> of <grid>.
+        """
+        self.grid = grid
+        self.level = level
+        self._i = i
+        self._j = j
+
+    @property
+    def max_depth(self) -> int:
+        """The deepest level allowed in the board.
+        """
+        return self.grid.max_depth
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """The (x, y) coordinates of the upper left corner of this block, in
+        pixels.
+        """
+        return self._geometry()[0]
+
+    @property
+    def size(self) -> int:
+        """The height and width of this block, in pixels.
+        """
+        return self._geometry()[1]
+
+    def _geometry(self) -> Tuple[Tuple[int, int], int]:
+        """Return the position and size of this block, rounded the same way
+        as the positions and sizes of Blocks.
+        """
+        x, y, size = 0, 0, self.grid.size
+        for depth in range(self.level - 1, -1, -1):
+            size = round(size / 2.0)
+            if (self._i >> depth) & 1:
+                x += size
+            if (self._j >> depth) & 1:
+                y += size
+        return (x, y), size
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block, or None if it is subdivided.
+        """
+        return self.grid.colour(self.level, self._i, self._j)
+
+    @property
+    def children(self) -> List[GridBlock]:
+        """Views of the four children of this block, in the same order as the
+        children of a Block, or an empty list if this block is a leaf.
+        """
+        if self.grid.is_leaf(self.level, self._i, self._j):
+            return []
+        return [GridBlock(self.grid, self.level + 1, 2 * self._i + di,
+                          2 * self._j + dj) for di, dj in _CHILD_OFFSETS]
+
+    def __eq__(self, other: GridBlock) -> bool:
+        """Return True iff this block and <other> look the same, with the same
+        descendants.
+        """
+        if self.position != other.position or self.size != other.size or \
+                self.level != other.level or \
+                self.max_depth != other.max_depth or \
+                self.colour != other.colour:
+            return False
+        return all(a == b for a, b in zip(self.children, other.children)) \
+            and len(self.children) == len(other.children)
+
+    def smashable(self) -> bool:
+        """Return True iff this block can be smashed.
+        """
+        return self.grid.smashable(self.level, self._i, self._j)
+
+    def smash(self) -> bool:
+        """Sub-divide this block so that it has four randomly generated
+        children. Return True iff the smash was performed.
+        """
+        return self.grid.smash(self.level, self._i, self._j)
+
+    def swap(self, direction: int) -> bool:
+        """Swap the children of this block. Return True iff the swap was
+        performed.
+        """
+        return self.grid.swap(self.level, self._i, self._j, direction)
+
+    def rotate(self, direction: int) -> bool:
+        """Rotate this block and all its descendants. Return True iff the
+        rotate was performed.
+        """
+        return self.grid.rotate(self.level, self._i, self._j, direction)
+
+    def paint(self, colour: Tuple[int, int, int]) -> bool:
+        """Change this block's colour iff it is at max_depth and its colour is
+        different from <colour>. Return True iff the colour was changed.
+        """
+        return self.grid.paint(self.level, self._i, self._j, colour)
+
+    def combine(self) -> bool:
+        """Turn this block into a leaf based on the majority colour of its
+        children. Return True iff this block was turned into a leaf.
+        """
+        return self.grid.combine(self.level, self._i, self._j)
+
+    def create_copy(self) -> GridBlock:
+        """Return a view of the same block in a copy of the grid.
+        """
+        return GridBlock(self.grid.create_copy(), self.level, self._i,
+                         self._j)
+
+
+# The column and row offsets of the children of a block, in the order of the
+# children of a Block: upper-right, upper-left, lower-left, lower-right.
+_CHILD_OFFSETS = ((1, 0), (0, 0), (0, 1), (1, 1))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'block', 'settings'
+        ],
+        'max-attributes': 15
+    })
@@ -0,0 +1,352 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the PersistentBoard class, an immutable Blocky board.
+
+Making a move on a PersistentBoard does not change it. Instead, the move
+returns a new board that shares every block the move did not touch with the
+old board, so trying a move costs O(max_depth) rather than a copy of the
+whole board.
+"""
+from __future__ import annotations
+from typing import Callable, List, Optional, Tuple
+import math
+import random
+
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PAINT, COMBINE, PASS
+from blobs import BlobSummary, leaf_summary, parent_summary
+from block import Block, majority_colour_index, zobrist_leaf_hashes, \
+    zobrist_parent_hashes
+from settings import COLOUR_LIST, colour_index
+
+
+class _Node:
+    """An immutable block of a PersistentBoard.
+
+    A _Node does not know its level or position, so the same _Node can be
+    shared by several boards.
+    """
+    # === Private Attributes ===
+    # colour_index:
+    #   The PALETTE index of the colour of this block, or None if it has
+    #   children.
+    # children:
+    #   The children of this block, before <turns> is applied.
+    # turns:
+    #   The number of clockwise quarter turns made to this block and all of
+    #   its descendants. As in Block, turning a block only records the turn.
+    # zobrist:
+    #   The Zobrist hashes of this block with <turns> not applied, as kept by
+    #   Block, or None if they have not been worked out yet.
+    # blobs:
+    #   The BlobSummary of this block with <turns> not applied, or None if it
+    #   has not been worked out yet.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #     len(children) == 0 or len(children) == 4
+    #     turns == 0 if len(children) == 0
+    __slots__ = ('colour_index', 'children', 'turns', 'zobrist', 'blobs')
+    colour_index: Optional[int]
+    children: Tuple[_Node, ...]
+    turns: int
+    zobrist: Optional[Tuple[int, int, int, int]]
+    blobs: Optional[BlobSummary]
+
+    def __init__(self, colour: Optional[int],
+                 children: Tuple[_Node, ...] = (), turns: int = 0) -> None:
+        """Initialize this block with the given <colour> index, <children>
+        and <turns>.
+        """
+        self.colour_index = colour
+        self.children = children
+        self.turns = turns
+        self.zobrist = None
+        self.blobs = None
+
+    def child(self, i: int) -> _Node:
+        """Return the child of this block at index <i>, with the turns made to
+        this block applied to it.
+
+        Precondition: len(self.children) == 4
+        """
+        child = self.children[(i + self.turns) % 4]
+        if self.turns == 0 or child.children == ():
+            return child
+        turned = _Node(None, child.children, (child.turns + self.turns) % 4)
+        turned.zobrist = child.zobrist
+        turned.blobs = child.blobs
+        return turned
+
+    def hashes(self, level: int) -> Tuple[int, int, int, int]:
+        """Return the Zobrist hashes of this block, which is at <level>, with
+        <turns> not applied.
+
+        A _Node never changes, so its hashes are only worked out once.
+        """
+        if self.zobrist is None:
+            if self.children == ():
+                self.zobrist = zobrist_leaf_hashes(level, self.colour_index)
+            else:
+                self.zobrist = zobrist_parent_hashes(
+                    level, [child.hashes(level + 1) for child in self.children],
+                    [child.turns for child in self.children])
+        return self.zobrist
+
+    def blob_summary(self, side: int) -> BlobSummary:
+        """Return the summary of the blobs in this block, which is <side>
+        unit cells across, with <turns> applied.
+
+        As with the hashes, the summary is only worked out once.
+        """
+        if self.blobs is None:
+            if self.children == ():
+                self.blobs = leaf_summary(side, self.colour_index)
+            else:
+                self.blobs = parent_summary(
+                    [child.blob_summary(side // 2) for child in self.children])
+        return self.blobs.turned(self.turns)
+
+    def true_children(self) -> Tuple[_Node, ...]:
+        """Return the children of this block with the turns made to this
+        block applied to them.
+        """
+        if self.turns == 0:
+            return self.children
+        return tuple(self.child(i) for i in range(4))
+
+
+class PersistentBoard:
+    """An immutable Blocky board.
+
+    A block of the board is named by its path: the indices of the children
+    to follow from the whole board to reach it, as returned by Block.path.
+
+    === Public Attributes ===
+    max_depth:
+        The deepest level allowed in the board.
+    size:
+        The height and width of the board, in pixels.
+    """
+    # === Private Attributes ===
+    # _root:
+    #   The block that is the whole board.
+    max_depth: int
+    size: int
+    _root: _Node
+
+    def __init__(self, root: _Node, max_depth: int, size: int) -> None:
+        """Initialize this board with the given <root>, <max_depth> and
+        <size>.
+        """
+        self._root = root
+        self.max_depth = max_depth
+        self.size = size
+
+    @staticmethod
+    def from_block(block: Block) -> PersistentBoard:
+        """Return a PersistentBoard that describes the same board as <block>.
+
+        Precondition: block.level == 0
+        """
+        return PersistentBoard(_node_from_block(block), block.max_depth,
+                               block.size)
+
+    def to_block(self) -> Block:
+        """Return a new tree of Blocks that describes the same board as this
+        board.
+        """
+        root = Block((0, 0), self.size, None, 0, self.max_depth)
+        _build_block(self._root, root)
+        return root
+
+    def root(self) -> _Node:
+        """Return the block that is the whole board.
+
+        The children of a returned block, with the turns made to it applied,
+        are given by its true_children method.
+        """
+        return self._root
+
+    def zobrist_hash(self) -> int:
+        """Return the same 64-bit hash as Block.zobrist_hash returns for an
+        equal tree of Blocks.
+
+        Boards made by apply share the hashes of the blocks they share, so
+        hashing a board made by a move costs O(max_depth).
+        """
+        return self._root.hashes(0)[self._root.turns]
+
+    def blob_summary(self) -> BlobSummary:
+        """Return a summary of the blobs of every colour in this board, as
+        Block.blob_summary does.
+
+        Boards made by apply share the summaries of the blocks they share, so
+        summarising a board made by a move costs O(max_depth) summaries.
+        """
+        return self._root.blob_summary(2 ** self.max_depth)
+
+    def columns(self) -> List[List[int]]:
+        """Return this board as rows and columns of unit cells, in the same
+        format as goal._flatten_indices.
+        """
+        return _columns(self._root, 2 ** self.max_depth)
+
+    def apply(self, action: Tuple[str, Optional[int]], path: Tuple[int, ...],
+              colour: Optional[Tuple[int, int, int]] = None) \
+            -> Optional[PersistentBoard]:
+        """Return the board that results from doing <action> to the block at
+        <path>, or None if the action cannot be done to that block.
+
+        <colour> is the colour to paint with, and is only used for PAINT. A
+        PASS returns this board.
+
+        Precondition: the block at <path> exists in this board
+        """
+        if action == PASS:
+            return self
+
+        level = len(path)
+        if action in (ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE):
+            def change(node: _Node) -> Optional[_Node]:
+                if node.children == ():
+                    return None
+                return _Node(None, node.children,
+                             (node.turns + action[1]) % 4)
+        elif action in (SWAP_HORIZONTAL, SWAP_VERTICAL):
+            def change(node: _Node) -> Optional[_Node]:
+                if node.children == ():
+                    return None
+                c = node.true_children()
+                if action == SWAP_HORIZONTAL:
+                    return _Node(None, (c[1], c[0], c[3], c[2]))
+                return _Node(None, (c[3], c[2], c[1], c[0]))
+        elif action == SMASH:
+            def change(node: _Node) -> Optional[_Node]:
+                if node.children != () or level == self.max_depth:
+                    return None
+                return _random_children(level, self.max_depth)
+        elif action == PAINT:
+            new_colour = colour_index(colour)
+
+            def change(node: _Node) -> Optional[_Node]:
+                if level != self.max_depth or node.colour_index == new_colour:
+                    return None
+                return _Node(new_colour)
+        else:  # action == COMBINE
+            def change(node: _Node) -> Optional[_Node]:
+                if level != self.max_depth - 1 or node.children == ():
+                    return None
+                majority = majority_colour_index(
+                    [child.colour_index for child in node.children])
+                return None if majority is None else _Node(majority)
+
+        root = _replace(self._root, path, change)
+        if root is None:
+            return None
+        return PersistentBoard(root, self.max_depth, self.size)
+
+
+def _replace(node: _Node, path: Tuple[int, ...],
+             change: Callable[[_Node], Optional[_Node]]) -> Optional[_Node]:
+    """Return a copy of <node> in which the block at <path> is replaced by
+    change(block), or None if change returns None.
+
+    Only the blocks along <path> are copied.
+    """
+    if path == ():
+        return change(node)
+
+    children = list(node.true_children())
+    new_child = _replace(children[path[0]], path[1:], change)
+    if new_child is None:
+        return None
+    children[path[0]] = new_child
+    return _Node(None, tuple(children))
+
+
+def _node_from_block(block: Block) -> _Node:
+    """Return a _Node that describes the same block as <block>.
+    """
+    if block.children == []:
+        return _Node(block.colour_index)
+    return _Node(None, tuple(_node_from_block(child)
+                             for child in block.children))
+
+
+def _build_block(node: _Node, block: Block) -> None:
+    """Give <block>, which has no children, the colour and descendants of
+    <node>.
+    """
+    if node.children == ():
+        block.colour_index = node.colour_index
+        return
+
+    positions = block._children_positions()
+    size = block._child_size()
+    for i, child in enumerate(node.true_children()):
+        new_block = Block(positions[i], size, None, block.level + 1,
+                          block.max_depth)
+        _build_block(child, new_block)
+        block.children.append(new_block)
+
+
+def _columns(node: _Node, side: int) -> List[List[int]]:
+    """Return <node>, which is <side> unit cells across, as rows and columns
+    of unit cells.
+    """
+    if node.children == ():
+        return [[node.colour_index] * side for _ in range(side)]
+
+    half = side // 2
+    upper_right, upper_left, lower_left, lower_right = \
+        [_columns(child, half) for child in node.true_children()]
+    return [upper_left[i] + lower_left[i] for i in range(half)] + \
+        [upper_right[i] + lower_right[i] for i in range(half)]
+
+
+def _random_children(level: int, max_depth: int) -> _Node:
+    """Return a block at <level> with four randomly generated children, using
+    the same random choices as Block.smash.
+    """
+    colours = [colour_index(random.choice(COLOUR_LIST)) for _ in range(4)]
+    children = []
+    for colour in colours:
+        # Block.smash draws a random number for every child, even a child at
+        # max_depth that cannot be smashed.
+        if random.random() < math.exp(-0.25 * level) and \
+                level + 1 != max_depth:
+            children.append(_random_children(level + 1, max_depth))
+        else:
+            children.append(_Node(colour))
+    return _Node(None, tuple(children))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'actions', 'blobs', 'block', 'settings'
+        ],
+        'max-attributes': 15
+    })
@@ -22,15 +22,27 @@ Misha Schwartz, and Jaisie Sin.
 This file contains the hierarchy of player classes.
 """
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import math
+import multiprocessing
+import os
 import random
+import threading
+import time
 import pygame
 
-from block import Block
-from goal import Goal, generate_goals
+from block import Block, MoveRecord
+from goal import Goal, MoveScorer, generate_goals
+from grid import BoardGrid
+from persistent import PersistentBoard
+from settings import COLOUR_LIST, SEARCH_TABLE_BYTES
 
-from actions import KEY_ACTION, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PAINT, COMBINE
+from actions import ACTION_PENALTY, KEY_ACTION, SMASH, PAINT, PASS
+
+# The difficulty level of a SmartPlayer that assesses every move it can make
+# other than a smash, however many there are.
+EXHAUSTIVE = -1
 
 
 def create_players(num_human: int, num_random: int, smart_players: List[int]) \
@@ -45,6 +57,8 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
     <num_random> RandomPlayer objects, then the same number of SmartPlayer
     objects as the length of <smart_players>. The difficulty levels in
     <smart_players> should be applied to each SmartPlayer object, in order.
+    A SmartPlayer whose difficulty level is EXHAUSTIVE assesses every move it
+    can make other than a smash.
     """
 
     players_list = []
@@ -59,7 +73,8 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
     for k in range(len(smart_players)):
         smart_player = SmartPlayer(k + num_human + num_random,
                                    goals[k + num_human + num_random],
-                                   smart_players[k])
+                                   smart_players[k],
+                                   smart_players[k] == EXHAUSTIVE)
         players_list.append(smart_player)
     return players_list
 
@@ -82,21 +97,172 @@ def _get_block(block: Block, location: Tuple[int, int], level: int) -> \
     Preconditions:
         - 0 <= level <= max_depth
     """
-    if not block.position[0] <= location[0] < block.position[0] + block.size \
-            or not block.position[1] <= location[1] < block.position[1] + \
-                   block.size:
-        return None
-
-    if block.level == level:
-        return block
-    else:
-        if block.children == []:
+    # Work down from <block>, choosing the child that includes <location> by
+    # comparing it with the middle of the current block.
+    x, y = block.position
+    size = block.size
+    while True:
+        if not (x <= location[0] < x + size and y <= location[1] < y + size):
+            return None
+        if block.level == level or block.children == []:
             return block
-        for blockchild in block.children:
-            if _get_block(blockchild, location, level) is not None:
-                return _get_block(blockchild, location, level)
 
-    return None
+        half = round(size / 2.0)
+        lower, right = location[1] >= y + half, location[0] >= x + half
+        index = _QUADRANT_INDEX[lower][right]
+        block = block.children[index]
+        x += half * _CHILD_OFFSETS[index][0]
+        y += half * _CHILD_OFFSETS[index][1]
+        size = half
+
+
+def get_blocks(board: Block, locations: List[Tuple[int, int]],
+               levels: List[int]) -> List[Optional[Block]]:
+    """Return the result of _get_block(board, locations[i], levels[i]) for
+    every i, in order.
+
+    All of the locations are looked up together, so each block is only visited
+    once no matter how many locations it includes.
+
+    Preconditions:
+        - len(locations) == len(levels)
+        - 0 <= levels[i] <= max_depth for every i
+    """
+    found = [None] * len(locations)
+    x, y = board.position
+    stack = [(board, x, y, board.size, range(len(locations)))]
+    while stack:
+        block, x, y, size, indices = stack.pop()
+        children = block.children
+        half = round(size / 2.0)
+        groups = ([], [], [], [])
+        for i in indices:
+            px, py = locations[i]
+            if not (x <= px < x + size and y <= py < y + size):
+                continue
+            if levels[i] == block.level or children == []:
+                found[i] = block
+            else:
+                groups[_QUADRANT_INDEX[py >= y + half][px >= x + half]] \
+                    .append(i)
+
+        for index, group in enumerate(groups):
+            if group:
+                stack.append((children[index],
+                              x + half * _CHILD_OFFSETS[index][0],
+                              y + half * _CHILD_OFFSETS[index][1], half, group))
+    return found
+
+
+class PickingIndex:
+    """An index of the blocks of a board by the unit cells they cover, for
+    finding the block at a location in constant time.
+
+    === Public Attributes ===
+    board:
+        The board that is indexed.
+    changes:
+        The value of board.changes when the index was built. The index is out
+        of date once board.changes is different.
+    """
+    # === Private Attributes ===
+    # _columns:
+    #   For each pixel across the board, the column of the unit cell it is in,
+    #   and the deepest level at which a block includes it.
+    # _rows:
+    #   The same as <_columns>, for each pixel down the board.
+    # _chains:
+    #   For each unit cell, column by column, the blocks that include it,
+    #   from the board down to a block with no children.
+    board: Block
+    changes: int
+    _columns: List[Tuple[int, int]]
+    _rows: List[Tuple[int, int]]
+    _chains: List[Tuple[Block, ...]]
+
+    def __init__(self, board: Block) -> None:
+        """Index the blocks of <board>.
+
+        Precondition: board.level == 0
+        """
+        self.board = board
+        self.changes = board.changes
+        self._columns = _pixel_cells(board.size, board.max_depth)
+        self._rows = self._columns
+        side = 2 ** board.max_depth
+        self._chains = [()] * (side * side)
+
+        stack = [(board, (board,), 0, 0)]
+        while stack:
+            block, chain, i, j = stack.pop()
+            span = 2 ** (board.max_depth - block.level)
+            if block.children == []:
+                for x in range(i * span, (i + 1) * span):
+                    self._chains[x * side + j * span:
+                                 x * side + (j + 1) * span] = [chain] * span
+                continue
+            for index, child in enumerate(block.children):
+                stack.append((child, chain + (child,),
+                              2 * i + _CHILD_OFFSETS[index][0],
+                              2 * j + _CHILD_OFFSETS[index][1]))
+
+    def get_block(self, location: Tuple[int, int], level: int) \
+            -> Optional[Block]:
+        """Return the same Block as _get_block(board, <location>, <level>).
+
+        Preconditions:
+            - board.changes == changes
+            - 0 <= level <= board.max_depth
+        """
+        x = location[0] - self.board.position[0]
+        y = location[1] - self.board.position[1]
+        if not (0 <= x < len(self._columns) and 0 <= y < len(self._rows)):
+            return None
+
+        column, column_depth = self._columns[x]
+        row, row_depth = self._rows[y]
+        chain = self._chains[column * 2 ** self.board.max_depth + row]
+        depth = min(level, len(chain) - 1)
+        if depth > min(column_depth, row_depth):
+            return None
+        return chain[depth]
+
+
+def _pixel_cells(size: int, max_depth: int) -> List[Tuple[int, int]]:
+    """Return, for each pixel across a board of <size> pixels and <max_depth>,
+    the column of the unit cell that includes it, and the deepest level at
+    which a block includes it.
+
+    Blocks are halved with rounding, as in Block, so a block's children may not
+    cover all of it. A pixel that is not in any child of a block is given the
+    level of that block, and the first column of that block.
+    """
+    cells = []
+    for pixel in range(size):
+        start, length, column = 0, size, 0
+        depth = 0
+        while depth < max_depth:
+            half = round(length / 2.0)
+            right = pixel >= start + half
+            if right:
+                start += half
+            if pixel >= start + half:
+                break
+            length = half
+            column = 2 * column + right
+            depth += 1
+        cells.append((column << (max_depth - depth), depth))
+    return cells
+
+
+# The index of the child of a block that includes a location, by whether the
+# location is in the lower half of the block and then whether it is in the
+# right half.
+_QUADRANT_INDEX = ((1, 0), (2, 3))
+
+# How far across and down each child of a block is from the block, in units of
+# half the block, in the order of Block.children.
+_CHILD_OFFSETS = ((1, 0), (0, 0), (0, 1), (1, 1))
 
 
 class Player:
@@ -144,6 +310,27 @@ class Player:
         """
         raise NotImplementedError
 
+    def ponder(self, board: Block, turn: int) -> None:
+        """Think about <board> in the background, where it is the turn of the
+        player at index <turn> of the game's players, until this player is
+        asked for a move, ponder is called again or stop_pondering is called.
+
+        This player may keep what it learns to make its moves sooner. By
+        default, do nothing.
+        """
+        return
+
+    def stop_pondering(self) -> None:
+        """Stop thinking in the background. By default, do nothing.
+        """
+        return
+
+    def close(self) -> None:
+        """Stop thinking in the background and let go of anything else kept
+        for the game, once the game is over. By default, stop pondering.
+        """
+        self.stop_pondering()
+
 
 def _create_move(action: Tuple[str, Optional[int]], block: Block) -> \
         Tuple[str, Optional[int], Block]:
@@ -154,6 +341,59 @@ def _create_move(action: Tuple[str, Optional[int]], block: Block) -> \
     return action[0], action[1], block
 
 
+class _Pondering:
+    """A search run by a player in a background thread while it waits for
+    its turn.
+
+    The thread is a daemon, so a search still running does not keep the game
+    open when it is quit.
+    """
+    # === Private Attributes ===
+    # _stop:
+    #   Set when the search should stop.
+    # _thread:
+    #   The thread running the search.
+    _stop: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, search: Callable[[threading.Event], object]) -> None:
+        """Start calling <search> in a background thread. It is passed an
+        event that is set when it should stop.
+        """
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=search, args=(self._stop,),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the search to stop, and wait until it has.
+        """
+        self._stop.set()
+        self._thread.join()
+
+
+def _replies(board: Block, colour: Tuple[int, int, int]) \
+        -> List[Tuple[Tuple[str, Optional[int], Tuple[int, ...]],
+                      Tuple[int, int, int]]]:
+    """Return the moves that the player about to move on <board> could make
+    before a player whose goal colour is <colour>, other than smashes, each
+    with its block given by its path, and with the colour of the player.
+
+    The other player's goal is not known, so a paint is returned in every
+    colour but <colour>, which no other player has. A PASS comes first.
+    """
+    replies = [(('pass', None, ()), colour)]
+    for name, direction, block in board.legal_moves(colour):
+        if name != SMASH[0] and name != PAINT[0]:
+            replies.append(((name, direction, block.path()), colour))
+    for other in COLOUR_LIST:
+        if other != colour:
+            for name, direction, block in board.legal_moves(other):
+                if name == PAINT[0]:
+                    replies.append(((name, direction, block.path()), other))
+    return replies
+
+
 class HumanPlayer(Player):
     """A human player in the Blocky game.
 
@@ -168,6 +408,9 @@ class HumanPlayer(Player):
     #     The level of the Block that the user selected most recently.
     # _desired_action:
     #     The most recent action that the user is attempting to do.
+    # _picking:
+    #     The PickingIndex of the board this player most recently selected a
+    #     block from, or None.
     #
     # == Representation Invariants concerning the private attributes ==
     #     _level >= 0
@@ -175,6 +418,7 @@ class HumanPlayer(Player):
     goal: Goal
     _level: int
     _desired_action: Optional[Tuple[str, Optional[int]]]
+    _picking: Optional[PickingIndex]
 
     def __init__(self, player_id: int, goal: Goal) -> None:
         """Initialize this HumanPlayer with the given <player_id>
@@ -186,15 +430,22 @@ class HumanPlayer(Player):
         # and _selected_block to None.
         self._level = 0
         self._desired_action = None
+        self._picking = None
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         """Return the block that is currently selected by the player based on
         the position of the mouse on the screen and the player's desired level.
 
         If no block is selected by the player, return None.
+
+        This is called every frame, so the blocks of <board> are indexed by
+        location, and indexed again only when <board> changes.
         """
         mouse_pos = pygame.mouse.get_pos()
-        block = _get_block(board, mouse_pos, self._level)
+        if self._picking is None or self._picking.board is not board or \
+                self._picking.changes != board.changes:
+            self._picking = PickingIndex(board)
+        block = self._picking.get_block(mouse_pos, self._level)
 
         return block
 
@@ -273,94 +524,23 @@ class RandomPlayer(Player):
         """Return a valid, randomly generated move.
 
         A valid move is a move other than PASS that can be successfully
-        performed on the <board>.
+        performed on the <board>. Every valid move is equally likely. If there
+        is no valid move, return a PASS.
 
         This function does not mutate <board>.
         """
         if not self._proceed:
             return None  # Do not remove
 
-        potential_actions = {
-            0: ROTATE_CLOCKWISE,
-            1: ROTATE_COUNTER_CLOCKWISE,
-            2: SWAP_HORIZONTAL,
-            3: SWAP_VERTICAL,
-            4: SMASH,
-            5: COMBINE,
-            6: PAINT
-        }
-
-        random_level = random.randint(0, board.max_depth)
-        random_x_position = random.randint(0, board.size - 1)
-        random_y_position = random.randint(0, board.size - 1)
-        randomly_selected_block = _get_block(board, (random_x_position,
-                                                     random_y_position),
-                                             random_level)
-        randomly_generated_move_num = random.randint(0, len(potential_actions)
-                                                     - 1)
-        randomly_generated_move = potential_actions[randomly_generated_move_num]
-
-        board_copy = board.create_copy()
-        randomly_selected_block_copy = _get_block(board_copy,
-                                                  (random_x_position,
-                                                   random_y_position),
-                                                  random_level)
-        if randomly_generated_move == ROTATE_CLOCKWISE:
-            if randomly_selected_block_copy.rotate(1):
-                self._proceed = False
-                return ('rotate', 1, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        elif randomly_generated_move == ROTATE_COUNTER_CLOCKWISE:
-            if randomly_selected_block_copy.rotate(3):
-                self._proceed = False
-                return ('rotate', 3, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        elif randomly_generated_move == SWAP_HORIZONTAL:
-            if randomly_selected_block_copy.swap(0):
-                self._proceed = False
-                return ('swap', 0, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        elif randomly_generated_move == SWAP_VERTICAL:
-            if randomly_selected_block_copy.swap(1):
-                self._proceed = False
-                return ('swap', 1, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        elif randomly_generated_move == SMASH:
-            if randomly_selected_block_copy.smash():
-                self._proceed = False
-                return ('smash', None, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        elif randomly_generated_move == PAINT:
-            if randomly_selected_block_copy.paint(self.goal.colour):
-                self._proceed = False
-                return ('paint', None, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
-        else:  # randomly_generated_move == COMBINE
-            if randomly_selected_block_copy.combine():
-                self._proceed = False
-                return ('combine', None, randomly_selected_block)
-            else:
-                valid_move = self.generate_move(board)
-                self._proceed = False
-                return valid_move
+        # The legal moves are counted in the board, so one is drawn directly
+        # instead of trying random moves until one works.
+        move = board.random_legal_move(self.goal.colour)
+        self._proceed = False
+        if move is None:
+            # Only a PASS is possible, such as on a board of one unit cell
+            # that is already this player's colour.
+            return _create_move(PASS, board)
+        return move
 
 
 class SmartPlayer(Player):
@@ -378,20 +558,43 @@ class SmartPlayer(Player):
     #   True when the player should make a move, False when the player should
     #   wait.
     # _difficulty:
-    #   The difficulty of the player, corresponds to the number of moves that
-    # the player shuffles through before selecting the best one
+    #   The difficulty of the player, corresponds to the number of distinct
+    #   moves that the player assesses before selecting the best one
+    # _exhaustive:
+    #   True if the player assesses every move other than a smash instead,
+    #   ignoring <_difficulty>.
+    # _pool:
+    #   The processes that assess moves for an exhaustive player, or None if
+    #   they have not been started.
+    # _assessed:
+    #   For each board whose moves were assessed while pondering, keyed by its
+    #   Zobrist hash: the move chosen, with the path of its block.
+    # _pondering:
+    #   The assessment being run in the background, or None.
     id: int
     goal: Goal
     _proceed: bool
     _difficulty: int
+    _exhaustive: bool
+    _pool: Optional[ProcessPoolExecutor]
+    _assessed: Dict[int, Tuple[str, Optional[int], Tuple[int, ...]]]
+    _pondering: Optional[_Pondering]
 
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 exhaustive: bool = False) -> None:
         """Initialize this smart player with the given, <player_id>, <goal>, and
         difficulty, and set proceed signal to false.
+
+        If <exhaustive> is True, the player assesses every move it can make
+        except smashes, whatever its difficulty.
         """
         self.id = player_id
         self.goal = goal
         self._difficulty = difficulty
+        self._exhaustive = exhaustive
+        self._pool = None
+        self._assessed = {}
+        self._pondering = None
         self._proceed = False
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
@@ -413,91 +616,982 @@ class SmartPlayer(Player):
         disregarding penalties).
 
         A valid move is a move other than PASS that can be successfully
-        performed on the <board>. If no move can be found that is better than
-        the current score, this player will pass.
+        performed on the <board>. The player assesses as many distinct valid
+        moves as its difficulty, or every valid move if there are fewer. If no
+        move can be found that is better than the current score, this player
+        will pass.
+
+        If the moves on <board> were assessed while pondering, the move chosen
+        then is made without assessing them again.
 
         This function does not mutate <board>.
         """
         if not self._proceed:
             return None  # Do not remove
 
-        board_copy = board.create_copy()
-        current_greatest_score = self.goal.score(board_copy)
+        self.stop_pondering()
+        assessed = self._assessed.get(board.zobrist_hash())
+        self._assessed = {}
+        self._proceed = False  # Must set to False before returning!
+        if assessed is not None:
+            name, direction, path = assessed
+            return name, direction, _follow_path(board, path)
+        if self._exhaustive:
+            return self._best_move(board)
+        return self._sampled_move(board)
+
+    def ponder(self, board: Block, turn: int) -> None:
+        """Assess this player's moves in the background, as generate_move
+        would, on <board> if it is this player's turn, and otherwise on each
+        board that the move of the player at index <turn> could leave.
+
+        A player only moves when it is asked to, so its moves can be assessed
+        while the game waits for that, or for another player to move. The
+        move chosen for each board is kept by the board's hash, so it is used
+        if that board comes up when this player is asked to move.
+        """
+        self.stop_pondering()
+        copy = board.create_copy()
+        if turn == self.id:
+            replies = [(('pass', None, ()), self.goal.colour)]
+        else:
+            replies = _replies(copy, self.goal.colour)
+        self._pondering = _Pondering(
+            lambda stop: self._assess(copy, replies, stop))
+
+    def stop_pondering(self) -> None:
+        """Stop assessing moves in the background, keeping the move chosen if
+        the assessment has finished.
+        """
+        if self._pondering is not None:
+            self._pondering.stop()
+            self._pondering = None
+
+    def _assess(self, board: Block,
+                replies: List[Tuple[Tuple[str, Optional[int],
+                                          Tuple[int, ...]],
+                                    Tuple[int, int, int]]],
+                stop: threading.Event) -> None:
+        """Assess the moves on the board after each of <replies> on <board>,
+        made in the colour given with it, and keep the move chosen in
+        <_assessed>, until <stop> is set.
+
+        <board> is changed while a board is assessed, but is restored before
+        this returns.
+        """
+        for reply, colour in replies:
+            if stop.is_set():
+                return
+            record = _make_move(board, reply, colour)
+            key = board.zobrist_hash()
+            if key not in self._assessed:
+                if self._exhaustive:
+                    move = self._best_move(board, stop)
+                else:
+                    move = self._sampled_move(board, stop)
+                if move is not None:
+                    self._assessed[key] = (move[0], move[1], move[2].path())
+            record.undo()
+
+    def _sampled_move(self, board: Block,
+                      stop: Optional[threading.Event] = None) \
+            -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move that results in the highest score for this
+        player's goal on <board>, of as many distinct valid moves as this
+        player's difficulty, or a PASS if none of them raises the score.
+
+        Return None if <stop> is set before the moves are assessed.
+        """
+        current_score = self.goal.score(board)
+        current_greatest_score = current_score
+        persistent_board = None
 
-        i = 0
         greatest_score_move = ('pass', None, board)
-        while i < self._difficulty:
-            potential_actions = ['ROTATE_CLOCKWISE', 'ROTATE_COUNTER_CLOCKWISE',
-                                 'SWAP_HORIZONTAL', 'SWAP_VERTICAL', 'SMASH',
-                                 'COMBINE', 'PAINT']
-
-            random_level = random.randint(0, board.max_depth)
-            random_x_position = random.randint(0, board.size - 1)
-            random_y_position = random.randint(0, board.size - 1)
-            randomly_selected_block = _get_block(board, (random_x_position,
-                                                         random_y_position),
-                                                 random_level)
-            randomly_generated_move = random.choice(potential_actions)
-
-            board_copy = board.create_copy()
-            randomly_selected_block_copy = _get_block(board_copy,
-                                                      (random_x_position,
-                                                       random_y_position),
-                                                      random_level)
-            if randomly_generated_move == 'ROTATE_CLOCKWISE' and \
-                    randomly_selected_block_copy.rotate(1):
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('rotate', 1,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'ROTATE_COUNTER_CLOCKWISE' and \
-                    randomly_selected_block_copy.rotate(3):
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('rotate', 3,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'SWAP_HORIZONTAL' and \
-                    randomly_selected_block_copy.swap(0):
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('swap', 0,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'SWAP_VERTICAL' and \
-                    randomly_selected_block_copy.swap(1):
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('swap', 1,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'SMASH' and \
-                    randomly_selected_block_copy.smash():
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('smash', None,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'PAINT' and \
-                    randomly_selected_block_copy.paint(self.goal.colour):
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('paint', None,
-                                           randomly_selected_block)
-                i += 1
-            elif randomly_generated_move == 'COMBINE' and \
-                    randomly_selected_block_copy.combine():
-                if self.goal.score(board_copy) > current_greatest_score:
-                    current_greatest_score = self.goal.score(board_copy)
-                    greatest_score_move = ('combine', None,
-                                           randomly_selected_block)
-                i += 1
+        # Distinct legal moves are drawn, so no move is scored twice, and
+        # there are never more draws than legal moves.
+        num_moves = board.num_legal_moves(self.goal.colour)
+        for index in random.sample(range(num_moves),
+                                   min(self._difficulty, num_moves)):
+            if stop is not None and stop.is_set():
+                return None
+            move = board.legal_move(index, self.goal.colour)
+
+            if move[0] == SMASH[0]:
+                # A smash is random, so it is tried on a persistent copy of
+                # the board, which shares everything but the path to the
+                # smashed block with the board.
+                if persistent_board is None:
+                    persistent_board = PersistentBoard.from_block(board)
+                candidate_score = self.goal.score(
+                    persistent_board.apply(SMASH, move[2].path()))
+            else:
+                # Any other move only changes the score through the block it
+                # is made to, so the change is worked out from that block.
+                candidate_score = current_score + \
+                    self.goal.score_delta(board, move)
+
+            if candidate_score > current_greatest_score:
+                current_greatest_score = candidate_score
+                greatest_score_move = move
+        return greatest_score_move
 
-        self._proceed = False  # Must set to False before returning!
+    def close(self) -> None:
+        """Stop assessing moves in the background, and shut down the
+        processes that assess moves for an exhaustive player.
+        """
+        self.stop_pondering()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _best_move(self, board: Block,
+                   stop: Optional[threading.Event] = None) \
+            -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move, other than a smash, that results in the highest
+        score for this player's goal on <board>, or a PASS if no move raises
+        the score. Of moves with the same score, the one that comes first in
+        board.legal_moves is returned.
+
+        Return None if <stop> is set before every move is assessed.
+
+        The moves are shared out to a pool of processes. Each process is sent
+        the buffers of a BoardGrid of <board> and its moves as paths, rather
+        than a pickled tree of Blocks.
+        """
+        # The result of a smash is random, so it cannot be known in advance.
+        moves = [move for move in board.legal_moves(self.goal.colour)
+                 if move[0] != SMASH[0]]
+        if self._pool is None:
+            # A forked process would copy any lock held by another thread,
+            # such as the score cache's while a player ponders, and could
+            # wait on it forever, so the processes are spawned instead.
+            self._pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context('spawn'))
+
+        grid = BoardGrid.from_block(board)
+        encoded = (grid.max_depth, grid.size, bytes(grid.cells),
+                   bytes(grid.levels))
+        share = -(-len(moves) // (os.cpu_count() or 1))
+        futures = []
+        for first in range(0, len(moves), share or 1):
+            paths = [(name, direction, block.path())
+                     for name, direction, block in moves[first:first + share]]
+            futures.append(self._pool.submit(_best_of_moves, encoded,
+                                             self.goal, first, paths))
+
+        # The shares are looked at in order and a later move has to do
+        # strictly better, so a tie goes to the first move.
+        greatest_score = self.goal.score(board)
+        greatest_score_move = ('pass', None, board)
+        for future in futures:
+            if stop is not None and stop.is_set():
+                for other in futures:
+                    other.cancel()
+                return None
+            score, index = future.result()
+            if score > greatest_score:
+                greatest_score = score
+                greatest_score_move = moves[index]
         return greatest_score_move
 
 
+def _best_of_moves(encoded: Tuple[int, int, bytes, bytes], goal: Goal,
+                   first: int,
+                   moves: List[Tuple[str, Optional[int], Tuple[int, ...]]]) \
+        -> Tuple[int, int]:
+    """Return the highest score for <goal> made by one of <moves>, and the
+    index of the first move that makes it, counting from <first>.
+
+    <encoded> is the max_depth, size, cells and levels of a BoardGrid of the
+    board, and each move is an action name, a direction and the path of the
+    block it is made to.
+
+    Precondition: <moves> is not empty, and has no smashes
+    """
+    max_depth, size, cells, levels = encoded
+    board = BoardGrid(max_depth, size, bytearray(cells),
+                      bytearray(levels)).to_block()
+    current_score = goal.score(board)
+
+    greatest = None
+    for index, (name, direction, path) in enumerate(moves, first):
+        score = current_score + goal.score_delta(
+            board, (name, direction, _follow_path(board, path)))
+        if greatest is None or score > greatest[0]:
+            greatest = (score, index)
+    return greatest
+
+
+def _follow_path(board: Block, path: Tuple[int, ...]) -> Block:
+    """Return the block of <board> at <path>, as returned by Block.path.
+    """
+    block = board
+    for i in path:
+        block = block.children[i]
+    return block
+
+
+class MCTSPlayer(Player):
+    """A computer player in the Blocky game that plans with Monte Carlo tree
+    search.
+
+    The player searches sequences of its own moves that start with the move
+    it is about to make. Each time a sequence is searched, it is continued
+    with random moves, and the board that results is valued by this player's
+    goal less the penalties for all of the moves. Sequences are chosen with
+    UCT, which favours moves whose sequences have been valued highly and
+    moves that have been searched the least.
+
+    The search stops after a time limit or a number of sequences, whichever
+    comes first, so a move takes about the same time on any board.
+
+    === Public Attributes ===
+    id:
+        This player's number.
+    goal:
+        This player's assigned goal for the game.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _time_limit:
+    #   The number of seconds a search may take, or None if there is no limit.
+    # _iterations:
+    #   The number of sequences a search may value, or None if there is no
+    #   limit.
+    # _rollout_depth:
+    #   The number of random moves made after a sequence from the tree.
+    # _trees:
+    #   The roots of the trees searched for boards this player may move on
+    #   next, keyed by the Zobrist hash of each board.
+    # _tree_seconds:
+    #   The number of seconds spent searching each tree in <_trees>, keyed
+    #   the same way.
+    # _pondering:
+    #   The search being run in the background, or None.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #     _time_limit is not None or _iterations is not None
+    #     _trees and _tree_seconds have the same keys
+    id: int
+    goal: Goal
+    _proceed: bool
+    _time_limit: Optional[float]
+    _iterations: Optional[int]
+    _rollout_depth: int
+    _trees: Dict[int, _SearchNode]
+    _tree_seconds: Dict[int, float]
+    _pondering: Optional[_Pondering]
+
+    def __init__(self, player_id: int, goal: Goal,
+                 time_limit: Optional[float] = 1.0,
+                 iterations: Optional[int] = None,
+                 rollout_depth: int = 3) -> None:
+        """Initialize this player with the given <player_id> and <goal>, and
+        set proceed signal to False.
+
+        A search stops after <time_limit> seconds or <iterations> sequences,
+        whichever comes first. Either may be None, but not both.
+        """
+        self.id = player_id
+        self.goal = goal
+        self._time_limit = time_limit
+        self._iterations = iterations
+        self._rollout_depth = rollout_depth
+        self._trees = {}
+        self._tree_seconds = {}
+        self._pondering = None
+        self._proceed = False
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        """Return None always regardless of board.
+        """
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        """If event is a mouse click, set this player's proceed signal to
+        True. Return None
+        """
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move whose sequences were searched the most, which may
+        be a PASS.
+
+        A tree already searched for <board>, while pondering or as part of the
+        tree for the last move, is searched further, and the time and
+        sequences already spent on it count towards the limits.
+
+        This function does not mutate <board>. Moves are made and undone on a
+        copy of it.
+        """
+        if not self._proceed:
+            return None  # Do not remove
+
+        self.stop_pondering()
+        copy = board.create_copy()
+        key = self._tree_for(copy)
+        self._search(copy, key)
+        best = self._trees[key].most_searched()
+        self._trees, self._tree_seconds = {}, {}
+        self._proceed = False
+        if best is None:
+            return _create_move(PASS, board)
+
+        # The tree below the move is kept, in case the board is the same when
+        # this player next moves. Its values count the move's penalty, which
+        # the values found from the board after the move will not, so it is
+        # taken back out.
+        best.shift(ACTION_PENALTY[best.move[:2]])
+        record = _make_move(copy, best.move, self.goal.colour)
+        self._trees[copy.zobrist_hash()] = best
+        self._tree_seconds[copy.zobrist_hash()] = 0
+        record.undo()
+        name, direction, path = best.move
+        return name, direction, _follow_path(board, path)
+
+    def ponder(self, board: Block, turn: int) -> None:
+        """Search in the background, up to the limits of a search, <board> if
+        it is this player's turn, and otherwise each board that the move of
+        the player at index <turn> could leave.
+
+        Only this player's own moves are searched, so the boards searched are
+        those this player may move on next. The boards are searched a few
+        sequences at a time in turn, and their trees are kept by their
+        hashes, so the tree for the board that comes up is searched further
+        when this player is asked to move.
+        """
+        self.stop_pondering()
+        copy = board.create_copy()
+        if turn == self.id:
+            # The other boards can no longer come up.
+            key = self._tree_for(copy)
+            self._trees = {key: self._trees[key]}
+            self._tree_seconds = {key: self._tree_seconds[key]}
+            replies = [(('pass', None, ()), self.goal.colour)]
+        else:
+            replies = _replies(copy, self.goal.colour)
+        self._pondering = _Pondering(
+            lambda stop: self._search_replies(copy, replies, stop))
+
+    def stop_pondering(self) -> None:
+        """Stop searching in the background, keeping the tree searched so far.
+        """
+        if self._pondering is not None:
+            self._pondering.stop()
+            self._pondering = None
+
+    def _tree_for(self, board: Block) -> int:
+        """Return the Zobrist hash of <board>, by which its tree is kept,
+        first starting a new tree for it if there is none.
+        """
+        key = board.zobrist_hash()
+        if key not in self._trees:
+            self._trees[key] = _SearchNode(('pass', None, ()))
+            self._tree_seconds[key] = 0
+        return key
+
+    def _search_replies(self, board: Block,
+                        replies: List[Tuple[Tuple[str, Optional[int],
+                                                  Tuple[int, ...]],
+                                            Tuple[int, int, int]]],
+                        stop: threading.Event) -> None:
+        """Search the tree for the board after each of <replies> on <board>,
+        made in the colour given with it, _PONDER_SEQUENCES sequences at a
+        time in turn, until every search reaches the limits or <stop> is set.
+
+        <board> is changed during the search, but is restored before this
+        returns.
+        """
+        searching = True
+        while searching and not stop.is_set():
+            searching = False
+            for reply, colour in replies:
+                if stop.is_set():
+                    return
+                record = _make_move(board, reply, colour)
+                key = self._tree_for(board)
+                if (self._iterations is None
+                        or self._trees[key].visits < self._iterations) and \
+                        (self._time_limit is None
+                         or self._tree_seconds[key] < self._time_limit):
+                    self._search(board, key, stop, _PONDER_SEQUENCES)
+                    searching = True
+                record.undo()
+
+    def _search(self, board: Block, key: int,
+                stop: Optional[threading.Event] = None,
+                sequences: Optional[int] = None) -> None:
+        """Search sequences of moves on <board> from the root of its tree,
+        kept by <key>, until the time limit or the number of sequences is
+        reached, counting what was spent on the tree before, or until <stop>
+        is set. If <sequences> is not None, stop after that many sequences.
+
+        <board> is changed during the search, but is restored before this
+        returns.
+        """
+        colour = self.goal.colour
+        root = self._trees[key]
+        start = time.perf_counter()
+        deadline = None
+        if self._time_limit is not None:
+            deadline = start + self._time_limit - self._tree_seconds[key]
+        end = None if sequences is None else root.visits + sequences
+        # The lowest and highest values seen, to scale the exploration term
+        # to the goal's scores.
+        low = high = None
+
+        while root.visits == 0 or \
+                ((self._iterations is None or root.visits < self._iterations)
+                 and (end is None or root.visits < end)
+                 and (deadline is None or time.perf_counter() < deadline)
+                 and (stop is None or not stop.is_set())):
+            records = []
+            penalty = 0
+            searched = [root]
+
+            # Follow the tree down to a block with moves that have not been
+            # searched yet, then search one of them.
+            node = root
+            while True:
+                if node.untried is None:
+                    node.untried = _tree_moves(board, colour)
+                if node.untried or not node.children:
+                    break
+                node = node.select(0 if low is None else high - low)
+                records.append(_make_move(board, node.move, colour))
+                penalty += ACTION_PENALTY[node.move[:2]]
+                searched.append(node)
+            if node.untried:
+                move = node.untried.pop(random.randrange(len(node.untried)))
+                child = _SearchNode(move)
+                node.children.append(child)
+                records.append(_make_move(board, move, colour))
+                penalty += ACTION_PENALTY[move[:2]]
+                searched.append(child)
+
+            # Continue with random moves, which may include smashes.
+            for _ in range(self._rollout_depth):
+                move = board.random_legal_move(colour)
+                if move is None:
+                    break
+                records.append(move[2].apply(move[:2], colour))
+                penalty += ACTION_PENALTY[move[:2]]
+
+            value = self.goal.score(board) - penalty
+            for record in reversed(records):
+                record.undo()
+            for node in searched:
+                node.visits += 1
+                node.total += value
+            if low is None:
+                low = high = value
+            else:
+                low, high = min(low, value), max(high, value)
+        self._tree_seconds[key] += time.perf_counter() - start
+
+
+class _SearchNode:
+    """A move in the tree searched by an MCTSPlayer.
+
+    === Public Attributes ===
+    move:
+        The move, as an action name, a direction and the path of the block
+        it is made to.
+    children:
+        The moves searched after this move.
+    untried:
+        The moves after this move that have not been searched, or None if
+        they have not been listed yet.
+    visits:
+        The number of times this move has been searched.
+    total:
+        The sum of the values found when this move was searched.
+    """
+    __slots__ = ('move', 'children', 'untried', 'visits', 'total')
+    move: Tuple[str, Optional[int], Tuple[int, ...]]
+    children: List[_SearchNode]
+    untried: Optional[List[Tuple[str, Optional[int], Tuple[int, ...]]]]
+    visits: int
+    total: float
+
+    def __init__(self, move: Tuple[str, Optional[int], Tuple[int, ...]]) \
+            -> None:
+        """Initialize this node for <move>, which has not been searched.
+        """
+        self.move = move
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.total = 0
+
+    def select(self, spread: float) -> _SearchNode:
+        """Return the child with the highest UCT value, where <spread> is the
+        difference between the highest and lowest values seen.
+
+        Precondition: every child has been searched
+        """
+        scale = _EXPLORATION * spread * math.sqrt(math.log(self.visits))
+        return max(self.children,
+                   key=lambda child: child.total / child.visits +
+                   scale / math.sqrt(child.visits))
+
+    def most_searched(self) -> Optional[_SearchNode]:
+        """Return the child that has been searched the most, with ties going
+        to the higher average value, or None if this node has no children.
+        """
+        if not self.children:
+            return None
+        return max(self.children,
+                   key=lambda child: (child.visits, child.total / child.visits))
+
+    def shift(self, amount: float) -> None:
+        """Add <amount> to every value found when this move or the moves
+        searched after it were searched.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.total += amount * node.visits
+            stack.extend(node.children)
+
+
+# The weight of the exploration term of UCT.
+_EXPLORATION = math.sqrt(2)
+
+# The number of sequences an MCTSPlayer searches from the board after one
+# reply, while pondering, before moving on to the next.
+_PONDER_SEQUENCES = 20
+
+
+def _tree_moves(board: Block, colour: Tuple[int, int, int]) \
+        -> List[Tuple[str, Optional[int], Tuple[int, ...]]]:
+    """Return the moves that an MCTSPlayer with the goal colour <colour> can
+    add to its tree on <board>: a PASS and every legal move but a smash.
+
+    A smash is random, so the board after it is not the same each time.
+    """
+    moves = [('pass', None, ())]
+    for name, direction, block in board.legal_moves(colour):
+        if name != SMASH[0]:
+            moves.append((name, direction, block.path()))
+    return moves
+
+
+def _make_move(board: Block, move: Tuple[str, Optional[int], Tuple[int, ...]],
+               colour: Tuple[int, int, int]) -> MoveRecord:
+    """Make <move>, whose block is given by its path, on <board> and return
+    its record.
+
+    Precondition: <move> can be made
+    """
+    name, direction, path = move
+    return _follow_path(board, path).apply((name, direction), colour)
+
+
+class AlphaBetaPlayer(Player):
+    """A computer player in the Blocky game that looks ahead through the turns
+    of the other players.
+
+    The player searches every move other than a smash, for itself and for
+    each player after it, in turn order. It assumes the worst: that the other
+    players move to make its score as low as they can. A board is valued by
+    this player's goal less the penalties for the moves this player makes.
+    Other players paint with the colours of their own goals.
+
+    The search uses alpha-beta pruning. It looks one turn ahead, then two,
+    and so on, until a time limit or a number of turns is reached, and makes
+    the best move of the deepest search it finished. Boards already searched
+    are kept in a table, which also gives the move to search first.
+
+    Moves are searched in order of the scores they lead to, and the last
+    turn of a search is scored with a MoveScorer, without making the moves.
+    On a board of maximum depth 4, a search three turns ahead takes one to
+    three seconds, which the default time limit allows.
+
+    === Public Attributes ===
+    id:
+        This player's number.
+    goal:
+        This player's assigned goal for the game.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _goals:
+    #   The goals of all players, in turn order. This player's is at index
+    #   <id>.
+    # _time_limit:
+    #   The number of seconds a search may take, or None if there is no limit.
+    # _max_plies:
+    #   The most turns to look ahead, or None if there is no limit.
+    # _state:
+    #   What this player keeps about its searches.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #     _time_limit is not None or _max_plies is not None
+    id: int
+    goal: Goal
+    _proceed: bool
+    _goals: List[Goal]
+    _time_limit: Optional[float]
+    _max_plies: Optional[int]
+    _state: _SearchState
+
+    def __init__(self, player_id: int, goals: List[Goal],
+                 time_limit: Optional[float] = 3.0,
+                 max_plies: Optional[int] = None) -> None:
+        """Initialize this player with the given <player_id>, and set proceed
+        signal to False.
+
+        <goals> are the goals of all players in turn order, including this
+        player's at index <player_id>. A search stops after <time_limit>
+        seconds or after looking <max_plies> turns ahead, whichever comes
+        first. Either may be None, but not both.
+        """
+        self.id = player_id
+        self.goal = goals[player_id]
+        self._goals = goals
+        self._time_limit = time_limit
+        self._max_plies = max_plies
+        self._state = _SearchState()
+        self._proceed = False
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        """Return None always regardless of board.
+        """
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        """If event is a mouse click, set this player's proceed signal to
+        True. Return None
+        """
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the best move found by the deepest search finished in time,
+        which may be a PASS.
+
+        If <board> was searched while pondering, that search is carried on,
+        and the time already spent on it counts towards the time limit.
+
+        This function does not mutate <board>. Moves are made and undone on a
+        copy of it.
+        """
+        if not self._proceed:
+            return None  # Do not remove
+
+        self.stop_pondering()
+        name, direction, path = self._search(board.create_copy(), self.id)
+        self._proceed = False
+        return name, direction, _follow_path(board, path)
+
+    def ponder(self, board: Block, turn: int) -> None:
+        """Search <board> in the background, up to the limits of a search,
+        when it is the turn of the player at index <turn> of <_goals>.
+
+        The boards searched are kept in the table, so the search for this
+        player's next move can skip them.
+        """
+        self.stop_pondering()
+        copy = board.create_copy()
+        self._state.pondering = _Pondering(
+            lambda stop: self._search(copy, turn, stop))
+
+    def stop_pondering(self) -> None:
+        """Stop searching in the background.
+        """
+        if self._state.pondering is not None:
+            self._state.pondering.stop()
+            self._state.pondering = None
+
+    def _search(self, board: Block, turn: int,
+                stop: Optional[threading.Event] = None) \
+            -> Tuple[str, Optional[int], Tuple[int, ...]]:
+        """Search <board>, when it is the turn of the player at index <turn>
+        of <_goals>, one turn deeper at a time, and return the best move of
+        the deepest search finished, with the path of its block.
+
+        The search stops at the limits, counting the time already spent
+        searching <board> if it was the last board searched, or when <stop>
+        is set.
+
+        <board> is left changed if a search is stopped part way.
+        """
+        start = time.perf_counter()
+        state = self._state
+        key = (board.zobrist_hash(), turn)
+        spent = 0
+        if state.searched is not None and state.searched[0] == key:
+            spent = state.searched[1]
+        state.deadline = None
+        if self._time_limit is not None:
+            state.deadline = start + self._time_limit - spent
+        state.stop = stop
+        state.killers = {}
+
+        # A board searched before already has a best move, even if there is
+        # no time left to search it again.
+        best = ('pass', None, ())
+        if key in state.table:
+            best = state.table[key][3]
+        plies = 1
+        while self._max_plies is None or plies <= self._max_plies:
+            try:
+                self._value(board, turn, plies, -math.inf, math.inf)
+            except _SearchTimeout:
+                break
+            best = state.table[key][3]
+            plies += 1
+        state.searched = (key, spent + time.perf_counter() - start)
+        return best
+
+    def _value(self, board: Block, turn: int, plies: int, alpha: float,
+               beta: float, last: Optional[Block] = None) -> float:
+        """Return the value of <board> to this player, looking <plies> turns
+        ahead, when it is the turn of the player at index <turn> of <_goals>.
+        <last> is the block of the move that was just made, if any.
+
+        Only this player's penalties for moves from here on are counted. If
+        the value is at most <alpha> or at least <beta>, only a bound on it is
+        returned, as usual for alpha-beta pruning.
+
+        Raise _SearchTimeout if the time limit is reached or the search is
+        asked to stop.
+
+        Precondition: plies >= 1
+        """
+        if self._state.out_of_time():
+            raise _SearchTimeout
+
+        key = (board.zobrist_hash(), turn)
+        first = None
+        if key in self._state.table:
+            searched, value, bound, first = self._state.table[key]
+            if searched >= plies and (
+                    bound == _EXACT or
+                    (bound == _LOWER and value >= beta) or
+                    (bound == _UPPER and value <= alpha)):
+                return value
+
+        ours = turn == self.id
+        next_ours = (turn + 1) % len(self._goals) == self.id
+        colour = self._goals[turn].colour
+        scorer = self.goal.move_scorer(board)
+        original_alpha, original_beta = alpha, beta
+        best_value, best_move = None, None
+        for move, low, high in self._moves_to_search(board, turn, plies,
+                                                     first, last, scorer):
+            if plies == 1:
+                # The bounds often show that a move cannot be better than the
+                # best so far, without scoring it.
+                if best_value is not None and (high <= best_value if ours
+                                               else low >= best_value):
+                    continue
+                value = low if low == high else \
+                    scorer.score_after(move, colour) - \
+                    (ACTION_PENALTY[move[:2]] if ours else 0)
+            elif plies == 2 and (low >= beta if next_ours else high <= alpha):
+                # The player moving last can pass, so the value after <move>
+                # is at least <low> if that is this player and at most <high>
+                # otherwise, which already ends the search of it.
+                value = low if next_ours else high
+            else:
+                penalty = ACTION_PENALTY[move[:2]] if ours else 0
+                record = move[2].apply(move[:2], colour)
+                value = self._value(board, (turn + 1) % len(self._goals),
+                                    plies - 1, alpha + penalty,
+                                    beta + penalty, move[2]) - penalty
+                record.undo()
+
+            if best_value is None or (value > best_value if ours
+                                      else value < best_value):
+                best_value, best_move = value, move
+            if ours:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                self._state.killers[plies] = (move[0], move[1], move[2].path())
+                break
+
+        if best_value <= original_alpha:
+            bound = _UPPER
+        elif best_value >= original_beta:
+            bound = _LOWER
+        else:
+            bound = _EXACT
+        self._state.store(key, (plies, best_value, bound,
+                                (best_move[0], best_move[1],
+                                 best_move[2].path())))
+        return best_value
+
+    def _moves_to_search(self, board: Block, turn: int, plies: int,
+                         first: Optional[Tuple[str, Optional[int],
+                                               Tuple[int, ...]]],
+                         last: Optional[Block], scorer: MoveScorer) \
+            -> Iterator[Tuple[Tuple[str, Optional[int], Block], float, float]]:
+        """Yield a PASS and the moves, other than smashes, of the player at
+        index <turn> of <_goals> on <board>, in the order to search them
+        <plies> turns ahead, as _ordered_moves does.
+
+        <first>, a move given by the path of its block, and then the last
+        move at the same depth that ended a search early are yielded before
+        the others are bounded, since they often end the search by
+        themselves.
+        """
+        ours = turn == self.id
+        colour = self._goals[turn].colour
+        tried = []
+        for action in (first, self._state.killers.get(plies)):
+            if action is None or action[0] == SMASH[0]:
+                continue
+            block = _find_path(board, action[2])
+            if block is None or not block.can_apply(action[:2], colour) or \
+                    any(move[2] is block and move[:2] == action[:2]
+                        for move in tried):
+                continue
+            move = (action[0], action[1], block)
+            tried.append(move)
+            value = scorer.score_after(move, colour) - \
+                (ACTION_PENALTY[move[:2]] if ours else 0)
+            yield move, value, value
+
+        for move, low, high in self._ordered_moves(board, turn, plies, last,
+                                                   scorer):
+            if not any(other[2] is move[2] and other[:2] == move[:2]
+                       for other in tried):
+                yield move, low, high
+
+    def _ordered_moves(self, board: Block, turn: int, plies: int,
+                       last: Optional[Block], scorer: MoveScorer) \
+            -> List[Tuple[Tuple[str, Optional[int], Block], float, float]]:
+        """Return a PASS and the moves, other than smashes, of the player at
+        index <turn> of <_goals> on <board>, in the order to search them
+        <plies> turns ahead. Each move comes with the lowest and the highest
+        value to this player that <board> can have after it.
+
+        The moves are ordered by their bounds, as found by <scorer> for
+        <board>, so that the moves that look best for the player making them
+        come first: the highest for this player and the lowest for the
+        others. Among moves with the same bounds, those on <last>, the block
+        of the move that was just made, come first, as a move is often best
+        answered where it was made.
+        """
+        ours = turn == self.id
+        colour = self._goals[turn].colour
+        moves = []
+        for move in [('pass', None, board)] + list(board.legal_moves(colour)):
+            if move[0] != SMASH[0]:
+                low, high = scorer.bounds(move, colour)
+                if plies > 1 and low != high:
+                    # Moves that lead to deeper searches are worth ordering
+                    # by their scores.
+                    low = high = scorer.score_after(move, colour)
+                penalty = ACTION_PENALTY[move[:2]] if ours else 0
+                moves.append((move, low - penalty, high - penalty))
+        if ours:
+            moves.sort(key=lambda item: (-item[2], item[0][2] is not last))
+        else:
+            moves.sort(key=lambda item: (item[1], item[2],
+                                         item[0][2] is not last))
+        return moves
+
+
+def _find_path(board: Block, path: Tuple[int, ...]) -> Optional[Block]:
+    """Return the block of <board> at <path>, or None if there is none.
+    """
+    try:
+        return _follow_path(board, path)
+    except IndexError:
+        return None
+
+
+class _SearchState:
+    """What an AlphaBetaPlayer keeps about its searches.
+
+    === Public Attributes ===
+    table:
+        For boards already searched, keyed by their Zobrist hash and the index
+        of the player to move: the number of turns searched, the value found,
+        whether the value is exact or a bound, and the path of the best move.
+        The boards are in the order they were first searched.
+    killers:
+        For each number of turns left to search, the last move that ended a
+        search of that many turns early, given by the path of its block. It
+        is often good on other boards too.
+    searched:
+        The key in <table> of the board last searched from the top, and the
+        number of seconds spent searching it, or None.
+    pondering:
+        The search being run in the background, or None.
+    stop:
+        Set when the current search should stop early, or None.
+    deadline:
+        The time at which the current search must stop, or None.
+    """
+    table: Dict[Tuple[int, int],
+                Tuple[int, float, int, Tuple[str, Optional[int],
+                                             Tuple[int, ...]]]]
+    killers: Dict[int, Tuple[str, Optional[int], Tuple[int, ...]]]
+    searched: Optional[Tuple[Tuple[int, int], float]]
+    pondering: Optional[_Pondering]
+    stop: Optional[threading.Event]
+    deadline: Optional[float]
+
+    def __init__(self) -> None:
+        """Initialize this state, before any search.
+        """
+        self.table = {}
+        self.killers = {}
+        self.searched = None
+        self.pondering = None
+        self.stop = None
+        self.deadline = None
+
+    def out_of_time(self) -> bool:
+        """Return True iff the current search has reached its deadline or has
+        been asked to stop.
+        """
+        return (self.deadline is not None and
+                time.perf_counter() > self.deadline) or \
+            (self.stop is not None and self.stop.is_set())
+
+    def store(self, key: Tuple[int, int],
+              entry: Tuple[int, float, int, Tuple[str, Optional[int],
+                                                  Tuple[int, ...]]]) -> None:
+        """Keep <entry> for the board of <key> in <table>, forgetting the
+        board searched longest ago if <table> would use more memory than
+        SEARCH_TABLE_BYTES.
+        """
+        if key not in self.table and \
+                len(self.table) >= SEARCH_TABLE_BYTES // _TABLE_ENTRY_BYTES:
+            del self.table[next(iter(self.table))]
+        self.table[key] = entry
+
+
+class _SearchTimeout(Exception):
+    """Raised when an AlphaBetaPlayer runs out of time to search, or is asked
+    to stop.
+    """
+
+
+# The kinds of value kept in the table of an AlphaBetaPlayer: an exact value,
+# a value that is at most the true value, and one that is at least the true
+# value.
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+# An estimate of the memory, in bytes, used by each board in the table of an
+# AlphaBetaPlayer.
+_TABLE_ENTRY_BYTES = 400
+
+
 if __name__ == '__main__':
     import python_ta
 
@@ -505,7 +1599,9 @@ if __name__ == '__main__':
         'allowed-io': ['process_event'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
-            'goal', 'pygame', '__future__'
+            'goal', 'grid', 'persistent', 'settings', 'pygame', '__future__',
+            'os', 'concurrent.futures', 'math', 'multiprocessing', 'threading',
+            'time'
         ],
         'max-attributes': 10,
         'generated-members': 'pygame.*'
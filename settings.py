@@ -21,7 +21,7 @@ Misha Schwartz, and Jaisie Sin.
 
 This file contains the global settings for the blocky game.
 """
-from typing import Tuple
+from typing import Tuple, Union
 
 # Colours that we could use in the game
 WHITE = (255, 255, 255)
@@ -36,6 +36,11 @@ TEMPTING_TURQUOISE = (75, 196, 213)
 # A pallette of the colours we use in the game
 COLOUR_LIST = [PACIFIC_POINT, REAL_RED, OLD_OLIVE, DAFFODIL_DELIGHT]
 
+# Every colour that can be stored compactly. A colour is stored as its index
+# into this list, so the colours in COLOUR_LIST keep their COLOUR_LIST index.
+PALETTE = COLOUR_LIST + [WHITE, BLACK, MELON_MAMBO, TEMPTING_TURQUOISE]
+_PALETTE_INDEX = {colour: i for i, colour in enumerate(PALETTE)}
+
 # The game board will be a square with this size.
 BOARD_SIZE = 750
 
@@ -55,16 +60,29 @@ HIGHLIGHT_THICKNESS = 5
 # The number of seconds a move is animated for.
 ANIMATION_DURATION = 1
 
+# The most memory, in bytes, that the cache of goal scores may use.
+SCORE_CACHE_BYTES = 8 * 1024 * 1024
+
+# The most memory, in bytes, that the table of boards searched by an
+# AlphaBetaPlayer may use.
+SEARCH_TABLE_BYTES = 8 * 1024 * 1024
+
 
-def colour_name(colour: Tuple[int, int, int]) -> str:
+def colour_name(colour: Union[Tuple[int, int, int], int]) -> str:
     """Return the colour name associated with this colour value, or the empty
     string if this colour value isn't in our colour list.
 
+    <colour> may also be the index of a colour value in PALETTE.
+
     >>> colour_name((1, 128, 181))
     'Pacific Point'
     >>> colour_name(PACIFIC_POINT)
     'Pacific Point'
+    >>> colour_name(1)
+    'Real Red'
     """
+    if isinstance(colour, int):
+        colour = PALETTE[colour]
     colour_names = {
         PACIFIC_POINT: 'Pacific Point',
         REAL_RED: 'Real Red',
@@ -76,3 +94,16 @@ def colour_name(colour: Tuple[int, int, int]) -> str:
         return colour_names[colour]
     else:
         return ''
+
+
+def colour_index(colour: Tuple[int, int, int]) -> int:
+    """Return the index of this colour value in PALETTE.
+
+    Precondition: colour in PALETTE
+
+    >>> colour_index(PACIFIC_POINT)
+    0
+    >>> PALETTE[colour_index(DAFFODIL_DELIGHT)] == DAFFODIL_DELIGHT
+    True
+    """
+    return _PALETTE_INDEX[colour]